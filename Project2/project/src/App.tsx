@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 import { Message } from './types';
-import { sendQuery } from './utils/api';
+import { streamQuery } from './utils/api';
 import ConversationView from './components/ConversationView';
 import InputArea from './components/InputArea';
 import WebLinksPanel from './components/WebLinksPanel';
@@ -23,29 +23,29 @@ function App() {
     setMessages(prev => [...prev, userMessage]);
     setIsLoading(true);
 
-    try {
-      const response = await sendQuery(messageText);
-      
-      // Handle potential error responses from Flask
-      let advisorContent = '';
-      if (typeof response.advisor_response === 'string') {
-        advisorContent = response.advisor_response;
-      } else if (response.advisor_response && response.advisor_response.error) {
-        advisorContent = `Error: ${response.advisor_response.error}`;
+    const advisorId = (Date.now() + 1).toString();
+    let started = false;
+    // Create the advisor bubble on the first token, then grow it in place
+    const appendToAdvisor = (text: string) => {
+      if (!started) {
+        started = true;
+        setIsLoading(false);
+        setMessages(prev => [...prev, { id: advisorId, type: 'advisor', content: text, timestamp: new Date() }]);
       } else {
-        advisorContent = 'I apologize, but I encountered an error processing your request.';
+        setMessages(prev => prev.map(m => (m.id === advisorId ? { ...m, content: m.content + text } : m)));
       }
-      
-      const advisorMessage: Message = {
-        id: (Date.now() + 1).toString(),
-        type: 'advisor',
-        content: advisorContent,
-        timestamp: new Date(),
-      };
+    };
 
-      setMessages(prev => [...prev, advisorMessage]);
-      setWebLinks(response.web_links || '');
-      
+    try {
+      setWebLinks('');
+      await streamQuery(messageText, {
+        onWebLinks: links => setWebLinks(links || ''),
+        onToken: appendToAdvisor,
+        onError: error => appendToAdvisor(started ? `\n\nError: ${error}` : `Error: ${error}`),
+      });
+      if (!started) {
+        appendToAdvisor('I apologize, but I encountered an error processing your request.');
+      }
     } catch (error) {
       const errorMessage: Message = {
         id: (Date.now() + 1).toString(),
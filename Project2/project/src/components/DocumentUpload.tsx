@@ -1,6 +1,6 @@
-import React, { useState, useRef } from 'react';
+import React, { useState, useRef, useEffect } from 'react';
 import { Upload, FileText, CheckCircle, AlertCircle, X } from 'lucide-react';
-import { uploadDocument } from '../utils/api';
+import { uploadDocument, waitForJob } from '../utils/api';
 
 interface DocumentUploadProps {
   onClose: () => void;
@@ -13,6 +13,10 @@ const DocumentUpload: React.FC<DocumentUploadProps> = ({ onClose, onSuccess }) =
   const [uploadStatus, setUploadStatus] = useState<'idle' | 'success' | 'error'>('idle');
   const [statusMessage, setStatusMessage] = useState('');
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const pollAbortRef = useRef<AbortController | null>(null);
+
+  // Stop polling the ingestion job when the dialog closes
+  useEffect(() => () => pollAbortRef.current?.abort(), []);
 
   const handleFileSelect = (event: React.ChangeEvent<HTMLInputElement>) => {
     const file = event.target.files?.[0];
@@ -39,9 +43,29 @@ const DocumentUpload: React.FC<DocumentUploadProps> = ({ onClose, onSuccess }) =
       const response = await uploadDocument(selectedFile);
       
       if (response.success) {
+        // The upload is queued for ingestion; it is done once the job succeeds
+        if (response.status_url) {
+          setStatusMessage(response.message);
+          pollAbortRef.current = new AbortController();
+          const job = await waitForJob(
+            response.status_url,
+            (progress) => setStatusMessage(
+              `Processing ${progress.filename ?? 'document'}... ${progress.chunks_embedded} chunks embedded`
+            ),
+            pollAbortRef.current.signal
+          );
+          if (job.status === 'failed') {
+            setUploadStatus('error');
+            setStatusMessage(`Processing failed: ${job.error || 'unknown error'}`);
+            return;
+          }
+        }
+        const message = response.status_url
+          ? `Document "${selectedFile.name}" processed and added to your knowledge base.`
+          : response.message;
         setUploadStatus('success');
-        setStatusMessage(response.message);
-        onSuccess(response.message);
+        setStatusMessage(message);
+        onSuccess(message);
         
         // Auto-close after 2 seconds on success
         setTimeout(() => {
@@ -149,15 +173,19 @@ const DocumentUpload: React.FC<DocumentUploadProps> = ({ onClose, onSuccess }) =
           <div className={`mt-4 p-3 rounded-lg flex items-center space-x-2 ${
             uploadStatus === 'success' 
               ? 'bg-green-900 border border-green-700' 
-              : 'bg-red-900 border border-red-700'
+              : uploadStatus === 'error'
+                ? 'bg-red-900 border border-red-700'
+                : 'bg-gray-800 border border-gray-700'
           }`}>
             {uploadStatus === 'success' ? (
               <CheckCircle size={16} className="text-green-400" />
-            ) : (
+            ) : uploadStatus === 'error' ? (
               <AlertCircle size={16} className="text-red-400" />
+            ) : (
+              <div className="w-4 h-4 border-2 border-purple-400 border-t-transparent rounded-full animate-spin" />
             )}
             <p className={`text-sm ${
-              uploadStatus === 'success' ? 'text-green-300' : 'text-red-300'
+              uploadStatus === 'success' ? 'text-green-300' : uploadStatus === 'error' ? 'text-red-300' : 'text-gray-300'
             }`}>
               {statusMessage}
             </p>
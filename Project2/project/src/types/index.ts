@@ -11,6 +11,22 @@ export interface ApiResponse {
   manager_response: any;
 }
 
+export interface RoutingDecision {
+  source: string;
+  confidence: number | null;
+  RAG_needed: string;
+  websearch_needed: string;
+}
+
+export interface StreamHandlers {
+  onRouting?: (routing: RoutingDecision) => void;
+  onManager?: (manager: any) => void;
+  onWebLinks?: (webLinks: string, retrievalStatus: Record<string, string>) => void;
+  onToken: (text: string) => void;
+  onDone?: () => void;
+  onError?: (error: string) => void;
+}
+
 export interface ApiRequest {
   query: string;
 }
@@ -19,4 +35,19 @@ export interface UploadResponse {
   success: boolean;
   message: string;
   chunks_created?: number;
+  job_id?: string;
+  status_url?: string;
+}
+
+export interface JobStatus {
+  job_id: string;
+  filename: string | null;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  files_parsed: number;
+  chunks_embedded: number;
+  stages: Record<string, number>;
+  queued_seconds: number;
+  elapsed_seconds: number;
+  result: Record<string, number> | null;
+  error: string | null;
 }
\ No newline at end of file
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { ApiRequest, ApiResponse, UploadResponse } from '../types';
+import { ApiRequest, ApiResponse, JobStatus, StreamHandlers, UploadResponse } from '../types';
 
 const API_BASE_URL = 'http://127.0.0.1:5000';
 
@@ -21,6 +21,83 @@ export const sendQuery = async (query: string): Promise<ApiResponse> => {
   }
 };
 
+const dispatchStreamEvent = (event: string, data: any, handlers: StreamHandlers) => {
+  switch (event) {
+    case 'routing':
+      handlers.onRouting?.(data);
+      break;
+    case 'manager':
+      handlers.onManager?.(data);
+      break;
+    case 'web_links':
+      handlers.onWebLinks?.(data.web_links || '', data.retrieval_status || {});
+      break;
+    case 'token':
+      handlers.onToken(data.text || '');
+      break;
+    case 'done':
+      handlers.onDone?.();
+      break;
+    case 'error':
+      handlers.onError?.(data.error || 'Unknown error');
+      break;
+  }
+};
+
+export const streamQuery = async (
+  query: string,
+  handlers: StreamHandlers,
+  signal?: AbortSignal
+): Promise<void> => {
+  let response: Response;
+  try {
+    response = await fetch(`${API_BASE_URL}/query/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ query } as ApiRequest),
+      signal,
+    });
+  } catch (error) {
+    console.error('Stream Error:', error);
+    throw new Error('Failed to send query to advisor. Make sure your Flask server is running on 127.0.0.1:5000');
+  }
+  if (!response.ok || !response.body) {
+    throw new Error(`Streaming request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      const dataLines: string[] = [];
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trim());
+        }
+      }
+      if (dataLines.length > 0) {
+        dispatchStreamEvent(event, JSON.parse(dataLines.join('\n')), handlers);
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+};
+
 export const uploadDocument = async (file: File): Promise<UploadResponse> => {
   try {
     const formData = new FormData();
@@ -37,4 +114,35 @@ export const uploadDocument = async (file: File): Promise<UploadResponse> => {
     console.error('Upload Error:', error);
     throw new Error('Failed to upload document. Make sure your Flask server is running.');
   }
+};
+
+export const getJobStatus = async (statusUrl: string): Promise<JobStatus> => {
+  try {
+    const response = await axios.get<JobStatus>(`${API_BASE_URL}${statusUrl}`);
+    return response.data;
+  } catch (error) {
+    console.error('Job Status Error:', error);
+    throw new Error('Failed to fetch ingestion job status.');
+  }
+};
+
+const JOB_POLL_INTERVAL_MS = 1000;
+
+// Polls an ingestion job's status_url until it succeeds or fails
+export const waitForJob = async (
+  statusUrl: string,
+  onProgress?: (job: JobStatus) => void,
+  signal?: AbortSignal
+): Promise<JobStatus> => {
+  for (;;) {
+    const job = await getJobStatus(statusUrl);
+    if (job.status === 'succeeded' || job.status === 'failed') {
+      return job;
+    }
+    onProgress?.(job);
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    if (signal?.aborted) {
+      throw new Error('Stopped waiting for the ingestion job.');
+    }
+  }
 };
\ No newline at end of file
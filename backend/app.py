@@ -1,25 +1,42 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # Before any other import, for the startup profile
+
 from werkzeug.utils import secure_filename
 import shutil
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
 import warnings
 import json
+import sys
+import threading
+import contextvars
 import requests
-from flask import Flask, request, jsonify, send_file
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.prompts import ChatPromptTemplate
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from ingest_jobs import IngestionQueue, JobStore
+from query_router import build_router
+from upstream import UpstreamBusy, UpstreamGate, status_code_of
+import metrics
+from metrics import timer
+from creat_vec_database import load_embeddings, sync_vec_db
+from lexical_index import reciprocal_rank_fusion
+from vector_store import open_vector_store
+from context_assembly import CONTEXT_TOKEN_BUDGET, assemble_context
+from warmup import WarmUp
+from batch import BATCH_MAX_QUERIES, run_batch
+from tenants import TENANT_HEADER, InvalidUserId, TenantRegistry, normalize_user_id
+from static_assets import StaticAssets
 
 # Get absolute path to the directory where this app.py script lives
 basedir = os.path.abspath(os.path.dirname(__file__))
 # Path to frontend's 'dist' folder
 dist_dir = os.path.join(basedir, "../Project2/project/dist")
 
-# Initialize Flask app
-app = Flask(__name__, static_folder=dist_dir, static_url_path='')
+# Initialize Flask app; the frontend build is served by static_assets below
+app = Flask(__name__, static_folder=None)
 CORS(app)
+static_assets = StaticAssets(dist_dir)
 
 # Load environment variables
 load_dotenv()
@@ -28,38 +45,88 @@ load_dotenv()
 warnings.filterwarnings("ignore", category=UserWarning, module="langchain")
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="langchain")
 
-# Configure Gemini API
+# Gemini API key (the client itself is created on first use, see get_model)
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY environment variable is not set.")
-genai.configure(api_key=GOOGLE_API_KEY)
+
+# STARTUP_MODE: "background" (default) accepts traffic at once and warms the
+# Gemini client, embedding model and vector store in a thread; "eager" does
+# that before the import returns; "lazy" leaves everything to first use
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background").lower()
 
 # Paths and embedding function
 CHROMA_PATH = "chroma"
-em_func = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Query and ingestion embeddings share one model handle (the container-wide
+# embedding service or the preloaded model under gunicorn) and the on-disk cache.
+# The model itself is loaded on first use.
+em_func = load_embeddings(lazy=True)
+
+# RETRIEVAL_MODE is "vector", "lexical" or "hybrid" (vector store and BM25 index,
+# fused by reciprocal rank); both are kept per knowledge base by ingestion
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", 6))  # Chunks handed to context assembly
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", 10))  # Per-retriever depth before fusion
+
+# Background ingestion worker pool; job state is kept on disk so every gunicorn worker can report it
+ingestion_queue = IngestionQueue(max_workers=1, store=JobStore())
+
+# Retrieval fan-out: knowledge base and web search run side by side, each with its own deadline
+SERPAPI_URL = os.environ.get("SERPAPI_URL", "https://serpapi.com/search")
+RAG_TIMEOUT = float(os.environ.get("RAG_TIMEOUT", 5))
+WEBSEARCH_TIMEOUT = float(os.environ.get("WEBSEARCH_TIMEOUT", 8))
+retrieval_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="retrieval")
+
+# Upstream gates: identical in-flight calls are merged, concurrency is capped and 429/5xx retried
+gemini_gate = UpstreamGate(
+    "gemini",
+    max_concurrency=int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8)),
+    max_queue=int(os.environ.get("GEMINI_MAX_QUEUE", 64))
+)
+serpapi_gate = UpstreamGate(
+    "serpapi",
+    max_concurrency=int(os.environ.get("SERPAPI_MAX_CONCURRENCY", 4)),
+    max_queue=int(os.environ.get("SERPAPI_MAX_QUEUE", 32))
+)
+# Reported by /stats and /metrics; the ASGI server (asgi.py) adds its own gates
+upstream_gates = [gemini_gate, serpapi_gate]
 
-# Load Chroma database
-try:
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=em_func)
-except Exception as e:
-    print(f"ChromaDB not found at startup: {e}")
-    db = None
+class WebSearchError(Exception):
+    """SerpAPI could not be searched; the message never includes the request URL (it holds the API key)."""
 
-def perform_web_search(query, api_key, num_results=3):
+def web_search_error(error):
+    """WebSearchError for a failed SerpAPI call, naming only the error type and HTTP status."""
+    code = status_code_of(error)
+    return WebSearchError(f"SerpAPI request failed: {type(error).__name__}" + (f" (HTTP {code})" if code else ""))
+
+def fetch_web_results(query, api_key, num_results, timeout):
+    params = {
+        "engine": "google",
+        "q": query,
+        "api_key": api_key,
+        "num": num_results
+    }
+    res = requests.get(SERPAPI_URL, params=params, timeout=timeout)
+    res.raise_for_status()
+    return res.json().get("organic_results", [])
+
+def perform_web_search(query, api_key, num_results=3, timeout=WEBSEARCH_TIMEOUT):
+    """Web search results as markdown links; raises on failure so the branch is reported as an error."""
     try:
-        params = {
-            "engine": "google",
-            "q": query,
-            "api_key": api_key,
-            "num": num_results
-        }
-        res = requests.get("https://serpapi.com/search", params=params)
-        results = res.json().get("organic_results", [])
-        if not results:
-            return "No search results found."
-        return "\n".join([f"- [{r['title']}]({r['link']})" for r in results])
+        results = serpapi_gate.call(
+            fetch_web_results, query, api_key, num_results, timeout,
+            key=(query, num_results)
+        )
+    except UpstreamBusy:
+        raise
     except Exception as e:
-        return f"Error during web search: {str(e)}"
+        raise web_search_error(e) from None
+    return format_web_results(results)
+
+def format_web_results(results):
+    if not results:
+        return "No search results found."
+    return "\n".join([f"- [{r['title']}]({r['link']})" for r in results])
 
 # Manager LLM prompt template
 MANAGER_PROMPT_TEMPLATE = """
@@ -111,8 +178,27 @@ You are an Advisor LLM for a Personal Finance Advisor. Your task is to take a JS
 - Output: Hello! I'm here to help with your financial questions. **Suggestion**: Ask about budgeting, savings, or investments to get personalized advice!
 """
 
-# Initialize Gemini model
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Gemini model, created by get_model on first use; benchmarks assign their own
+model = None
+model_lock = threading.Lock()
+
+def get_model():
+    global model
+    if model is None:
+        with model_lock:
+            if model is None:
+                import google.generativeai as genai  # Over a second to import, so kept off the startup path
+                genai.configure(api_key=GOOGLE_API_KEY)
+                if model is None:  # Unless one was assigned while importing
+                    model = genai.GenerativeModel('gemini-1.5-flash')
+    return model
+
+def chat_prompt(template):
+    from langchain.prompts import ChatPromptTemplate  # Also about a second to import
+    return ChatPromptTemplate.from_template(template)
+
+# Local router that answers the Manager LLM's routing question when it is confident
+query_router = build_router(em_func)
 
 # Configure upload settings
 UPLOAD_FOLDER = './Doc'
@@ -120,29 +206,123 @@ ALLOWED_EXTENSIONS = {'docx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Knowledge bases: the shared one (UPLOAD_FOLDER, CHROMA_PATH) and one per user
+# ID, each with its vector store (Chroma or memory-mapped NumPy, see
+# VECTOR_STORE), BM25 index and query cache; stores open on first use
+tenants = TenantRegistry(em_func, UPLOAD_FOLDER, CHROMA_PATH)
+
+def request_user_id(data=None):
+    """User ID of the request (X-User-Id header, else a user_id field); None for the shared base."""
+    value = request.headers.get(TENANT_HEADER)
+    if not value and isinstance(data, dict):
+        value = data.get('user_id')
+    return normalize_user_id(value or request.values.get('user_id'))
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Custom static file route to set correct MIME types
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.start_request_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    # Debug: ?timings=1 adds the per-stage breakdown to JSON responses
+    if request.args.get('timings') == '1' and response.is_json:
+        payload = response.get_json()
+        if isinstance(payload, dict):
+            payload['timings'] = metrics.request_timings()
+            response.set_data(json.dumps(payload))
+    return response
+
+def collect_component_metrics():
+    """Gauges and counters kept by the caches and upstream gates."""
+    families = []
+    gates = {gate.name: gate.stats() for gate in upstream_gates}
+    for field, kind, documentation in [
+        ('in_flight', 'gauge', 'Upstream calls in flight.'),
+        ('queue_depth', 'gauge', 'Calls waiting for an upstream slot.'),
+        ('wait_seconds_avg', 'gauge', 'Average wait for an upstream slot.'),
+        ('wait_seconds_max', 'gauge', 'Longest wait for an upstream slot.'),
+        ('calls', 'counter', 'Upstream calls made.'),
+        ('coalesced', 'counter', 'Calls served by an identical in-flight call.'),
+        ('retries', 'counter', 'Upstream retries after 429/5xx.'),
+        ('rejected', 'counter', 'Calls rejected by backpressure.'),
+        ('failures', 'counter', 'Upstream calls that failed after retries.'),
+    ]:
+        name = f'advisor_upstream_{field}' + ('_total' if kind == 'counter' else '')
+        families.append((name, kind, documentation,
+                         [({'backend': backend}, stats[field]) for backend, stats in gates.items()]))
+    embedding = em_func.cache.stats()
+    families.append(('advisor_embedding_cache_lookups_total', 'counter', 'Embedding cache lookups by result.',
+                     [({'result': 'hit'}, embedding['hits']), ({'result': 'miss'}, embedding['misses'])]))
+    families.append(('advisor_embedding_cache_entries', 'gauge', 'Vectors held in the embedding cache.',
+                     [({}, embedding['entries'])]))
+    families.append(('advisor_query_cache_entries', 'gauge', 'Entries held in the query caches of open knowledge bases.',
+                     [({}, tenants.query_cache_stats()['entries'])]))
+    registry = tenants.stats()
+    families.append(('advisor_tenants_open', 'gauge', 'Per-user knowledge bases held open.',
+                     [({}, registry['open'])]))
+    families.append(('advisor_tenants_bytes', 'gauge', 'Estimated size of the open per-user knowledge bases.',
+                     [({}, registry['bytes'])]))
+    families.append(('advisor_tenant_evictions_total', 'counter', 'Per-user knowledge bases closed by the LRU.',
+                     [({}, registry['evictions'])]))
+    return families
+
+metrics.REGISTRY.register_collector(collect_component_metrics)
+
+# Prometheus scrape endpoint
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Bundled frontend assets, from memory with compression, ETags and cache headers
 @app.route('/assets/<path:filename>')
 def serve_static(filename):
-    file_path = os.path.join(dist_dir, 'assets', filename)
-    if not os.path.exists(file_path):
+    response = static_assets.response(request, f'assets/{filename}')
+    if response is None:
         return jsonify({'error': 'File not found'}), 404
-    # Set MIME type based on file extension
-    if filename.endswith('.js'):
-        return send_file(file_path, mimetype='application/javascript')
-    elif filename.endswith('.css'):
-        return send_file(file_path, mimetype='text/css')
-    elif filename.endswith('.html'):
-        return send_file(file_path, mimetype='text/html')
-    else:
-        return send_file(file_path)
+    return response
+
+def get_db():
+    """Return the shared knowledge base's vector store, opening it on first use."""
+    return tenants.default.get_db()
+
+def ingest_documents(job, user_id=None):
+    """Ingestion job: sync a knowledge base's upload folder into its vector store.
+
+    sync_vec_db holds the store's ingestion lock, so jobs from several workers
+    take turns. Queries keep getting the previous generation from the same
+    handle until the sync publishes the new one.
+    """
+    with tenants.use(user_id) as kb:
+        db = kb.get_db()
+        if db is None:
+            db = open_vector_store(kb.chroma_path, em_func)  # Raises if it still cannot be opened
+        stats = sync_vec_db(db, kb.upload_folder, kb.chroma_path, progress=job)
+        kb.set_db(db)
+    return stats
+
+def queue_ingestion(filename, user_id=None):
+    """Queue a sync for a saved upload; returns the 202 response body."""
+    job = ingestion_queue.submit(lambda job: ingest_documents(job, user_id), filename=filename, owner=user_id)
+    return {
+        'success': True,
+        'message': f'Document "{filename}" uploaded and queued for processing.',
+        'job_id': job.id,
+        'status_url': f'/jobs/{job.id}'
+    }
 
 # API Route for uploading documents
 @app.route('/upload', methods=['POST'])
 def upload_document():
     try:
+        user_id = request_user_id()
+        upload_folder = tenants.paths(user_id)[0]
         if 'document' not in request.files:
             return jsonify({'success': False, 'message': 'No file provided'})
         file = request.files['document']
@@ -150,94 +330,508 @@ def upload_document():
             return jsonify({'success': False, 'message': 'No file selected'})
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            os.makedirs(upload_folder, exist_ok=True)
+            file_path = os.path.join(upload_folder, filename)
             file.save(file_path)
-            try:
-                from creat_vec_database import main as create_vector_db
-                create_vector_db()
-                global db
-                db = Chroma(persist_directory=CHROMA_PATH, embedding_function=em_func)
-                return jsonify({
-                    'success': True,
-                    'message': f'Document "{filename}" uploaded and processed successfully!'
-                })
-            except Exception as e:
-                return jsonify({
-                    'success': False,
-                    'message': f'Document uploaded but failed to process: {str(e)}'
-                })
+            return jsonify(queue_ingestion(filename, user_id)), 202
         return jsonify({'success': False, 'message': 'Invalid file type. Please upload a .docx file'})
+    except InvalidUserId:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Upload failed: {str(e)}'})
 
+# API Route for checking ingestion job progress
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = ingestion_queue.get(job_id)
+    # Jobs are only visible to the user they ingest for
+    if job is None or job.owner != request_user_id():
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+def search_documents(kb, query_text, k=RETRIEVAL_K, mode=None):
+    """Top-k (Document, score) pairs for a query from a knowledge base's vector store, BM25 index or both.
+
+    Higher scores are better; scores are only comparable within one mode.
+    """
+    mode = mode or RETRIEVAL_MODE
+    db = kb.get_db()
+    lexical = kb.lexical_index.get() if mode in ("lexical", "hybrid") else None
+    if mode == "hybrid" and not len(lexical):
+        mode = "vector"  # No lexical index yet (e.g. database built before it existed)
+    if mode == "lexical":
+        with timer("lexical_search"):
+            return lexical.search(query_text, k=k)
+    if mode == "vector":
+        with timer("vector_search"):
+            return db.similarity_search_with_relevance_scores(query_text, k=k)
+    with timer("vector_search"):
+        dense = db.similarity_search(query_text, k=RETRIEVAL_CANDIDATES)
+    with timer("lexical_search"):
+        sparse = [doc for doc, _ in lexical.search(query_text, k=RETRIEVAL_CANDIDATES)]
+    return reciprocal_rank_fusion([dense, sparse], k=k)
+
+def search_documents_batch(kb, queries, vectors, k=RETRIEVAL_K, mode=None):
+    """search_documents for many queries whose vectors are already computed.
+
+    The vector side is one grouped search over all the vectors; BM25 and
+    fusion then run per query. Returns one result list per query.
+    """
+    mode = mode or RETRIEVAL_MODE
+    db = kb.get_db()
+    lexical = kb.lexical_index.get() if mode in ("lexical", "hybrid") else None
+    if mode == "hybrid" and not len(lexical):
+        mode = "vector"
+    if mode == "lexical":
+        with timer("lexical_search"):
+            return [lexical.search(query_text, k=k) for query_text in queries]
+    with timer("vector_search"):
+        dense = db.similarity_search_by_vectors_with_relevance_scores(
+            vectors, k=k if mode == "vector" else RETRIEVAL_CANDIDATES
+        )
+    if mode == "vector":
+        return dense
+    with timer("lexical_search"):
+        sparse = [[doc for doc, _ in lexical.search(query_text, k=RETRIEVAL_CANDIDATES)] for query_text in queries]
+    return [reciprocal_rank_fusion([[doc for doc, _ in hits], docs], k=k) for hits, docs in zip(dense, sparse)]
+
+def retrieve_documents(kb, query_text, results=None):
+    """RAG branch: the knowledge-base context for a query, packed into the token budget.
+
+    results are the query's search_documents results when already known (batch runs).
+    """
+    if results is None:
+        with timer("rag_search"):
+            results = search_documents(kb, query_text)
+    with timer("context_assembly"):
+        context, stats = assemble_context(results, CONTEXT_TOKEN_BUDGET)
+    metrics.CONTEXT_TOKENS.observe(stats["tokens"])
+    return context
+
+def timed_web_search(query, api_key):
+    with timer("web_search"):
+        return perform_web_search(query, api_key)
+
+class Retrieval:
+    """The retrieval branches the manager asked for, running concurrently.
+
+    Branches start on construction. settle() yields each branch name as it
+    finishes, fails or misses its deadline, so a caller can report it right
+    away; merge() then fills manager_json["context"]. A branch that fails or
+    times out is reported in the status and left out of the context.
+    search_results, if given, are used instead of searching the knowledge base.
+    """
+
+    def __init__(self, kb, manager_json, query_text, search_results=None):
+        self.manager_json = manager_json
+        self.serpapi_key = os.environ.get("SERPAPI_API_KEY")
+        self.results, self.status = {}, {"rag": "skipped", "websearch": "skipped"}
+        self.branches = {}
+        start = time.monotonic()
+        if manager_json.get("RAG_needed") == "yes":
+            # Branches run in the request's context so their timings land in this request
+            self.branches["rag"] = (
+                retrieval_pool.submit(contextvars.copy_context().run, retrieve_documents, kb, query_text, search_results),
+                start + RAG_TIMEOUT
+            )
+        if manager_json.get("websearch_needed") == "yes" and self.serpapi_key:
+            self.branches["websearch"] = (
+                retrieval_pool.submit(contextvars.copy_context().run, timed_web_search, manager_json["prompt"], self.serpapi_key),
+                start + WEBSEARCH_TIMEOUT
+            )
+        for name in self.branches:
+            self.status[name] = "pending"
+
+    def settle(self):
+        pending = dict(self.branches)
+        with timer("retrieval"):
+            while pending:
+                wait([future for future, _ in pending.values()], return_when=FIRST_COMPLETED,
+                     timeout=max(0.0, min(deadline for _, deadline in pending.values()) - time.monotonic()))
+                for name, (future, deadline) in list(pending.items()):
+                    if future.done():
+                        try:
+                            self.results[name] = future.result()
+                            self.status[name] = "ok"
+                        except Exception as e:
+                            print(f"Retrieval branch {name} failed: {e}")
+                            metrics.ERRORS.inc(stage=name)
+                            self.status[name] = "error"
+                    elif deadline <= time.monotonic():
+                        metrics.ERRORS.inc(stage=f"{name}_timeout")
+                        self.status[name] = "timeout"
+                    else:
+                        continue
+                    del pending[name]
+                    yield name
+
+    def merge(self):
+        """Returns (web_links, retrieval_status)."""
+        return merge_context(self.manager_json, self.results, self.status, self.serpapi_key), self.status
+
+def gather_context(kb, manager_json, query_text, search_results=None):
+    """Run the retrieval branches the manager asked for concurrently.
+
+    Fills manager_json["context"] and returns (web_links, retrieval_status).
+    """
+    retrieval = Retrieval(kb, manager_json, query_text, search_results)
+    for _ in retrieval.settle():
+        pass
+    return retrieval.merge()
+
+def merge_context(manager_json, results, status, serpapi_key):
+    """Fill manager_json["context"] from the branch results; returns the web links markdown."""
+    search_links_md = ""
+    if "rag" in results:
+        manager_json["context"] = results["rag"]
+    elif status["rag"] != "skipped":
+        manager_json["context"] = "**Knowledge Base**: unavailable for this request."
+    if manager_json.get("websearch_needed") == "yes":
+        if not serpapi_key:
+            manager_json["context"] += "\n\n---\n\n**Web Search Results**: SERPAPI_API_KEY not set."
+        elif "websearch" in results:
+            search_links_md = results["websearch"]
+            manager_json["context"] += "\n\n---\n\n**Web Search Results**:\n" + search_links_md
+        else:
+            manager_json["context"] += "\n\n---\n\n**Web Search Results**: unavailable for this request."
+    return search_links_md
+
+def generate(prompt):
+    """Non-streaming Gemini call; identical concurrent prompts share one upstream request."""
+    return gemini_gate.call(get_model().generate_content, prompt, key=prompt)
+
+def generate_timed(stage, prompt):
+    """generate() under a stage timer, counting failures against that stage."""
+    try:
+        with timer(stage):
+            return generate(prompt)
+    except Exception:
+        metrics.ERRORS.inc(stage=stage)
+        raise
+
+def clean_llm_json(text):
+    """Strip markdown code fences from an LLM reply that should be JSON."""
+    cleaned_text = text.strip()
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text[7:].strip()
+    elif cleaned_text.startswith("```"):
+        cleaned_text = cleaned_text[3:].strip()
+    if cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[:-3].strip()
+    return cleaned_text
+
+def route_query(query_text):
+    """Decide which retrieval branches a query needs.
+
+    Returns (manager_json, routing). The local router answers when it is
+    confident; otherwise the Manager LLM is asked. Raises json.JSONDecodeError
+    (raw reply in .doc) if the Manager LLM does not return valid JSON.
+    """
+    with timer("route_local"):
+        decision = query_router.route(query_text)
+    if decision is not None:
+        return decision.to_manager_json(query_text), decision.to_dict()
+    manager_response = generate_timed("manager_llm", build_manager_prompt(query_text))
+    return parse_manager_reply(manager_response.text)
+
+def build_manager_prompt(query_text):
+    manager_prompt_template = chat_prompt(MANAGER_PROMPT_TEMPLATE)
+    return manager_prompt_template.format_messages(query=query_text)[0].content
+
+def parse_manager_reply(text):
+    """(manager_json, routing) from the Manager LLM's reply; raises json.JSONDecodeError."""
+    try:
+        manager_json = json.loads(clean_llm_json(text))
+    except json.JSONDecodeError:
+        metrics.JSON_DECODE_FAILURES.inc()
+        raise
+    routing = {
+        "source": "manager_llm",
+        "confidence": None,
+        "RAG_needed": manager_json.get("RAG_needed"),
+        "websearch_needed": manager_json.get("websearch_needed")
+    }
+    return manager_json, routing
+
+def lookup_cache(kb, query_text, generation):
+    with timer("cache_lookup"):
+        cached, cache_tier = kb.query_cache.lookup(query_text, generation)
+    metrics.CACHE_REQUESTS.inc(result=cache_tier or "miss")
+    return cached, cache_tier
+
+def reuse_cached_retrieval(cached, query_text):
+    """Routing and context of a near-duplicate cached query, re-targeted at this query."""
+    manager_json = cached.manager_json
+    manager_json["prompt"] = query_text
+    return manager_json, cached.routing, cached.web_links, cached.retrieval_status
+
+RETRIEVAL_BRANCHES = {"rag": "RAG_needed", "websearch": "websearch_needed"}
+
+def is_cacheable(manager_json, retrieval_status):
+    """Whether every retrieval branch the manager asked for returned results.
+
+    An answer built around a failed, timed-out or unconfigured branch (e.g.
+    web search without SERPAPI_API_KEY) is never cached, so the next identical
+    query tries the branch again instead of replaying the degraded answer.
+    """
+    return all(
+        retrieval_status.get(branch) == "ok"
+        for branch, flag in RETRIEVAL_BRANCHES.items() if manager_json.get(flag) == "yes"
+    )
+
+def with_cache_headers(response, cache_tier):
+    response.headers['X-Cache'] = 'HIT' if cache_tier else 'MISS'
+    if cache_tier:
+        response.headers['X-Cache-Tier'] = cache_tier
+    return response
+
+def build_advisor_prompt(manager_json):
+    """Advisor LLM prompt for a manager JSON whose context has been filled in."""
+    advisor_prompt_template = chat_prompt(ADVISOR_PROMPT_TEMPLATE)
+    advisor_prompt = advisor_prompt_template.format_messages(manager_json=json.dumps(manager_json))
+    return advisor_prompt[0].content
+
+def query_payload(manager_json, advisor_response, web_links, retrieval_status, routing):
+    """Response body of /query."""
+    return {
+        'manager_response': manager_json,
+        'advisor_response': advisor_response,
+        'web_links': web_links,
+        'retrieval_status': retrieval_status,
+        'routing': routing
+    }
+
+def cached_payload(cached):
+    return query_payload(cached.manager_json, cached.advisor_response, cached.web_links,
+                         cached.retrieval_status, cached.routing)
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # API Route for processing queries
 @app.route('/query', methods=['POST'])
 def process_query():
-    global db
-    if db is None:
-        return jsonify({'advisor_response': 'The knowledge base is not yet initialized. Please upload a document first.'})
     data = request.get_json()
+    # The knowledge base stays open (not evicted) until the response is built
+    with tenants.use(request_user_id(data)) as kb:
+        return answer_query(kb, data)
+
+def answer_query(kb, data):
+    if kb.get_db() is None:
+        return jsonify({'advisor_response': 'The knowledge base is not yet initialized. Please upload a document first.'})
     query_text = data.get('query', '')
-    search_links_md = ""
     if query_text.lower() in ['exit', 'quit', 'bye']:
         return jsonify({'response': 'Goodbye!'})
-    manager_prompt_template = ChatPromptTemplate.from_template(MANAGER_PROMPT_TEMPLATE)
-    manager_prompt = manager_prompt_template.format_messages(query=query_text)
-    try:
-        manager_response = model.generate_content(manager_prompt[0].content)
-        cleaned_text = manager_response.text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:].strip()
-        elif cleaned_text.startswith("```"):
-            cleaned_text = cleaned_text[3:].strip()
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3].strip()
+    generation = kb.generation()
+    cached, cache_tier = lookup_cache(kb, query_text, generation)
+    if cache_tier == "exact":
+        return with_cache_headers(jsonify(cached_payload(cached)), cache_tier)
+    if cached is not None:
+        manager_json, routing, search_links_md, retrieval_status = reuse_cached_retrieval(cached, query_text)
+    else:
         try:
-            manager_json = json.loads(cleaned_text)
-            if manager_json.get("RAG_needed") == "yes":
-                result = db.similarity_search(query_text, k=3)
-                manager_json["context"] = "\n\n---\n\n".join([doc.page_content for doc in result])
-            if manager_json.get("websearch_needed") == "yes":
-                serpapi_key = os.environ.get("SERPAPI_API_KEY")
-                if not serpapi_key:
-                    manager_json["context"] += "\n\n---\n\n**Web Search Results**: SERPAPI_API_KEY not set."
-                else:
-                    search_links_md = perform_web_search(manager_json["prompt"], serpapi_key)
-                    manager_json["context"] += "\n\n---\n\n**Web Search Results**:\n" + search_links_md
-            advisor_prompt_template = ChatPromptTemplate.from_template(ADVISOR_PROMPT_TEMPLATE)
-            advisor_prompt = advisor_prompt_template.format_messages(manager_json=json.dumps(manager_json))
-            try:
-                advisor_response = model.generate_content(advisor_prompt[0].content)
-                return jsonify({
-                    'manager_response': manager_json,
-                    'advisor_response': advisor_response.text,
-                    'web_links': search_links_md
-                })
-            except Exception as e:
-                return jsonify({
-                    'manager_response': manager_json,
-                    'advisor_response': {'error': f"Error generating response with Advisor LLM: {str(e)}"},
-                    'web_links': search_links_md
-                })
-        except json.JSONDecodeError:
+            manager_json, routing = route_query(query_text)
+        except UpstreamBusy:
+            raise
+        except json.JSONDecodeError as e:
+            return jsonify({
+                'manager_response': {'error': 'Invalid JSON from Manager LLM', 'raw': e.doc},
+                'advisor_response': None,
+                'web_links': ""
+            })
+        except Exception as e:
             return jsonify({
-                'manager_response': {'error': 'Invalid JSON from Manager LLM', 'raw': cleaned_text},
+                'manager_response': {'error': f"Error generating response with Manager LLM: {str(e)}"},
                 'advisor_response': None,
                 'web_links': ""
             })
+        manager_json.setdefault("context", "")
+        search_links_md, retrieval_status = gather_context(kb, manager_json, query_text)
+    try:
+        advisor_response = generate_timed("advisor_llm", build_advisor_prompt(manager_json))
+        if is_cacheable(manager_json, retrieval_status):
+            kb.query_cache.store(query_text, manager_json, routing, search_links_md, retrieval_status,
+                                 advisor_response.text, generation)
+        return with_cache_headers(jsonify(query_payload(
+            manager_json, advisor_response.text, search_links_md, retrieval_status, routing
+        )), cache_tier)
+    except UpstreamBusy:
+        raise
     except Exception as e:
-        return jsonify({
-            'manager_response': {'error': f"Error generating response with Manager LLM: {str(e)}"},
-            'advisor_response': None,
-            'web_links': ""
-        })
+        return jsonify(query_payload(
+            manager_json, {'error': f"Error generating response with Advisor LLM: {str(e)}"},
+            search_links_md, retrieval_status, routing
+        ))
+
+# API Route for bulk queries: one NDJSON line per query, in completion order (see batch.py)
+@app.route('/query/batch', methods=['POST'])
+def batch_query():
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return jsonify({'error': '"queries" must be a list of strings'}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({'error': f'At most {BATCH_MAX_QUERIES} queries per batch'}), 413
+    concurrency = data.get('concurrency')
+    if concurrency is not None and not isinstance(concurrency, int):
+        return jsonify({'error': '"concurrency" must be an integer'}), 400
+    user_id = request_user_id(data)
+
+    def lines():
+        for result in run_batch(queries, concurrency, advisor=sys.modules[__name__], user_id=user_id):
+            yield json.dumps(result) + "\n"
+
+    return Response(
+        stream_with_context(lines()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.errorhandler(InvalidUserId)
+def invalid_user_id(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(UpstreamBusy)
+def upstream_busy(e):
+    response = jsonify({'error': f'The advisor is busy, please retry shortly ({e}).'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+# API Route for upstream and cache statistics
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'upstream': {gate.name: gate.stats() for gate in upstream_gates},
+        'query_cache': tenants.query_cache_stats(),
+        'embedding_cache': em_func.cache.stats(),
+        'tenants': tenants.stats(),
+        'static_assets': static_assets.stats()
+    })
 
-# Serve index.html for all non-API routes
+# API Route for streaming the advisor response as Server-Sent Events
+@app.route('/query/stream', methods=['GET', 'POST'])
+def stream_query():
+    data = request.get_json(silent=True) if request.method == 'POST' else None
+    query_text = (data or {}).get('query', '') if request.method == 'POST' else request.args.get('query', '')
+    # Held until the stream closes, so the knowledge base is not evicted mid-answer
+    kb = tenants.acquire(request_user_id(data))
+    try:
+        db = kb.get_db()
+        generation = kb.generation()
+        cached, cache_tier = lookup_cache(kb, query_text, generation)
+    except Exception:
+        tenants.release(kb)
+        raise
+
+    def events():
+        # Events: routing -> manager -> web_links -> token* -> done, or error at any point.
+        # "manager" carries the routing decision before retrieval; "web_links" goes out as
+        # soon as web search settles, or once retrieval is done when no search ran
+        if db is None:
+            yield sse_event('error', {'error': 'The knowledge base is not yet initialized. Please upload a document first.'})
+            return
+        if query_text.lower() in ['exit', 'quit', 'bye']:
+            yield sse_event('token', {'text': 'Goodbye!'})
+            yield sse_event('done', {})
+            return
+        if cached is not None:
+            manager_json, routing, search_links_md, retrieval_status = reuse_cached_retrieval(cached, query_text)
+        else:
+            try:
+                manager_json, routing = route_query(query_text)
+            except json.JSONDecodeError as e:
+                yield sse_event('error', {'error': 'Invalid JSON from Manager LLM', 'raw': e.doc})
+                return
+            except Exception as e:
+                yield sse_event('error', {'error': f"Error generating response with Manager LLM: {str(e)}"})
+                return
+        yield sse_event('routing', routing)
+        if cached is None:
+            manager_json.setdefault("context", "")
+            yield sse_event('manager', manager_json)
+            retrieval = Retrieval(kb, manager_json, query_text)
+            for branch in retrieval.settle():
+                if branch == "websearch":
+                    yield sse_event('web_links', {'web_links': retrieval.results.get("websearch", ""),
+                                                  'retrieval_status': dict(retrieval.status)})
+            search_links_md, retrieval_status = retrieval.merge()
+            if "websearch" not in retrieval.branches:
+                yield sse_event('web_links', {'web_links': search_links_md, 'retrieval_status': retrieval_status})
+        else:
+            yield sse_event('manager', manager_json)
+            yield sse_event('web_links', {'web_links': search_links_md, 'retrieval_status': retrieval_status})
+        if cache_tier == "exact":
+            yield sse_event('token', {'text': cached.advisor_response})
+            yield sse_event('done', {})
+            return
+        parts = []
+        try:
+            # Streams hold a Gemini slot until the last token
+            with timer("advisor_llm_stream"), gemini_gate.slot():
+                stream = gemini_gate.retrying(get_model().generate_content, build_advisor_prompt(manager_json), stream=True)
+                for chunk in stream:
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield sse_event('token', {'text': chunk.text})
+        except Exception as e:
+            metrics.ERRORS.inc(stage="advisor_llm_stream")
+            yield sse_event('error', {'error': f"Error generating response with Advisor LLM: {str(e)}"})
+            return
+        if is_cacheable(manager_json, retrieval_status):
+            kb.query_cache.store(query_text, manager_json, routing, search_links_md, retrieval_status,
+                                 "".join(parts), generation)
+        yield sse_event('done', {})
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(lambda: tenants.release(kb))
+    return with_cache_headers(response, cache_tier)
+
+# Startup warm-up: the same initializers requests would otherwise run on first use
+warmup = WarmUp()
+warmup.add('gemini', get_model)
+warmup.add('prompts', lambda: chat_prompt('{query}'))
+warmup.add('embeddings', lambda: em_func.base.embed_query('warm up'))
+warmup.add('router', query_router.warm_up)
+warmup.add('vector_store', get_db, required=False)  # Missing until the first upload
+warmup.add('lexical_index', tenants.default.lexical_index.get, required=False)
+warmup.add('static_assets', static_assets.load, required=False)
+
+# Liveness: the process answers
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok'})
+
+# Readiness: warm-up finished and every required component loaded
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    state = warmup.to_dict()
+    if STARTUP_MODE == 'lazy':
+        state['ready'] = True  # Nothing is warmed ahead of time; requests load what they need
+    state['mode'] = STARTUP_MODE
+    state['import_seconds'] = IMPORT_SECONDS
+    return jsonify(state), 200 if state['ready'] else 503
+
+# Files at the top of dist (favicon etc.) as themselves, index.html for all other non-API routes
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def catch_all(path):
-    return send_file(os.path.join(dist_dir, 'index.html'), mimetype='text/html')
+    response = (path and static_assets.response(request, path)) or static_assets.response(request, 'index.html')
+    if response is None:
+        return jsonify({'error': 'Frontend build not found'}), 404
+    return response
+
+IMPORT_SECONDS = round(time.perf_counter() - STARTUP_STARTED, 3)
+print(f"app imported in {IMPORT_SECONDS}s (startup mode: {STARTUP_MODE})")
+if STARTUP_MODE == 'eager':
+    warmup.run()
+elif STARTUP_MODE == 'background':
+    warmup.start()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
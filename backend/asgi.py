@@ -0,0 +1,318 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import shutil
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from werkzeug.utils import secure_filename
+import app as advisor
+import metrics
+from metrics import timer
+from tenants import TENANT_HEADER, InvalidUserId, normalize_user_id
+from upstream import AsyncUpstreamGate, UpstreamBusy
+
+# Asyncio serving mode: /query and /upload as coroutines, everything else
+# (static files, /query/stream, /jobs, /metrics, health checks) served by the
+# Flask app underneath. Same JSON contract as app.py.
+#
+#   uvicorn asgi:app --port 7860          or   SERVER_MODE=asgi with gunicorn.conf.py
+#
+# Gemini and SerpAPI are awaited (genai's async client, a pooled httpx client),
+# so a slow upstream costs a coroutine rather than a worker thread. Embedding,
+# vector search and context assembly are CPU-bound and run in cpu_pool; the
+# cache, router, vector store and ingestion queue are the ones in app.py.
+
+ASGI_CPU_WORKERS = int(os.environ.get("ASGI_CPU_WORKERS", 4))
+cpu_pool = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix="asgi-cpu")
+
+# The Flask routes underneath (/query/stream, /query/batch) keep using the Flask
+# gates; these share their slots, so GEMINI_MAX_CONCURRENCY and
+# SERPAPI_MAX_CONCURRENCY bound both together. Queue bounds stay per gate.
+gemini_gate = AsyncUpstreamGate(
+    "gemini-async",
+    max_concurrency=advisor.gemini_gate.max_concurrency,
+    max_queue=int(os.environ.get("GEMINI_MAX_QUEUE", 64)),
+    slots=advisor.gemini_gate.slots
+)
+serpapi_gate = AsyncUpstreamGate(
+    "serpapi-async",
+    max_concurrency=advisor.serpapi_gate.max_concurrency,
+    max_queue=int(os.environ.get("SERPAPI_MAX_QUEUE", 32)),
+    slots=advisor.serpapi_gate.slots
+)
+advisor.upstream_gates.extend([gemini_gate, serpapi_gate])
+
+# Pooled SerpAPI client, opened and closed with the server (see lifespan)
+http_client = None
+
+async def run_cpu(fn, *args):
+    """Run a blocking call in cpu_pool, in the request's context so its timings are kept."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_pool, functools.partial(contextvars.copy_context().run, fn, *args))
+
+async def fetch_web_results(query, api_key, num_results, timeout):
+    params = {
+        "engine": "google",
+        "q": query,
+        "api_key": api_key,
+        "num": num_results
+    }
+    res = await http_client.get(advisor.SERPAPI_URL, params=params, timeout=timeout)
+    res.raise_for_status()
+    return res.json().get("organic_results", [])
+
+async def perform_web_search(query, api_key, num_results=3, timeout=advisor.WEBSEARCH_TIMEOUT):
+    try:
+        results = await serpapi_gate.call(
+            fetch_web_results, query, api_key, num_results, timeout,
+            key=(query, num_results)
+        )
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        raise advisor.web_search_error(e) from None
+    return advisor.format_web_results(results)
+
+async def timed_web_search(query, api_key):
+    with timer("web_search"):
+        return await perform_web_search(query, api_key)
+
+async def gather_context(kb, manager_json, query_text):
+    """Async app.gather_context: both branches are awaited together, each under its own deadline."""
+    branches = {}
+    if manager_json.get("RAG_needed") == "yes":
+        branches["rag"] = (run_cpu(advisor.retrieve_documents, kb, query_text), advisor.RAG_TIMEOUT)
+    serpapi_key = os.environ.get("SERPAPI_API_KEY")
+    if manager_json.get("websearch_needed") == "yes" and serpapi_key:
+        branches["websearch"] = (timed_web_search(manager_json["prompt"], serpapi_key), advisor.WEBSEARCH_TIMEOUT)
+
+    results, status = {}, {"rag": "skipped", "websearch": "skipped"}
+    with timer("retrieval"):
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(branch, timeout) for branch, timeout in branches.values()),
+            return_exceptions=True
+        )
+    for name, outcome in zip(branches, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            metrics.ERRORS.inc(stage=f"{name}_timeout")
+            status[name] = "timeout"
+        elif isinstance(outcome, Exception):
+            print(f"Retrieval branch {name} failed: {outcome}")
+            metrics.ERRORS.inc(stage=name)
+            status[name] = "error"
+        else:
+            results[name] = outcome
+            status[name] = "ok"
+    return advisor.merge_context(manager_json, results, status, serpapi_key), status
+
+async def generate(prompt):
+    """Async app.generate: identical concurrent prompts share one upstream request."""
+    model = advisor.model or await run_cpu(advisor.get_model)
+    return await gemini_gate.call(model.generate_content_async, prompt, key=prompt)
+
+async def generate_timed(stage, prompt):
+    try:
+        with timer(stage):
+            return await generate(prompt)
+    except Exception:
+        metrics.ERRORS.inc(stage=stage)
+        raise
+
+async def route_query(query_text):
+    """Async app.route_query: the local router runs in cpu_pool, the Manager LLM is awaited."""
+    with timer("route_local"):
+        decision = await run_cpu(advisor.query_router.route, query_text)
+    if decision is not None:
+        return decision.to_manager_json(query_text), decision.to_dict()
+    manager_response = await generate_timed("manager_llm", advisor.build_manager_prompt(query_text))
+    return advisor.parse_manager_reply(manager_response.text)
+
+def upstream_busy(e):
+    return JSONResponse({'error': f'The advisor is busy, please retry shortly ({e}).'},
+                        status_code=503, headers={'Retry-After': '5'})
+
+def request_user_id(request, data=None):
+    """User ID of the request (X-User-Id header, else a user_id field); None for the shared base."""
+    value = request.headers.get(TENANT_HEADER)
+    if not value and isinstance(data, Mapping):
+        value = data.get('user_id')
+    return normalize_user_id(value or request.query_params.get('user_id'))
+
+def instrumented(endpoint):
+    """Request metrics, ?timings=1 and error handling, as app.py's request hooks do for Flask."""
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            start = time.perf_counter()
+            metrics.start_request_timings()
+            try:
+                response = await handler(request)
+            except UpstreamBusy as e:
+                response = upstream_busy(e)
+            except InvalidUserId as e:
+                response = JSONResponse({'error': str(e)}, 400)
+            metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            if request.query_params.get('timings') == '1' and isinstance(response, JSONResponse):
+                payload = json.loads(response.body)
+                if isinstance(payload, dict):
+                    payload['timings'] = metrics.request_timings()
+                    response.body = response.render(payload)
+                    response.headers['content-length'] = str(len(response.body))
+            return response
+        return wrapper
+    return decorate
+
+@instrumented('process_query')
+async def process_query(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({'error': 'Request body must be JSON'}, 400)
+    # Opening or evicting knowledge bases touches the disk, so it runs in cpu_pool too
+    kb = await run_cpu(advisor.tenants.acquire, request_user_id(request, data))
+    try:
+        return await answer_query(kb, data)
+    finally:
+        await run_cpu(advisor.tenants.release, kb)
+
+async def answer_query(kb, data):
+    db = kb.db if kb.db_opened else await run_cpu(kb.get_db)
+    if db is None:
+        return JSONResponse({'advisor_response': 'The knowledge base is not yet initialized. Please upload a document first.'})
+    query_text = data.get('query', '')
+    if query_text.lower() in ['exit', 'quit', 'bye']:
+        return JSONResponse({'response': 'Goodbye!'})
+    generation = kb.generation()
+    cached, cache_tier = await run_cpu(advisor.lookup_cache, kb, query_text, generation)
+    if cache_tier == "exact":
+        return advisor.with_cache_headers(JSONResponse(advisor.cached_payload(cached)), cache_tier)
+    if cached is not None:
+        manager_json, routing, search_links_md, retrieval_status = advisor.reuse_cached_retrieval(cached, query_text)
+    else:
+        try:
+            manager_json, routing = await route_query(query_text)
+        except UpstreamBusy:
+            raise
+        except json.JSONDecodeError as e:
+            return JSONResponse({
+                'manager_response': {'error': 'Invalid JSON from Manager LLM', 'raw': e.doc},
+                'advisor_response': None,
+                'web_links': ""
+            })
+        except Exception as e:
+            return JSONResponse({
+                'manager_response': {'error': f"Error generating response with Manager LLM: {str(e)}"},
+                'advisor_response': None,
+                'web_links': ""
+            })
+        manager_json.setdefault("context", "")
+        search_links_md, retrieval_status = await gather_context(kb, manager_json, query_text)
+    try:
+        advisor_response = await generate_timed("advisor_llm", advisor.build_advisor_prompt(manager_json))
+        if advisor.is_cacheable(manager_json, retrieval_status):
+            await run_cpu(kb.query_cache.store, query_text, manager_json, routing, search_links_md,
+                          retrieval_status, advisor_response.text, generation)
+        return advisor.with_cache_headers(JSONResponse(advisor.query_payload(
+            manager_json, advisor_response.text, search_links_md, retrieval_status, routing
+        )), cache_tier)
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        return JSONResponse(advisor.query_payload(
+            manager_json, {'error': f"Error generating response with Advisor LLM: {str(e)}"},
+            search_links_md, retrieval_status, routing
+        ))
+
+def save_upload(source, file_path):
+    with open(file_path, 'wb') as destination:
+        shutil.copyfileobj(source, destination)
+
+class BodyTooLarge(Exception):
+    """The request body passed MAX_CONTENT_LENGTH while it was being read."""
+
+def limited_receive(receive, limit):
+    """ASGI receive that raises BodyTooLarge once more than limit body bytes have arrived.
+
+    Chunked uploads have no Content-Length, so the limit is enforced on the stream.
+    """
+    received = 0
+
+    async def wrapped():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise BodyTooLarge()
+        return message
+
+    return wrapped
+
+@instrumented('upload_document')
+async def upload_document(request):
+    limit = advisor.app.config['MAX_CONTENT_LENGTH']
+    too_large = JSONResponse({'success': False, 'message': 'File too large (16MB max)'}, 413)
+    try:
+        length = request.headers.get('content-length')
+        if length and int(length) > limit:
+            return too_large
+        limited = Request(request.scope, limited_receive(request.receive, limit))
+        # Closing the form removes the spooled upload once it has been copied out
+        async with limited.form() as form:
+            user_id = request_user_id(request, form)
+            if 'document' not in form:
+                return JSONResponse({'success': False, 'message': 'No file provided'})
+            file = form['document']
+            if not getattr(file, 'filename', ''):
+                return JSONResponse({'success': False, 'message': 'No file selected'})
+            if advisor.allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                upload_folder = advisor.tenants.paths(user_id)[0]
+                os.makedirs(upload_folder, exist_ok=True)
+                # Starlette spools uploads to a temporary file; copying it out is blocking I/O
+                await run_cpu(save_upload, file.file, os.path.join(upload_folder, filename))
+                return JSONResponse(advisor.queue_ingestion(filename, user_id), 202)
+            return JSONResponse({'success': False, 'message': 'Invalid file type. Please upload a .docx file'})
+    except BodyTooLarge:
+        return too_large
+    except InvalidUserId:
+        raise
+    except Exception as e:
+        return JSONResponse({'success': False, 'message': f'Upload failed: {str(e)}'})
+
+@asynccontextmanager
+async def lifespan(app):
+    global http_client
+    # One connection per gate slot; the gate already bounds concurrent searches
+    http_client = httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=serpapi_gate.max_concurrency,
+        max_keepalive_connections=serpapi_gate.max_concurrency
+    ))
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+
+app = Starlette(
+    routes=[
+        Route('/query', process_query, methods=['POST']),
+        Route('/upload', upload_document, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(advisor.app)),
+    ],
+    # Open CORS, as flask_cors sets up for app.py
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
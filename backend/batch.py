@@ -0,0 +1,174 @@
+import argparse
+import contextlib
+import contextvars
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from metrics import timer
+from query_cache import normalize_query
+from upstream import UpstreamBusy
+
+# Batch advisory runs: many queries in, one result line per query out, in
+# completion order. The local work is done for the whole batch up front:
+#   - queries that normalize to the same text are answered once,
+#   - all query embeddings come from one model call,
+#   - the vector searches run as one grouped search,
+# then the Manager/Advisor LLM calls run with bounded parallelism (on top of
+# the Gemini gate's own limit). POST /query/batch streams the lines as NDJSON;
+# run_batch is the same pipeline for Python callers, and from the shell:
+#
+#   python batch.py questions.txt > answers.ndjson
+
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", 1000))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", 32))
+
+class BatchItem:
+    """One distinct query of a batch and what the up-front pass found for it."""
+
+    def __init__(self, query, cached=None, cache_tier=None, decision=None):
+        self.query = query
+        self.cached = cached
+        self.cache_tier = cache_tier
+        self.decision = decision  # Local routing decision, or None to ask the Manager LLM
+        self.search_results = None
+
+def prepare(advisor, kb, queries, generation):
+    """Embed, look up, route and search all queries at once; returns a BatchItem per query."""
+    with timer("batch_embed"):
+        vectors = advisor.em_func.embed_queries(queries)
+    # Cache lookups and routing embed the query again, which the pass above has cached
+    items = []
+    for query in queries:
+        cached, cache_tier = advisor.lookup_cache(kb, query, generation)
+        decision = advisor.query_router.route(query) if cached is None else None
+        items.append(BatchItem(query, cached, cache_tier, decision))
+    # Searched unless routing ruled RAG out; for Manager LLM routed queries the
+    # grouped search is cheaper than waiting for the answer
+    pending = [i for i, item in enumerate(items)
+               if item.cached is None and (item.decision is None or item.decision.rag_needed)]
+    if pending:
+        with timer("batch_search"):
+            results = advisor.search_documents_batch(kb, [queries[i] for i in pending], [vectors[i] for i in pending])
+        for i, result in zip(pending, results):
+            items[i].search_results = result
+    return items
+
+def answer(advisor, kb, item, generation):
+    """The /query response body for one prepared item; failures are reported in the body."""
+    query_text = item.query
+    if item.cached is not None:
+        manager_json, routing, search_links_md, retrieval_status = advisor.reuse_cached_retrieval(item.cached, query_text)
+    else:
+        try:
+            if item.decision is not None:
+                manager_json, routing = item.decision.to_manager_json(query_text), item.decision.to_dict()
+            else:
+                manager_response = advisor.generate_timed("manager_llm", advisor.build_manager_prompt(query_text))
+                manager_json, routing = advisor.parse_manager_reply(manager_response.text)
+        except UpstreamBusy as e:
+            return {'error': f'The advisor is busy, please retry shortly ({e}).'}
+        except json.JSONDecodeError as e:
+            return {
+                'manager_response': {'error': 'Invalid JSON from Manager LLM', 'raw': e.doc},
+                'advisor_response': None,
+                'web_links': ""
+            }
+        except Exception as e:
+            return {
+                'manager_response': {'error': f"Error generating response with Manager LLM: {str(e)}"},
+                'advisor_response': None,
+                'web_links': ""
+            }
+        manager_json.setdefault("context", "")
+        search_links_md, retrieval_status = advisor.gather_context(
+            kb, manager_json, query_text, search_results=item.search_results
+        )
+    try:
+        advisor_response = advisor.generate_timed("advisor_llm", advisor.build_advisor_prompt(manager_json))
+    except UpstreamBusy as e:
+        return {'error': f'The advisor is busy, please retry shortly ({e}).'}
+    except Exception as e:
+        return advisor.query_payload(
+            manager_json, {'error': f"Error generating response with Advisor LLM: {str(e)}"},
+            search_links_md, retrieval_status, routing
+        )
+    if advisor.is_cacheable(manager_json, retrieval_status):
+        kb.query_cache.store(query_text, manager_json, routing, search_links_md, retrieval_status,
+                             advisor_response.text, generation)
+    return advisor.query_payload(manager_json, advisor_response.text, search_links_md, retrieval_status, routing)
+
+def run_batch(queries, concurrency=None, advisor=None, user_id=None):
+    """Yield a result for every query, as each one completes.
+
+    A result is the /query response body plus "index" (position in queries),
+    "query" and "cache" (the cache tier that answered it, or None).
+    concurrency bounds the queries whose LLM calls are in flight at once.
+    advisor is the app module; it is imported when not given.
+    user_id selects the knowledge base (None for the shared one).
+    """
+    if advisor is None:
+        import app as advisor
+    queries = list(queries)
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    groups = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(normalize_query(query), []).append(index)
+    positions = list(groups.values())
+
+    def results_for(group, payload, cache_tier):
+        for index in positions[group]:
+            yield dict(payload, index=index, query=queries[index], cache=cache_tier)
+
+    # The tenant stays pinned (not evicted) until the last result is out
+    with advisor.tenants.use(user_id) as kb:
+        if kb.get_db() is None:
+            for group in range(len(positions)):
+                yield from results_for(group, {
+                    'advisor_response': 'The knowledge base is not yet initialized. Please upload a document first.'
+                }, None)
+            return
+        generation = kb.generation()
+        items = prepare(advisor, kb, [queries[indexes[0]] for indexes in positions], generation)
+
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        try:
+            futures = {}
+            for group, item in enumerate(items):
+                if item.cache_tier == "exact":
+                    yield from results_for(group, advisor.cached_payload(item.cached), item.cache_tier)
+                else:
+                    future = pool.submit(contextvars.copy_context().run, answer, advisor, kb, item, generation)
+                    futures[future] = group
+            for future in as_completed(futures):
+                group = futures[future]
+                yield from results_for(group, future.result(), items[group].cache_tier)
+        finally:
+            # A consumer that stops early (client gone) leaves nothing queued behind it
+            pool.shutdown(wait=False, cancel_futures=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of queries through the advisor pipeline.")
+    parser.add_argument("input", help="Text file with one query per line, or - for stdin")
+    parser.add_argument("--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--user-id", default=None, help="Knowledge base to answer from (default: the shared one)")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    with source:
+        queries = [line.strip() for line in source if line.strip()]
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    # The pipeline logs with print; keep that out of the NDJSON
+    with contextlib.redirect_stdout(sys.stderr):
+        os.environ.setdefault("STARTUP_MODE", "lazy")
+        from tenants import normalize_user_id
+        for result in run_batch(queries, args.concurrency, user_id=normalize_user_id(args.user_id)):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    if output is not sys.stdout:
+        output.close()
+
+if __name__ == "__main__":
+    main()
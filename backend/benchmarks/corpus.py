@@ -0,0 +1,66 @@
+import argparse
+import os
+import random
+from docx import Document as DocxDocument
+
+# Synthetic .docx corpus in the style of the financial habit documents.
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+CATEGORIES = ["housing", "utilities", "groceries", "dining out", "transport", "insurance",
+              "subscriptions", "travel", "healthcare", "education", "entertainment", "gifts"]
+ACCOUNTS = ["401(k)", "Roth IRA", "brokerage account", "high-yield savings", "HSA",
+            "emergency fund", "checking account", "529 plan"]
+HABITS = [
+    "reviews the budget every Sunday evening",
+    "rounds up card purchases into savings",
+    "pays the credit card balance in full each month",
+    "keeps three months of expenses in the emergency fund",
+    "contributes enough to the 401(k) to get the full employer match",
+    "cooks at home on weekdays to limit dining out",
+    "cancels unused subscriptions each quarter",
+    "automates a transfer to the Roth IRA on payday",
+]
+
+def make_paragraphs(rng, paragraphs):
+    lines = []
+    for _ in range(paragraphs):
+        month = rng.choice(MONTHS)
+        income = rng.randrange(3500, 9000, 50)
+        expenses = rng.randrange(2000, income, 50)
+        category = rng.choice(CATEGORIES)
+        account = rng.choice(ACCOUNTS)
+        lines.append(
+            f"In {month}, income was ${income:,} and expenses were ${expenses:,}, "
+            f"with the largest share going to {category}. ${income - expenses:,} was left over, "
+            f"and ${rng.randrange(100, 1000, 25):,} of it went into the {account}. "
+            f"The household {rng.choice(HABITS)}."
+        )
+    return lines
+
+def generate_corpus(directory, documents, paragraphs=(8, 40), seed=42):
+    """Write `documents` synthetic .docx files into directory; returns their paths."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        doc = DocxDocument()
+        doc.add_heading(f"Financial Habits Report {i + 1}", level=1)
+        for line in make_paragraphs(rng, rng.randint(*paragraphs)):
+            doc.add_paragraph(line)
+        path = os.path.join(directory, f"habits_{i + 1:05d}.docx")
+        doc.save(path)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic .docx corpus.")
+    parser.add_argument("directory")
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    paths = generate_corpus(args.directory, args.documents, seed=args.seed)
+    print(f"Wrote {len(paths)} documents to {args.directory}")
+
+if __name__ == "__main__":
+    main()
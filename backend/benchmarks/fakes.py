@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from langchain_core.embeddings import Embeddings
+
+# Local stand-ins for Gemini, SerpAPI and the embedding model.
+# Latencies are drawn from a configurable distribution so benchmarks can model
+# a fast or a slow upstream without touching the network.
+
+class LatencyDistribution:
+    """Latency in seconds parsed from a spec string.
+
+    "0.2" or "fixed:0.2"        always 200ms
+    "uniform:0.1,0.5"          uniform between 100ms and 500ms
+    "lognormal:0.3,0.5"        median 300ms, sigma 0.5 (long tail)
+    "normal:0.3,0.05"          mean 300ms, stddev 50ms, clipped at 0
+    """
+
+    def __init__(self, spec, seed=None):
+        self.spec = str(spec)
+        kind, _, args = self.spec.partition(":")
+        if not args:
+            kind, args = "fixed", kind
+        self.kind = kind
+        self.args = [float(x) for x in args.split(",")]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == "fixed":
+                return self.args[0]
+            if self.kind == "uniform":
+                return self._random.uniform(self.args[0], self.args[1])
+            if self.kind == "lognormal":
+                return self._random.lognormvariate(math.log(self.args[0]), self.args[1])
+            if self.kind == "normal":
+                return max(0.0, self._random.gauss(self.args[0], self.args[1]))
+        raise ValueError(f"Unknown latency distribution: {self.spec}")
+
+    def sleep(self):
+        seconds = self.sample()
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel.generate_content and generate_content_async.
+
+    Manager prompts get a JSON routing decision; advisor prompts get a canned
+    answer, streamed in chunks when stream=True.
+    """
+
+    ANSWER = (
+        "Based on your habits, you are saving about 20% of your income. "
+        "**Suggestion**: Automate a monthly transfer into a high-yield savings account "
+        "and review discretionary spending every two weeks."
+    )
+
+    def __init__(self, latency="fixed:0.3", token_latency="fixed:0.01", stream_chunks=12, seed=None):
+        self.latency = LatencyDistribution(latency, seed)
+        self.token_latency = LatencyDistribution(token_latency, seed)
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _manager_reply(self, prompt):
+        match = re.search(r"User Query: (.*)", prompt)
+        query = match.group(1).strip() if match else ""
+        realtime = bool(re.search(r"\b(today|current|latest|news)\b", query, re.IGNORECASE))
+        return "```json\n" + json.dumps({
+            "RAG_needed": "yes",
+            "websearch_needed": "yes" if realtime else "no",
+            "prompt": query,
+            "context": ""
+        }) + "\n```"
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        if text.lstrip().startswith("You are a Manager LLM"):
+            self.latency.sleep()
+            return FakeResponse(self._manager_reply(text))
+        if not stream:
+            self.latency.sleep()
+            return FakeResponse(self.ANSWER)
+        return self._stream()
+
+    async def generate_content_async(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        await asyncio.sleep(self.latency.sample())
+        if text.lstrip().startswith("You are a Manager LLM"):
+            return FakeResponse(self._manager_reply(text))
+        return FakeResponse(self.ANSWER)
+
+    def _stream(self):
+        # Time to first token follows the main distribution, then per-chunk latency
+        self.latency.sleep()
+        words = self.ANSWER.split(" ")
+        size = max(1, len(words) // self.stream_chunks)
+        for start in range(0, len(words), size):
+            if start:
+                self.token_latency.sleep()
+            yield FakeResponse(" ".join(words[start:start + size]) + " ")
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hash-based unit vectors; no model download, near-zero cost."""
+
+    def __init__(self, model_name=None, dimension=384, **kwargs):
+        self.dimension = dimension
+
+    def _vector(self, text):
+        values = []
+        counter = 0
+        while len(values) < self.dimension:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            values.extend((b - 127.5) / 127.5 for b in digest)
+            counter += 1
+        values = values[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+class FakeSearchServer:
+    """Local HTTP server that answers like serpapi.com/search after a sampled delay."""
+
+    def __init__(self, latency="fixed:0.4", host="127.0.0.1", port=0, seed=None):
+        self.latency = LatencyDistribution(latency, seed)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                server.latency.sleep()
+                params = parse_qs(urlparse(self.path).query)
+                query = params.get("q", [""])[0]
+                count = int(params.get("num", ["3"])[0])
+                body = json.dumps({"organic_results": [
+                    {"title": f"Result {i + 1} for {query}", "link": f"https://example.com/{i + 1}"}
+                    for i in range(count)
+                ]}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/search"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
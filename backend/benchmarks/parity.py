@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Parity and throughput check between embedding engines.
+#
+#   python -m benchmarks.parity --engines torch,onnx,onnx-int8 --documents 50
+#
+# The first engine is the reference. For every other engine the check reports
+# the cosine similarity of its vectors to the reference vectors, the overlap of
+# the top-k chunks each query retrieves, and embedding throughput. The exit
+# status is 1 when an engine falls below --min-cosine or --min-overlap.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_chunks(args):
+    from benchmarks.corpus import generate_corpus
+    from creat_vec_database import collect_docx_files, docx_to_documents, split_text
+
+    if args.data_path:
+        paths = collect_docx_files(args.data_path)
+        return [chunk.page_content for chunk in split_text(docx_to_documents(paths))]
+    with tempfile.TemporaryDirectory(prefix="bench-parity-") as workdir:
+        paths = generate_corpus(workdir, args.documents, seed=args.seed)
+        return [chunk.page_content for chunk in split_text(docx_to_documents(paths))]
+
+def measure(embeddings, chunks, queries):
+    start = time.perf_counter()
+    doc_vectors = embeddings.embed_documents(chunks)
+    bulk_seconds = time.perf_counter() - start
+    query_vectors, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query))
+        latencies.append(time.perf_counter() - start)
+    return doc_vectors, query_vectors, bulk_seconds, latencies
+
+def main():
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Compare embedding engines against a reference.")
+    parser.add_argument("--engines", default="torch,onnx,onnx-int8", help="Reference engine first")
+    parser.add_argument("--data-path", help="Directory of .docx files (default: synthetic corpus)")
+    parser.add_argument("--documents", type=int, default=50, help="Synthetic corpus size")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-overlap", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output-dir", default=os.path.join(BACKEND_DIR, "benchmarks", "results"))
+    args = parser.parse_args()
+    args.output_dir = os.path.abspath(args.output_dir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    from benchmarks.run import QUERIES, latency_summary, write_result
+    from creat_vec_database import EMBEDDING_MODEL
+    from embedding_engines import create_embeddings
+
+    chunks = load_chunks(args)
+    queries = QUERIES
+    engines = args.engines.split(",")
+    reference = None
+    runs, failed = [], False
+    for engine in engines:
+        start = time.perf_counter()
+        embeddings = create_embeddings(EMBEDDING_MODEL, engine)
+        load_seconds = time.perf_counter() - start
+        doc_vectors, query_vectors, bulk_seconds, latencies = measure(embeddings, chunks, queries)
+        docs = np.asarray(doc_vectors, dtype=np.float32)
+        qs = np.asarray(query_vectors, dtype=np.float32)
+        top = np.argsort(-(qs @ docs.T), axis=1)[:, :args.k]
+        entry = {
+            "engine": engine,
+            "load_seconds": round(load_seconds, 3),
+            "chunks": len(chunks),
+            "chunks_per_second": round(len(chunks) / bulk_seconds, 2) if bulk_seconds else None,
+            "query_latency": latency_summary(latencies),
+        }
+        if reference is None:
+            reference = (docs, qs, top)
+        else:
+            ref_docs, ref_qs, ref_top = reference
+            cosines = np.concatenate([(docs * ref_docs).sum(axis=1), (qs * ref_qs).sum(axis=1)])
+            overlap = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(top, ref_top)])
+            entry.update({
+                "min_cosine": round(float(cosines.min()), 5),
+                "mean_cosine": round(float(cosines.mean()), 5),
+                "top_k_overlap": round(float(overlap), 4),
+                "speedup": round(runs[0]["query_latency"]["mean_ms"] / entry["query_latency"]["mean_ms"], 2),
+                "bulk_speedup": round(entry["chunks_per_second"] / runs[0]["chunks_per_second"], 2),
+            })
+            entry["passed"] = entry["min_cosine"] >= args.min_cosine and entry["top_k_overlap"] >= args.min_overlap
+            failed = failed or not entry["passed"]
+        runs.append(entry)
+        print(json.dumps(entry))
+    write_result(args, "parity", {"reference": engines[0], "k": args.k, "queries": len(queries), "engines": runs})
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
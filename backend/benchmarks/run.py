@@ -0,0 +1,530 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Offline benchmark scenarios for the advisor backend.
+#
+#   python -m benchmarks.run ingest --sizes 10,100,1000
+#   python -m benchmarks.run query --documents 200 --concurrency 1,8,32 --requests 400
+#   python -m benchmarks.run query --server asgi --concurrency 32,256 --requests 1000
+#   python -m benchmarks.run memory --documents 200
+#   python -m benchmarks.run vectorstore --sizes 10000,100000,1000000
+#   python -m benchmarks.run vectorstore --sizes 100000 --batch-size 5000   (bulk writes)
+#
+# Run from the backend directory. Gemini and SerpAPI are always replaced by the
+# local stand-ins in benchmarks.fakes; --fake-embeddings also replaces the
+# MiniLM model so runs do not need the model weights. Every run writes a JSON
+# result file to --output-dir for tracking regressions between releases.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES = [
+    "How should I split my income between savings and spending?",
+    "What is the latest news on interest rates today?",
+    "How much am I putting into my Roth IRA each month?",
+    "Which expense category grew the most this year?",
+    "Am I on track with my emergency fund?",
+    "Should I increase my 401(k) contribution?",
+    "What are current high-yield savings rates?",
+    "How can I reduce dining out expenses?",
+]
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 2),
+        "p50_ms": round(1000 * percentile(values, 50), 2),
+        "p95_ms": round(1000 * percentile(values, 95), 2),
+        "p99_ms": round(1000 * percentile(values, 99), 2),
+        "max_ms": round(1000 * values[-1], 2),
+    }
+
+def rss_kb():
+    """Current resident set size in KiB (Linux), falling back to the peak."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return peak_rss_kb()
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key != "func"},
+    }
+
+def write_result(args, scenario, result):
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{scenario}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"scenario": scenario, "metadata": run_metadata(args), "result": result}, f, indent=2)
+    print(f"Results written to {path}")
+    return path
+
+def prepare_environment(workdir, args, search_url=None):
+    """Point the backend at the fakes and a scratch working directory."""
+    from benchmarks.fakes import FakeEmbeddings
+
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("STARTUP_MODE", "lazy")  # The fake model is assigned right after import
+    os.environ["SERPAPI_API_KEY"] = "benchmark"
+    if search_url:
+        os.environ["SERPAPI_URL"] = search_url
+    if not getattr(args, "cache", False):
+        os.environ["QUERY_CACHE_TTL"] = "0"
+        os.environ["QUERY_CACHE_WEB_TTL"] = "0"
+    os.environ["VECTOR_STORE"] = args.vector_store
+    if args.fake_embeddings:
+        import langchain.embeddings
+        import langchain_huggingface
+        langchain_huggingface.HuggingFaceEmbeddings = FakeEmbeddings
+        langchain.embeddings.HuggingFaceEmbeddings = FakeEmbeddings
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+def load_app(args):
+    """Import the Flask app with Gemini replaced by the fake model."""
+    from benchmarks.fakes import FakeGenerativeModel
+
+    import app as app_module
+    app_module.model = FakeGenerativeModel(
+        latency=args.llm_latency, token_latency=args.token_latency, seed=args.seed
+    )
+    return app_module
+
+def ingest_corpus(app_module):
+    from creat_vec_database import NullProgress
+    return app_module.ingest_documents(NullProgress())
+
+def scenario_ingest(args):
+    from benchmarks.corpus import generate_corpus
+    from ingest_jobs import IngestionJob
+
+    results = []
+    for size in [int(x) for x in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory(prefix=f"bench-ingest-{size}-") as workdir:
+            prepare_environment(workdir, args)
+            import creat_vec_database
+            from vector_store import open_vector_store
+
+            start = time.perf_counter()
+            generate_corpus(os.path.join(workdir, "Doc"), size, seed=args.seed)
+            corpus_seconds = time.perf_counter() - start
+
+            # Absolute paths: Chroma caches clients by path, and every size gets a new directory
+            data_path, chroma_path = os.path.join(workdir, "Doc"), os.path.join(workdir, "chroma")
+            db = open_vector_store(chroma_path, creat_vec_database.load_embeddings())
+            job = IngestionJob()
+            rss_before = rss_kb()
+            start = time.perf_counter()
+            stats = creat_vec_database.sync_vec_db(db, data_path, chroma_path, progress=job)
+            full_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            creat_vec_database.sync_vec_db(db, data_path, chroma_path)
+            noop_seconds = time.perf_counter() - start
+
+            entry = {
+                "documents": size,
+                "chunks": stats["chunks_upserted"],
+                "corpus_generation_seconds": round(corpus_seconds, 3),
+                "full_ingest_seconds": round(full_seconds, 3),
+                "documents_per_second": round(size / full_seconds, 2) if full_seconds else None,
+                "chunks_per_second": round(stats["chunks_upserted"] / full_seconds, 2) if full_seconds else None,
+                "stages_seconds": job.to_dict()["stages"],
+                "noop_resync_seconds": round(noop_seconds, 4),
+                "rss_growth_kb": rss_kb() - rss_before,
+            }
+            results.append(entry)
+            print(json.dumps(entry))
+            os.chdir(BACKEND_DIR)
+    return write_result(args, "ingest", {"runs": results, "peak_rss_kb": peak_rss_kb()})
+
+def fire_requests(base_url, endpoint, total, concurrency):
+    """Send `total` queries with `concurrency` clients; returns latencies, TTFBs and errors."""
+    import requests
+
+    local = threading.local()
+    latencies, first_bytes, errors = [], [], []
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        # Unique suffix so the query cache cannot short-circuit the pipeline
+        payload = {"query": f"{QUERIES[i % len(QUERIES)]} (#{i})"}
+        start = time.perf_counter()
+        try:
+            if endpoint == "stream":
+                first = None
+                with session.post(f"{base_url}/query/stream", json=payload, stream=True, timeout=120) as res:
+                    res.raise_for_status()
+                    for line in res.iter_lines():
+                        if first is None and line.startswith(b"event: token"):
+                            first = time.perf_counter() - start
+                with lock:
+                    if first is not None:
+                        first_bytes.append(first)
+            else:
+                res = session.post(f"{base_url}/query", json=payload, timeout=120)
+                res.raise_for_status()
+                body = res.json()
+                if not isinstance(body.get("advisor_response"), str):
+                    raise RuntimeError(f"Bad response: {body}")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return latencies, first_bytes, errors, time.perf_counter() - start
+
+class UvicornThread:
+    """asgi.app on uvicorn in a background thread, stopped like a werkzeug server."""
+
+    def __init__(self, asgi_app):
+        import socket
+        import uvicorn
+
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.server_port = self.sock.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(asgi_app, log_level="warning", lifespan="on"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.sock]}, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+def start_server(app_module, server_mode):
+    """Serve the app on a free local port; returns (server, base_url)."""
+    if server_mode == "asgi":
+        import asgi
+        server = UvicornThread(asgi.app)
+    else:
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def scenario_query(args):
+    from benchmarks.corpus import generate_corpus
+    from benchmarks.fakes import FakeSearchServer
+
+    search = FakeSearchServer(latency=args.search_latency, seed=args.seed)
+    search.start()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-query-") as workdir:
+        prepare_environment(workdir, args, search_url=search.url)
+        generate_corpus(os.path.join(workdir, "Doc"), args.documents, seed=args.seed)
+        app_module = load_app(args)
+        ingest_corpus(app_module)
+
+        server, base_url = start_server(app_module, args.server)
+        try:
+            for concurrency in [int(x) for x in args.concurrency.split(",")]:
+                latencies, first_bytes, errors, wall = fire_requests(
+                    base_url, args.endpoint, args.requests, concurrency
+                )
+                entry = {
+                    "concurrency": concurrency,
+                    "requests": args.requests,
+                    "errors": len(errors),
+                    "sample_errors": errors[:3],
+                    "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+                    "latency": latency_summary(latencies),
+                }
+                if args.endpoint == "stream":
+                    entry["time_to_first_token"] = latency_summary(first_bytes)
+                results.append(entry)
+                print(json.dumps(entry))
+        finally:
+            server.shutdown()
+            search.stop()
+            os.chdir(BACKEND_DIR)
+    return write_result(args, "query", {
+        "endpoint": args.endpoint,
+        "server": args.server,
+        "documents": args.documents,
+        "llm_latency": args.llm_latency,
+        "search_latency": args.search_latency,
+        "levels": results,
+        "upstream": {"llm_calls": app_module.model.calls, "search_requests": search.requests},
+    })
+
+def scenario_probe(args):
+    """Child process for the memory scenario: one worker's footprint, printed as JSON."""
+    from benchmarks.corpus import generate_corpus
+    from benchmarks.fakes import FakeSearchServer
+
+    search = FakeSearchServer(latency="fixed:0", seed=args.seed)
+    search.start()
+    workdir = args.workdir
+    baseline = rss_kb()
+    prepare_environment(workdir, args, search_url=search.url)
+    start = time.perf_counter()
+    app_module = load_app(args)
+    import_seconds = time.perf_counter() - start
+    after_import = rss_kb()
+    generate_corpus(os.path.join(workdir, "Doc"), args.documents, seed=args.seed)
+    ingest_corpus(app_module)
+    after_ingest = rss_kb()
+    client = app_module.app.test_client()
+    for i in range(args.requests):
+        client.post("/query", json={"query": f"{QUERIES[i % len(QUERIES)]} (#{i})"})
+    search.stop()
+    print(json.dumps({
+        "baseline_rss_kb": baseline,
+        "import_seconds": round(import_seconds, 3),
+        "after_import_rss_kb": after_import,
+        "after_ingest_rss_kb": after_ingest,
+        "after_queries_rss_kb": rss_kb(),
+        "peak_rss_kb": peak_rss_kb(),
+    }))
+
+def scenario_memory(args):
+    runs = []
+    for _ in range(args.workers):
+        with tempfile.TemporaryDirectory(prefix="bench-memory-") as workdir:
+            command = [
+                sys.executable, "-m", "benchmarks.run", "probe",
+                "--workdir", workdir,
+                "--documents", str(args.documents),
+                "--requests", str(args.requests),
+                "--llm-latency", "fixed:0",
+                "--seed", str(args.seed),
+                "--vector-store", args.vector_store,
+            ]
+            if args.fake_embeddings:
+                command.append("--fake-embeddings")
+            output = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            runs.append(run)
+            print(json.dumps(run))
+    return write_result(args, "memory", {"documents": args.documents, "workers": runs})
+
+VECTOR_BACKENDS = {
+    "chroma": {"backend": "chroma"},
+    "numpy": {"backend": "numpy", "quantize": "none"},
+    "numpy-int8": {"backend": "numpy", "quantize": "int8"},
+}
+
+def synthetic_vectors(rng, count, dimension):
+    import numpy as np
+    vectors = rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def scenario_vectorprobe(args):
+    """Child process for the vectorstore scenario: cold open and query latency of one store."""
+    import numpy as np
+    from benchmarks.fakes import FakeEmbeddings
+    from vector_store import open_vector_store
+
+    baseline = rss_kb()
+    start = time.perf_counter()
+    db = open_vector_store(args.workdir, FakeEmbeddings(dimension=args.dimension), **VECTOR_BACKENDS[args.backend])
+    queries = synthetic_vectors(np.random.default_rng(args.seed + 1), args.queries, args.dimension)
+    db.similarity_search_by_vector(queries[0].tolist(), k=args.k)
+    open_seconds = time.perf_counter() - start
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs = db.similarity_search_by_vector(query.tolist(), k=args.k)
+        latencies.append(time.perf_counter() - start)
+        results.append([doc.page_content for doc in docs])
+    print(json.dumps({
+        "open_and_first_query_seconds": round(open_seconds, 3),
+        "latency": latency_summary(latencies),
+        "rss_growth_kb": rss_kb() - baseline,
+        "results": results,
+    }))
+
+def scenario_vectorstore(args):
+    """Chroma against the memory-mapped NumPy store: build, cold open, query latency, recall."""
+    import numpy as np
+    from benchmarks.fakes import FakeEmbeddings
+
+    prepare_environment(BACKEND_DIR, args)
+    from creat_vec_database import EMBED_BATCH_SIZE
+    from vector_store import open_vector_store
+
+    # Ingestion upserts EMBED_BATCH_SIZE chunks at a time, so that is what the build measures by default
+    batch_size = args.batch_size or EMBED_BATCH_SIZE
+    backends = args.backends.split(",")
+    runs = []
+    for size in [int(x) for x in args.sizes.split(",")]:
+        exact = None
+        for name in backends:
+            with tempfile.TemporaryDirectory(prefix=f"bench-vectors-{name}-{size}-") as workdir:
+                db = open_vector_store(workdir, FakeEmbeddings(dimension=args.dimension), **VECTOR_BACKENDS[name])
+                rng = np.random.default_rng(args.seed)
+                start = time.perf_counter()
+                for offset in range(0, size, batch_size):
+                    count = min(batch_size, size - offset)
+                    db.upsert(
+                        ids=[f"chunk-{i}" for i in range(offset, offset + count)],
+                        embeddings=synthetic_vectors(rng, count, args.dimension).tolist(),
+                        documents=[f"chunk-{i}" for i in range(offset, offset + count)],
+                        metadatas=[{"row": i} for i in range(offset, offset + count)],
+                    )
+                db.persist()
+                build_seconds = time.perf_counter() - start
+                del db
+                command = [
+                    sys.executable, "-m", "benchmarks.run", "vectorprobe",
+                    "--workdir", workdir,
+                    "--backend", name,
+                    "--dimension", str(args.dimension),
+                    "--queries", str(args.queries),
+                    "--k", str(args.k),
+                    "--seed", str(args.seed),
+                ]
+                output = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+                probe = json.loads(output.strip().splitlines()[-1])
+                results = probe.pop("results")
+                if name == "numpy":
+                    exact = results
+                entry = {
+                    "backend": name,
+                    "vectors": size,
+                    "batch_size": batch_size,
+                    "build_seconds": round(build_seconds, 3),
+                    "disk_bytes": directory_size(workdir),
+                    **probe,
+                }
+                entry["_results"] = results
+                runs.append(entry)
+        # Recall against the exact float32 search, when it was part of the run
+        for entry in runs:
+            if entry["vectors"] != size:
+                continue
+            results = entry.pop("_results")
+            if exact is not None and entry["backend"] != "numpy":
+                hits = sum(len(set(a) & set(b)) for a, b in zip(results, exact))
+                entry["recall_at_k"] = round(hits / (len(exact) * args.k), 4)
+            print(json.dumps(entry))
+    return write_result(args, "vectorstore", {"dimension": args.dimension, "k": args.k, "runs": runs})
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the advisor backend.")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    def common(p):
+        p.add_argument("--fake-embeddings", action="store_true", help="Use hash embeddings instead of MiniLM")
+        p.add_argument("--llm-latency", default="lognormal:0.4,0.4", help="Fake Gemini latency distribution")
+        p.add_argument("--token-latency", default="fixed:0.02", help="Fake Gemini per-chunk stream latency")
+        p.add_argument("--search-latency", default="lognormal:0.5,0.3", help="Fake SerpAPI latency distribution")
+        p.add_argument("--seed", type=int, default=42)
+        p.add_argument("--vector-store", choices=["chroma", "numpy"], default="chroma")
+        p.add_argument("--output-dir", default=os.path.join(BACKEND_DIR, "benchmarks", "results"))
+
+    p = sub.add_parser("ingest", help="Ingestion throughput over corpus sizes")
+    common(p)
+    p.add_argument("--sizes", default="10,100,1000")
+    p.set_defaults(func=scenario_ingest)
+
+    p = sub.add_parser("query", help="/query latency percentiles under concurrent load")
+    common(p)
+    p.add_argument("--documents", type=int, default=100)
+    p.add_argument("--concurrency", default="1,8,32")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--endpoint", choices=["query", "stream"], default="query")
+    p.add_argument("--cache", action="store_true", help="Keep the query cache enabled")
+    p.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi",
+                   help="Threaded Flask server or asgi.py on uvicorn (/query only; streams stay on Flask)")
+    p.set_defaults(func=scenario_query)
+
+    p = sub.add_parser("memory", help="Resident memory of one worker process")
+    common(p)
+    p.add_argument("--documents", type=int, default=100)
+    p.add_argument("--requests", type=int, default=50)
+    p.add_argument("--workers", type=int, default=1, help="Independent worker processes to measure")
+    p.set_defaults(func=scenario_memory)
+
+    p = sub.add_parser("vectorstore", help="Chroma against the memory-mapped NumPy store")
+    common(p)
+    p.add_argument("--sizes", default="10000,100000")
+    p.add_argument("--backends", default="numpy,numpy-int8,chroma")
+    p.add_argument("--dimension", type=int, default=384)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=3)
+    p.add_argument("--batch-size", type=int, default=None,
+                   help="Vectors per upsert (default: EMBED_BATCH_SIZE, like ingestion)")
+    p.set_defaults(func=scenario_vectorstore)
+
+    p = sub.add_parser("vectorprobe", help=argparse.SUPPRESS)
+    common(p)
+    p.add_argument("--workdir", required=True)
+    p.add_argument("--backend", choices=list(VECTOR_BACKENDS), required=True)
+    p.add_argument("--dimension", type=int, default=384)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=3)
+    p.set_defaults(func=scenario_vectorprobe)
+
+    p = sub.add_parser("probe", help=argparse.SUPPRESS)
+    common(p)
+    p.add_argument("--workdir", required=True)
+    p.add_argument("--documents", type=int, default=100)
+    p.add_argument("--requests", type=int, default=50)
+    p.set_defaults(func=scenario_probe)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    args.output_dir = os.path.abspath(args.output_dir)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import re
+
+# Turns retrieved chunks into the context string for the advisor prompt.
+# Chunks are 1000 characters with 500 of overlap, so neighbouring hits from
+# one file repeat half their text. Assembly merges chunks that overlap or
+# touch (by their start_index metadata), drops near-duplicate passages and
+# packs the best passages into a token budget, most relevant first.
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 768))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", 0.8))
+CHARS_PER_TOKEN = 4  # Rough average for English prose; no tokenizer call on the hot path
+SHINGLE_SIZE = 5
+SEPARATOR = "\n\n---\n\n"
+WORD_PATTERN = re.compile(r"\w+")
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+class Passage:
+    """A span of one source, built from one or more chunks."""
+
+    def __init__(self, text, score, source=None, start=None, best_text=None):
+        self.text = text
+        self.score = score
+        self.source = source
+        self.start = start
+        self.best_text = best_text or text  # Highest-scoring member chunk
+        self.best_score = score
+        self.chunks = 1
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+    def absorb(self, chunk_text, chunk_start, score):
+        """Extend with a chunk that starts inside or right after this span."""
+        if chunk_start + len(chunk_text) > self.end:
+            self.text += chunk_text[self.end - chunk_start:]
+        if score > self.best_score:
+            self.best_text, self.best_score = chunk_text, score
+        self.score = max(self.score, score)
+        self.chunks += 1
+
+def merge_chunks(results):
+    """Merge overlapping or adjacent chunks of the same source into passages."""
+    passages, by_source = [], {}
+    for document, score in results:
+        source = document.metadata.get("file_path")
+        start = document.metadata.get("start_index")
+        if source is None or start is None:
+            passages.append(Passage(document.page_content, score))
+        else:
+            by_source.setdefault(source, []).append((start, document.page_content, score))
+    for source, chunks in by_source.items():
+        chunks.sort(key=lambda chunk: chunk[0])
+        current = None
+        for start, text, score in chunks:
+            if current is not None and start <= current.end:
+                current.absorb(text, start, score)
+                continue
+            current = Passage(text, score, source, start)
+            passages.append(current)
+    return passages
+
+def shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def drop_near_duplicates(passages, threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """Keep passages in score order, skipping any mostly contained in one already kept."""
+    kept, kept_shingles, dropped = [], [], 0
+    for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+        own = shingles(passage.text)
+        if any(len(own & other) >= threshold * len(own) for other in kept_shingles):
+            dropped += 1
+            continue
+        kept.append(passage)
+        kept_shingles.append(own)
+    return kept, dropped
+
+def truncate_to_tokens(text, tokens):
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit]
+
+def assemble_context(results, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Build the prompt context from ranked (Document, score) pairs.
+
+    Returns (context, stats). Higher scores are more relevant; only their
+    order matters, so vector relevance, BM25 and fused scores all work.
+    """
+    passages, duplicates = drop_near_duplicates(merge_chunks(results))
+    selected, used = [], 0
+    for passage in passages:
+        remaining = token_budget - used
+        # Fall back to the passage's best chunk when the merged span is too long
+        for text in (passage.text, passage.best_text):
+            if estimate_tokens(text) <= remaining:
+                selected.append(text)
+                used += estimate_tokens(text)
+                break
+        else:
+            if not selected:
+                text = truncate_to_tokens(passage.best_text, remaining)
+                selected.append(text)
+                used += estimate_tokens(text)
+    stats = {
+        "chunks": len(results),
+        "passages": len(passages) + duplicates,
+        "duplicates_dropped": duplicates,
+        "passages_used": len(selected),
+        "tokens": used,
+    }
+    return SEPARATOR.join(selected), stats
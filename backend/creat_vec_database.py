@@ -1,16 +1,40 @@
 import os
-from docx import Document as DocxDocument
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.schema import Document
+import json
+import hashlib
+import uuid
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+try:
+    import fcntl
+except ImportError:  # Windows: no gunicorn there, so a single process does the ingesting
+    fcntl = None
+from langchain_core.documents import Document
+from embedding_cache import CachedEmbeddings
+from embedding_engines import LazyEmbeddings, cache_model_name
+from embedding_service import base_embeddings
+from lexical_index import LexicalIndex, index_path_for
+from vector_store import open_vector_store
+from metrics import timer
 
 # Paths
-DATA_PATH = ".\\Doc"  # Directory containing .docx files
-CHROMA_PATH = "chroma"  # Relative path for Chroma database
+DATA_PATH = os.path.join(".", "Doc")  # Directory containing .docx files
+CHROMA_PATH = "chroma"  # Relative path for the vector database (Chroma or NumPy, see vector_store)
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+MANIFEST_FILE = "ingest_manifest.json"  # Per-file ingestion state, stored next to the database
+INGEST_LOCK_FILE = ".ingest.lock"  # Held while a process syncs the database, see ingestion_lock
+
+# Pipeline tuning
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))  # Parser processes
+PARALLEL_MIN_FILES = 8  # Smaller runs are parsed in-process; a pool is not worth its startup cost
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))  # Chunks per embedding call
 
 def load_docx_data(docx_path):
     """Load text from a .docx file."""
+    # Parser and splitter are imported on first use; the web app imports this module at startup
+    from docx import Document as DocxDocument
     try:
         doc = DocxDocument(docx_path)
         # Extract text from paragraphs
@@ -29,74 +53,369 @@ def collect_docx_files(directory):
                 docx_files.append(os.path.join(root, file))
     return docx_files
 
+def load_docx_document(docx_path):
+    """Load a .docx file as a LangChain Document, or None if it has no text."""
+    # Load text from .docx file
+    content = load_docx_data(docx_path)
+    if not content:
+        return None
+
+    # Create metadata
+    metadata = {
+        "file_path": docx_path,
+        "file_name": os.path.basename(docx_path),
+        "file_size": os.path.getsize(docx_path)
+    }
+    return Document(page_content=content, metadata=metadata)
+
+def parse_docx_files(docx_paths, max_workers=INGEST_WORKERS):
+    """Yield (path, Document or None) for each path, in input order.
+
+    Large runs are parsed in a process pool. Only a small window of files is
+    in flight at once, so memory stays bounded however many files there are.
+    """
+    if max_workers <= 1 or len(docx_paths) < PARALLEL_MIN_FILES:
+        for docx_path in docx_paths:
+            yield docx_path, load_docx_document(docx_path)
+        return
+
+    # Spawned workers do not inherit the server's threads, locks or model weights
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        paths = iter(docx_paths)
+        in_flight = deque(
+            (docx_path, pool.submit(load_docx_document, docx_path))
+            for docx_path in islice(paths, max_workers * 2)
+        )
+        while in_flight:
+            docx_path, future = in_flight.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                in_flight.append((next_path, pool.submit(load_docx_document, next_path)))
+            yield docx_path, future.result()
+
 def docx_to_documents(docx_paths):
     """Convert .docx files into LangChain Document objects."""
-    documents = []
-    
-    for docx_path in docx_paths:
-        # Load text from .docx file
-        content = load_docx_data(docx_path)
-        if not content:
-            continue
-        
-        # Create metadata
-        file_name = os.path.basename(docx_path)
-        file_size = os.path.getsize(docx_path)
-        metadata = {
-            "file_path": docx_path,
-            "file_name": file_name,
-            "file_size": file_size
-        }
-        
-        # Create LangChain Document
-        doc = Document(page_content=content, metadata=metadata)
-        documents.append(doc)
-    
-    return documents
+    return [doc for _, doc in parse_docx_files(docx_paths) if doc is not None]
 
-def split_text(documents):
-    """Split documents into chunks using RecursiveCharacterTextSplitter."""
-    text_splitter = RecursiveCharacterTextSplitter(
+def make_text_splitter():
+    """Splitter shared by every ingestion path."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=500,
         length_function=len,
         add_start_index=True
     )
-    chunks = text_splitter.split_documents(documents)
-    return chunks
-
-def create_vec_db(chroma_path, chunks):
-    """Create and persist a Chroma vector database from document chunks."""
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    db = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=chroma_path
-    )
-    db.persist()  # Save the database to disk
+
+def iter_chunks(documents):
+    """Lazily split a stream of documents into chunks."""
+    text_splitter = make_text_splitter()
+    for document in documents:
+        yield from text_splitter.split_documents([document])
+
+def split_text(documents):
+    """Split documents into chunks using RecursiveCharacterTextSplitter."""
+    return list(iter_chunks(documents))
+
+def batched(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def load_embeddings(lazy=False):
+    """Embedding model wrapped in the persistent embedding cache.
+
+    Goes through the shared embedding service or the preloaded model when
+    gunicorn set one up (see embedding_service); the inference engine is
+    chosen by EMBEDDING_ENGINE (see embedding_engines). With lazy=True the
+    model is only built when something first needs a vector.
+    """
+    if lazy:
+        base = LazyEmbeddings(lambda: base_embeddings(EMBEDDING_MODEL))
+    else:
+        base = base_embeddings(EMBEDDING_MODEL)
+    return CachedEmbeddings(base, cache_model_name(EMBEDDING_MODEL))
+
+def create_vec_db(chroma_path, chunks, batch_size=EMBED_BATCH_SIZE):
+    """Create and persist a vector database from an iterable of chunks.
+
+    Chunks are embedded in fixed-size batches as they arrive.
+    """
+    embeddings = load_embeddings()
+    db = open_vector_store(chroma_path, embeddings)
+    for batch in batched(chunks, batch_size):
+        texts = [chunk.page_content for chunk in batch]
+        db.upsert(
+            ids=[str(uuid.uuid4()) for _ in batch],
+            embeddings=embeddings.embed_documents(texts),
+            documents=texts,
+            metadatas=[chunk.metadata for chunk in batch]
+        )
+    db.persist()
     return db
 
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_path_for(chroma_path):
+    """Return the location of the ingestion manifest for a vector database directory."""
+    return os.path.join(chroma_path, MANIFEST_FILE)
+
+def load_manifest(manifest_path):
+    """Load the ingestion manifest, or None if no manifest has been written yet."""
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest.setdefault("files", {})
+        return manifest
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return None
+
+def save_manifest(manifest_path, manifest):
+    """Atomically write the ingestion manifest."""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def file_key(data_path, docx_path):
+    """Stable manifest key for a file: its path relative to the data directory."""
+    return os.path.relpath(docx_path, data_path).replace(os.sep, "/")
+
+def chunk_ids_for(key, count):
+    """Stable vector IDs for the chunks of one file."""
+    prefix = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return [f"{prefix}:{i}" for i in range(count)]
+
+def plan_ingestion(data_path, docx_paths, manifest):
+    """Compare files on disk with the manifest.
+
+    Returns (changed, unchanged, deleted) where changed is a list of
+    (key, path, sha256, stat) tuples for new or modified files, unchanged maps
+    keys to refreshed manifest entries and deleted lists keys of removed files.
+    """
+    tracked = manifest["files"]
+    changed, unchanged = [], {}
+    seen = set()
+    for docx_path in docx_paths:
+        key = file_key(data_path, docx_path)
+        seen.add(key)
+        stat = os.stat(docx_path)
+        entry = tracked.get(key)
+        # Cheap check first: identical size and mtime means the file is untouched
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            unchanged[key] = entry
+            continue
+        sha256 = file_sha256(docx_path)
+        if entry and entry["sha256"] == sha256:
+            unchanged[key] = dict(entry, size=stat.st_size, mtime=stat.st_mtime)
+            continue
+        changed.append((key, docx_path, sha256, stat))
+    deleted = [key for key in tracked if key not in seen]
+    return changed, unchanged, deleted
+
+class NullProgress:
+    """Progress sink that ignores everything; see ingest_jobs.IngestionJob."""
+
+    def stage(self, name):
+        return nullcontext()
+
+    def add(self, files_parsed=0, chunks_embedded=0):
+        pass
+
+@contextmanager
+def ingest_stage(progress, name):
+    """Time an ingestion stage for both the job's progress and the metrics histogram."""
+    with timer(f"ingest_{name}"), progress.stage(name):
+        yield
+
+def upsert_chunks(db, lexical, ids, chunks, progress):
+    """Embed chunks and upsert them into the vector store and lexical index under the given IDs."""
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    with ingest_stage(progress, "embed"):
+        vectors = db.embeddings.embed_documents(texts)
+    with ingest_stage(progress, "persist"):
+        db.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=texts,
+            metadatas=metadatas
+        )
+    with ingest_stage(progress, "lexical"):
+        lexical.add(ids, texts, metadatas)
+    progress.add(chunks_embedded=len(chunks))
+
+def delete_chunks(db, lexical, ids, progress):
+    with ingest_stage(progress, "persist"):
+        db.delete(ids)
+    lexical.remove(ids)
+
+def load_lexical_index(db, chroma_path):
+    """Open the persisted lexical index, backfilling it from the collection if it does not exist yet."""
+    lexical = LexicalIndex.load(index_path_for(chroma_path))
+    if lexical is not None:
+        return lexical, False
+    lexical = LexicalIndex()
+    existing = db.get(include=["documents", "metadatas"])
+    if existing["ids"]:
+        lexical.add(existing["ids"], existing["documents"], existing["metadatas"])
+    return lexical, True
+
+@contextmanager
+def ingestion_lock(chroma_path):
+    """Exclusive lock on a vector database directory, across threads and processes.
+
+    Every gunicorn worker runs its own ingestion queue, so two uploads can
+    reach two workers; the lock makes their syncs of one store (manifest,
+    lexical index and vectors) run one after the other.
+    """
+    os.makedirs(chroma_path, exist_ok=True)
+    with open(os.path.join(chroma_path, INGEST_LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def sync_vec_db(db, data_path=DATA_PATH, chroma_path=CHROMA_PATH, progress=None):
+    """Bring a vector database in line with the .docx files in data_path.
+
+    Only new or modified files are parsed and embedded. Their chunks are
+    upserted under stable IDs, leftover chunks of shrunken files and all
+    chunks of deleted files are removed. The lexical index in chroma_path
+    receives the same upserts and deletes. Stage timings and counters are
+    reported to progress when given. Returns a dict of counters.
+
+    Runs under ingestion_lock(chroma_path). Vector writes go to the store's
+    staging copy (NumPy working copy, Chroma staging collection), and the
+    vectors, lexical index and manifest are published when the sync
+    finishes, so readers keep the previous generation until then.
+    """
+    progress = progress or NullProgress()
+    with ingestion_lock(chroma_path):
+        # Start from the published store: another process may have synced it
+        # since this handle last wrote, and a failed sync's writes must never
+        # be published by a later persist()
+        db.discard()
+        try:
+            return _sync_vec_db(db, data_path, chroma_path, progress)
+        except BaseException:
+            db.discard()
+            raise
+
+def _sync_vec_db(db, data_path, chroma_path, progress):
+    manifest_path = manifest_path_for(chroma_path)
+    manifest = load_manifest(manifest_path)
+    if manifest is not None and db.count() == 0 and any(f.get("chunk_ids") for f in manifest["files"].values()):
+        # The manifest describes another (or a wiped) vector store; ingest everything again
+        manifest = None
+    lexical, lexical_dirty = load_lexical_index(db, chroma_path)
+    if manifest is None:
+        # Vectors written before the manifest existed are untracked duplicates
+        legacy_ids = db.get(include=[])["ids"]
+        if legacy_ids:
+            db.delete(legacy_ids)
+        lexical.clear()
+        lexical_dirty = True
+        manifest = {"files": {}}
+
+    with ingest_stage(progress, "scan"):
+        changed, unchanged, deleted = plan_ingestion(data_path, collect_docx_files(data_path), manifest)
+    stats = {
+        "added": 0,
+        "updated": 0,
+        "removed": len(deleted),
+        "unchanged": len(unchanged),
+        "chunks_upserted": 0,
+        "chunks_deleted": 0,
+    }
+    files = dict(unchanged)
+    new_ids = {}
+
+    def chunk_stream():
+        # Files are parsed in parallel; their chunks stream out one file at a time
+        parsed = parse_docx_files([docx_path for _, docx_path, _, _ in changed])
+        for key, _, _, _ in changed:
+            with ingest_stage(progress, "parse"):
+                _, document = next(parsed)
+            progress.add(files_parsed=1)
+            ids = new_ids.setdefault(key, [])
+            if document is None:
+                continue
+            with ingest_stage(progress, "split"):
+                chunks = split_text([document])
+            for chunk_id, chunk in zip(chunk_ids_for(key, len(chunks)), chunks):
+                ids.append(chunk_id)
+                yield chunk_id, chunk
+
+    for batch in batched(chunk_stream(), EMBED_BATCH_SIZE):
+        upsert_chunks(db, lexical, [chunk_id for chunk_id, _ in batch], [chunk for _, chunk in batch], progress)
+        stats["chunks_upserted"] += len(batch)
+
+    for key, docx_path, sha256, stat in changed:
+        old_ids = manifest["files"].get(key, {}).get("chunk_ids", [])
+        ids = new_ids.get(key, [])
+        current = set(ids)
+        stale_ids = [i for i in old_ids if i not in current]
+        if stale_ids:
+            delete_chunks(db, lexical, stale_ids, progress)
+        stats["updated" if key in manifest["files"] else "added"] += 1
+        stats["chunks_deleted"] += len(stale_ids)
+        files[key] = {
+            "sha256": sha256,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "chunk_ids": ids,
+        }
+
+    for key in deleted:
+        old_ids = manifest["files"][key].get("chunk_ids", [])
+        if old_ids:
+            delete_chunks(db, lexical, old_ids, progress)
+        stats["chunks_deleted"] += len(old_ids)
+
+    with ingest_stage(progress, "persist"):
+        db.persist()
+    if lexical_dirty or changed or deleted:
+        with ingest_stage(progress, "lexical"):
+            lexical.save(index_path_for(chroma_path))
+
+    # Leave the manifest (and so the index generation readers watch) untouched when nothing changed
+    if files != manifest["files"]:
+        manifest["files"] = files
+        save_manifest(manifest_path, manifest)
+    return stats
+
 def main():
-    # Collect all .docx files from the directory
-    docx_paths = collect_docx_files(DATA_PATH)
-    if not docx_paths:
-        print("No .docx files found in the specified directory.")
-        return
-    
-    # Convert .docx files to documents
-    documents = docx_to_documents(docx_paths)
-    if not documents:
-        print("No valid documents created from .docx files.")
-        return
-    
-    # Split documents into chunks
-    chunks = split_text(documents)
-    
-    # Create vector database
-    db = create_vec_db(CHROMA_PATH, chunks)
-    
-    print(f"Vector database created at {CHROMA_PATH} with {len(chunks)} chunks.")
+    embeddings = load_embeddings()
+    db = open_vector_store(CHROMA_PATH, embeddings)
+
+    # Only new, changed and deleted .docx files touch the vector database
+    stats = sync_vec_db(db, DATA_PATH, CHROMA_PATH)
+
+    print(
+        f"Vector database at {CHROMA_PATH} synced: {stats['added']} added, "
+        f"{stats['updated']} updated, {stats['removed']} removed, "
+        f"{stats['unchanged']} unchanged ({stats['chunks_upserted']} chunks upserted, "
+        f"{stats['chunks_deleted']} deleted)."
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+# Persistent embedding cache.
+# Vectors are stored as float32 blobs in SQLite, keyed by a hash of the model
+# name, the kind of embedding (document or query) and the text. WAL mode lets
+# every gunicorn worker and the ingestion job share one cache file.
+#
+# The embedding wrappers here and in embedding_engines/embedding_service
+# implement LangChain's Embeddings methods (embed_documents, embed_query)
+# without subclassing it: the base class imports langchain_core.runnables and
+# langsmith, which would add half a second to every worker's startup.
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 100000))
+# Hits only note the time in memory; last_used is written back at most this
+# often (or with the next insert), so lookups take no write lock
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.environ.get("EMBEDDING_CACHE_TOUCH_INTERVAL", 60))
+TOUCH_FLUSH_ROWS = 1000  # Pending last_used updates that force an early write-back
+
+def cache_key(model_name, kind, text):
+    return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Size-bounded SQLite store of embedding vectors with hit/miss counters.
+
+    When the cache grows past max_entries, the least recently used tenth is
+    evicted. Recency is written back in batches (see touch_interval), so it
+    is approximate to within that interval.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 touch_interval=EMBEDDING_CACHE_TOUCH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._touched = {}  # key -> last hit time, not yet written to last_used
+        self._touched_since = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found and not self._touched:
+                self._touched_since = now
+            self._touched.update(dict.fromkeys(found, now))
+            if self._touched and (now - self._touched_since >= self.touch_interval
+                                  or len(self._touched) >= TOUCH_FLUSH_ROWS):
+                self._flush_touched()
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def put_many(self, items):
+        """Store {key: vector} and evict old entries if the cache is over its bound."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            # Immediate: the count below must not change before the eviction that relies on it
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+                )
+                self._flush_touched()  # Before evicting, so recent hits are not taken for cold rows
+                # Other workers write to the same file, so count what is there now
+                self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._size > self.max_entries:
+                    self._evict()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _evict(self):
+        target = int(self.max_entries * 0.9)
+        excess = self._size - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self.evictions += excess
+        self._size = target
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+class CachedEmbeddings:
+    """Embeddings wrapper that consults an EmbeddingCache before the model."""
+
+    def __init__(self, base, model_name, cache=None):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    def _embed(self, kind, texts, compute):
+        keys = [cache_key(self.model_name, kind, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        # Embed each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = compute(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed("document", list(texts), self.base.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed("query", [text], lambda texts: [self.base.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts):
+        """Query vectors for many texts in one model call, cached like embed_query.
+
+        MiniLM embeds queries and documents the same way, so the batch goes
+        through embed_documents; later embed_query calls for these texts are hits.
+        """
+        return self._embed("query", list(texts), self.base.embed_documents)
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import threading
+import numpy as np
+
+# Embedding inference engines. Every embedding model in the backend is built
+# by create_embeddings, so the query path, ingestion, the shared embedding
+# service and the gunicorn preload all follow the same settings:
+#
+#   EMBEDDING_ENGINE         "torch" (sentence-transformers, default), "onnx"
+#                            (exported fp32 graph on ONNX Runtime) or "onnx-int8"
+#                            (the same graph with dynamic int8 quantization)
+#   EMBEDDING_ONNX_DIR       exported model directory (see export_onnx below)
+#   EMBEDDING_THREADS        intra-op threads for either engine (0 = library default)
+#   EMBEDDING_BATCH_TOKENS   padded tokens per ONNX batch; texts are sorted by
+#                            length so short texts are not padded to long ones
+#   EMBEDDING_MAX_BATCH      upper bound on texts per batch
+#
+# Export once with: python embedding_engines.py export [--quantize]
+
+EMBEDDING_ENGINE = os.environ.get("EMBEDDING_ENGINE", "torch").lower()
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR", os.path.join("onnx", "all-MiniLM-L6-v2"))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", 0))
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", 16384))
+EMBEDDING_MAX_BATCH = int(os.environ.get("EMBEDDING_MAX_BATCH", 64))
+ENGINES = ("torch", "onnx", "onnx-int8")
+ONNX_MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+ONNX_CONFIG_FILE = "engine.json"
+
+def create_embeddings(model_name, engine=None):
+    """Build the uncached embedding model for the configured engine."""
+    engine = (engine or EMBEDDING_ENGINE).lower()
+    if engine == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"batch_size": EMBEDDING_MAX_BATCH}
+        )
+    if engine in ONNX_MODEL_FILES:
+        return OnnxEmbeddings(EMBEDDING_ONNX_DIR, quantized=engine == "onnx-int8", model_name=model_name)
+    raise ValueError(f"Unknown embedding engine: {engine} (expected one of {', '.join(ENGINES)})")
+
+class LazyEmbeddings:
+    """Builds the wrapped embeddings on first use, so importing the app does not load a model."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._factory()
+        return self._embeddings
+
+    def embed_documents(self, texts):
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.load().embed_query(text)
+
+def cache_model_name(model_name, engine=None):
+    """Name vectors are cached under; engines other than torch get their own entries."""
+    engine = (engine or EMBEDDING_ENGINE).lower()
+    return model_name if engine == "torch" else f"{model_name}#{engine}"
+
+def length_batches(lengths, max_tokens=EMBEDDING_BATCH_TOKENS, max_batch=EMBEDDING_MAX_BATCH):
+    """Group indices, shortest first, so each batch's padded size stays under max_tokens."""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batch = []
+    for index in order:
+        # Sorted ascending, so this text sets the padded width of the batch
+        if batch and ((len(batch) + 1) * lengths[index] > max_tokens or len(batch) >= max_batch):
+            yield batch
+            batch = []
+        batch.append(index)
+    if batch:
+        yield batch
+
+class OnnxEmbeddings:
+    """Sentence embeddings from an exported transformer on ONNX Runtime.
+
+    Mean pooling over the attention mask followed by L2 normalization, the
+    same head sentence-transformers applies to all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_dir, quantized=False, model_name=None, threads=EMBEDDING_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        config_path = os.path.join(model_dir, ONNX_CONFIG_FILE)
+        config = {}
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        if model_name and config.get("model_name") not in (None, model_name):
+            raise ValueError(f"{model_dir} holds {config['model_name']}, not {model_name}")
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILES["onnx-int8" if quantized else "onnx"])
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"No exported model at {model_path}; run: python embedding_engines.py export"
+                + (" --quantize" if quantized else "")
+            )
+        self.max_length = config.get("max_length", 256)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, encodings):
+        width = max(len(e.ids) for e in encodings)
+        feeds = {}
+        for name, field in (("input_ids", "ids"), ("attention_mask", "attention_mask"), ("token_type_ids", "type_ids")):
+            if name in self.input_names:
+                array = np.zeros((len(encodings), width), dtype=np.int64)
+                for row, encoding in enumerate(encodings):
+                    values = getattr(encoding, field)
+                    array[row, :len(values)] = values
+                feeds[name] = array
+        hidden = self.session.run(None, feeds)[0]
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        encodings = self.tokenizer.encode_batch(texts)
+        vectors = [None] * len(texts)
+        for batch in length_batches([len(e.ids) for e in encodings]):
+            for index, vector in zip(batch, self._run([encodings[i] for i in batch])):
+                vectors[index] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def export_onnx(model_name, output_dir, quantize=False, max_length=256, opset=14):
+    """Export a Hugging Face encoder to ONNX (and optionally int8) for OnnxEmbeddings.
+
+    Needs torch and transformers, which the torch engine already installs.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)  # tokenizer.json is all OnnxEmbeddings needs
+
+    sample = tokenizer(["An example sentence to trace the graph."], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILES["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in names), model_path,
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=opset
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(output_dir, ONNX_MODEL_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "max_length": max_length, "pooling": "mean", "normalize": True}, f, indent=2)
+    return model_path
+
+def main():
+    from creat_vec_database import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Embedding engine tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="Export the embedding model to ONNX")
+    p.add_argument("--model", default=EMBEDDING_MODEL)
+    p.add_argument("--output", default=EMBEDDING_ONNX_DIR)
+    p.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    args = parser.parse_args()
+    path = export_onnx(args.model, args.output, quantize=args.quantize)
+    print(f"Exported {args.model} to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+from embedding_engines import create_embeddings
+
+# One embedding model per container instead of one per gunicorn worker.
+#
+# Service mode: a separate process owns the model and listens on a Unix
+# socket. Workers embed through RemoteEmbeddings; requests arriving from all
+# workers within EMBEDDING_SERVICE_BATCH_WAIT are run through the model as
+# one micro-batch. gunicorn.conf.py starts and stops the process.
+#
+# Preload mode: the gunicorn master loads the model once with preload() and
+# forks the workers, which share its weights copy-on-write.
+#
+# Wire format: every message is a 4-byte big-endian length followed by the
+# body. Requests are JSON {"kind": "query" | "document", "texts": [...]};
+# replies are b"\x00" + (rows, dim) as two uint32 + float32 data, or b"\x01"
+# + an error message.
+
+EMBEDDING_SERVICE_SOCKET = os.environ.get("EMBEDDING_SERVICE_SOCKET")
+EMBEDDING_SERVICE_TIMEOUT = float(os.environ.get("EMBEDDING_SERVICE_TIMEOUT", 30))
+EMBEDDING_SERVICE_BATCH_SIZE = int(os.environ.get("EMBEDDING_SERVICE_BATCH_SIZE", 64))
+EMBEDDING_SERVICE_BATCH_WAIT = float(os.environ.get("EMBEDDING_SERVICE_BATCH_WAIT", 0.005))  # Seconds
+
+# Errors of a stale connection or a restarting service, worth one reconnect. A
+# timeout is not among them: the service is up but slow, and a retry would wait again
+RECONNECT_ERRORS = (ConnectionRefusedError, ConnectionResetError, BrokenPipeError, FileNotFoundError)
+
+_preloaded = {}
+
+def preload(model_name):
+    """Load the model in this process so forked children inherit it."""
+    if model_name not in _preloaded:
+        _preloaded[model_name] = create_embeddings(model_name)
+    return _preloaded[model_name]
+
+def base_embeddings(model_name):
+    """The uncached embedding backend: the shared service, a preloaded model or a private copy."""
+    # Read at call time: gunicorn sets it in the master after this module may have been imported
+    socket_path = os.environ.get("EMBEDDING_SERVICE_SOCKET")
+    if socket_path:
+        return RemoteEmbeddings(socket_path)
+    if model_name in _preloaded:
+        return _preloaded[model_name]
+    return create_embeddings(model_name)
+
+def send_message(sock, body):
+    sock.sendall(struct.pack("!I", len(body)) + body)
+
+def recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        if not part:
+            raise ConnectionResetError("Embedding service connection closed")
+        data.extend(part)
+    return bytes(data)
+
+def recv_message(sock):
+    (size,) = struct.unpack("!I", recv_exactly(sock, 4))
+    return recv_exactly(sock, size)
+
+def encode_vectors(vectors):
+    dim = len(vectors[0]) if vectors else 0
+    data = array("f")
+    for vector in vectors:
+        data.extend(vector)
+    return b"\x00" + struct.pack("!II", len(vectors), dim) + data.tobytes()
+
+def decode_vectors(body):
+    if body[:1] != b"\x00":
+        raise RuntimeError(f"Embedding service error: {body[1:].decode('utf-8', 'replace')}")
+    rows, dim = struct.unpack("!II", body[1:9])
+    data = array("f")
+    data.frombytes(body[9:])
+    return [data[i * dim:(i + 1) * dim].tolist() for i in range(rows)]
+
+class RemoteEmbeddings:
+    """Client side of the embedding service; one connection per thread."""
+
+    def __init__(self, socket_path, timeout=EMBEDDING_SERVICE_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _request(self, kind, texts):
+        body = json.dumps({"kind": kind, "texts": texts}).encode("utf-8")
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                send_message(sock, body)
+                return decode_vectors(recv_message(sock))
+            except OSError as e:
+                # The connection may be mid-reply, so it is never reused after an error
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt or not isinstance(e, RECONNECT_ERRORS):
+                    raise
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        return self._request("document", texts) if texts else []
+
+    def embed_query(self, text):
+        return self._request("query", [text])[0]
+
+class _Pending:
+    def __init__(self, kind, texts):
+        self.kind = kind
+        self.texts = texts
+        self.vectors = None
+        self.error = None
+        self.done = threading.Event()
+
+class EmbeddingServer:
+    """Unix-socket front of one embedding model that micro-batches concurrent requests."""
+
+    def __init__(self, embeddings, socket_path, batch_size=EMBEDDING_SERVICE_BATCH_SIZE,
+                 batch_wait=EMBEDDING_SERVICE_BATCH_WAIT):
+        self.embeddings = embeddings
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._listener = None
+
+    def _embed(self, kind, texts):
+        # sentence-transformers encodes queries and documents the same way,
+        # so both kinds share one model call per batch
+        if kind == "query" and len(texts) == 1:
+            return [self.embeddings.embed_query(texts[0])]
+        return self.embeddings.embed_documents(texts)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.batch_wait
+        while size < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.texts)
+        return batch
+
+    def _run_batches(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for pending in batch for text in pending.texts]
+            kind = "query" if all(pending.kind == "query" for pending in batch) else "document"
+            try:
+                vectors = self._embed(kind, texts)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = str(e)
+                    pending.done.set()
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for pending in batch:
+                pending.vectors = vectors[offset:offset + len(pending.texts)]
+                offset += len(pending.texts)
+                pending.done.set()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = json.loads(recv_message(conn))
+                except (ConnectionError, OSError):
+                    return
+                except ValueError as e:
+                    send_message(conn, b"\x01" + f"Bad request: {e}".encode("utf-8"))
+                    continue
+                texts = request.get("texts") or []
+                if not texts:
+                    send_message(conn, encode_vectors([]))
+                    continue
+                pending = _Pending(request.get("kind", "document"), texts)
+                self._queue.put(pending)
+                pending.done.wait()
+                try:
+                    if pending.error is not None:
+                        send_message(conn, b"\x01" + pending.error.encode("utf-8"))
+                    else:
+                        send_message(conn, encode_vectors(pending.vectors))
+                except OSError:
+                    return  # The client gave up (timed out) and closed the connection
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Bind under a temporary name: the socket path appearing means the model is ready
+        tmp_path = f"{self.socket_path}.{os.getpid()}"
+        listener.bind(tmp_path)
+        os.chmod(tmp_path, 0o600)
+        listener.listen(128)
+        os.replace(tmp_path, self.socket_path)
+        self._listener = listener
+        threading.Thread(target=self._run_batches, name="embed-batcher", daemon=True).start()
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def shutdown(self):
+        if self._listener is not None:
+            self._listener.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+def wait_for_socket(socket_path, timeout, process=None):
+    """Block until the service accepts connections; False on timeout or if process exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def watch_parent(parent_pid):
+    """Exit when the process that started the service goes away."""
+    while True:
+        if os.getppid() != parent_pid:
+            os._exit(0)
+        time.sleep(1)
+
+def main():
+    from creat_vec_database import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Shared embedding service on a Unix socket.")
+    parser.add_argument("--socket", default=EMBEDDING_SERVICE_SOCKET or "/tmp/advisor-embeddings.sock")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_SERVICE_BATCH_SIZE)
+    parser.add_argument("--batch-wait", type=float, default=EMBEDDING_SERVICE_BATCH_WAIT)
+    parser.add_argument("--parent-pid", type=int, help="Exit when this process exits")
+    args = parser.parse_args()
+
+    if args.parent_pid:
+        threading.Thread(target=watch_parent, args=(args.parent_pid,), daemon=True).start()
+    server = EmbeddingServer(
+        create_embeddings(args.model), args.socket,
+        batch_size=args.batch_size, batch_wait=args.batch_wait
+    )
+    print(f"Embedding service for {args.model} listening on {args.socket}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
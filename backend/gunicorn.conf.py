@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+# Gunicorn settings for the container (see Dockerfile).
+#
+# EMBEDDING_MODE decides how workers get the embedding model:
+#   service  one embedding process per container; workers embed over a Unix
+#            socket and concurrent requests are micro-batched (default)
+#   preload  the master loads the model before forking; workers share the
+#            weights copy-on-write
+#   worker   every worker loads its own copy
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+
+# SERVER_MODE "wsgi" (default) runs the Flask app on sync workers; "asgi" runs
+# asgi.py on uvicorn workers, where /query and /upload are coroutines and one
+# worker holds many slow upstream calls at once (GUNICORN_THREADS is unused)
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi").lower()
+
+chdir = backend_dir
+wsgi_app = "app:app"
+if SERVER_MODE == "asgi":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', 7860)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+EMBEDDING_MODE = os.environ.get("EMBEDDING_MODE", "service").lower()
+EMBEDDING_SOCKET = os.environ.get("EMBEDDING_SERVICE_SOCKET", "/tmp/advisor-embeddings.sock")
+EMBEDDING_START_TIMEOUT = float(os.environ.get("EMBEDDING_SERVICE_START_TIMEOUT", 300))
+
+_embedding_process = None
+
+def on_starting(server):
+    global _embedding_process
+    sys.path.insert(0, backend_dir)
+    if EMBEDDING_MODE == "preload":
+        from creat_vec_database import EMBEDDING_MODEL
+        import embedding_service
+        embedding_service.preload(EMBEDDING_MODEL)
+        server.log.info(f"Preloaded embedding model {EMBEDDING_MODEL}")
+    elif EMBEDDING_MODE == "service":
+        import embedding_service
+        _embedding_process = subprocess.Popen(
+            [sys.executable, "embedding_service.py", "--socket", EMBEDDING_SOCKET, "--parent-pid", str(os.getpid())],
+            cwd=backend_dir
+        )
+        # Workers build their routers with embeddings at import, so the service must be up first
+        if not embedding_service.wait_for_socket(EMBEDDING_SOCKET, EMBEDDING_START_TIMEOUT, _embedding_process):
+            raise RuntimeError(f"Embedding service did not start on {EMBEDDING_SOCKET}")
+        # Inherited by the workers; see embedding_service.base_embeddings
+        os.environ["EMBEDDING_SERVICE_SOCKET"] = EMBEDDING_SOCKET
+        server.log.info(f"Embedding service listening on {EMBEDDING_SOCKET}")
+
+def on_exit(server):
+    if _embedding_process is not None and _embedding_process.poll() is None:
+        _embedding_process.terminate()
+        try:
+            _embedding_process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _embedding_process.kill()
@@ -0,0 +1,221 @@
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Background ingestion jobs.
+# Uploads enqueue a job here and return immediately; a small local worker pool
+# runs the parse/split/embed/persist work outside the request thread. Each job
+# is also written to INGEST_JOBS_DIR as one JSON file (on every status change
+# and at most every JOB_SAVE_INTERVAL seconds of progress), so with several
+# gunicorn workers /jobs/<id> is answered by whichever worker gets the request.
+# Writes to a vector store are serialized across processes by
+# creat_vec_database.ingestion_lock, not by the size of this pool.
+
+INGEST_JOBS_DIR = os.environ.get("INGEST_JOBS_DIR", "jobs")
+JOB_SAVE_INTERVAL = float(os.environ.get("JOB_SAVE_INTERVAL", 1.0))
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+JOB_FIELDS = ("id", "filename", "owner", "status", "created_at", "started_at", "finished_at",
+              "files_parsed", "chunks_embedded", "stages", "result", "error")
+
+class IngestionJob:
+    """State and progress of one ingestion run."""
+
+    def __init__(self, filename=None, owner=None, store=None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.owner = owner  # User ID of the tenant the job ingests for (None for the shared one)
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files_parsed = 0
+        self.chunks_embedded = 0
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self.store = store  # JobStore the job is saved to, if any
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage; repeated stages accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self._progressed()
+
+    def add(self, files_parsed=0, chunks_embedded=0):
+        """Advance the progress counters."""
+        with self._lock:
+            self.files_parsed += files_parsed
+            self.chunks_embedded += chunks_embedded
+        self._progressed()
+
+    def _progressed(self):
+        if self.store is not None and time.monotonic() - self._saved_at >= JOB_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        if self.store is not None:
+            self._saved_at = time.monotonic()
+            self.store.save(self)
+
+    def to_record(self):
+        """Every field, as saved by JobStore."""
+        with self._lock:
+            return {field: getattr(self, field) for field in JOB_FIELDS}
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls()
+        for field in JOB_FIELDS:
+            setattr(job, field, record.get(field))
+        job.stages = job.stages or {}
+        return job
+
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "status": self.status,
+                "files_parsed": self.files_parsed,
+                "chunks_embedded": self.chunks_embedded,
+                "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                "queued_seconds": round((self.started_at or end) - self.created_at, 4),
+                "elapsed_seconds": round(end - self.started_at, 4) if self.started_at else 0.0,
+                "result": self.result,
+                "error": self.error,
+            }
+
+class JobStore:
+    """Job state on disk, one JSON file per job, shared by every process using the directory."""
+
+    def __init__(self, directory=INGEST_JOBS_DIR, max_history=200):
+        self.directory = directory
+        self.max_history = max_history
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(job.id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_record(), f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id):
+        """The job saved under job_id, or None."""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                return IngestionJob.from_record(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def trim(self):
+        """Delete the oldest finished jobs beyond max_history."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except OSError:
+            return
+        excess = len(names) - self.max_history
+        if excess <= 0:
+            return
+        paths = sorted((os.path.join(self.directory, name) for name in names), key=_mtime)
+        for path in paths:
+            if excess <= 0:
+                break
+            job = self.load(os.path.basename(path)[:-len(".json")])
+            if job is not None and job.finished_at is None:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            excess -= 1
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+class IngestionQueue:
+    """Runs ingestion jobs on a local worker pool and keeps recent job history.
+
+    Jobs are saved to store (a JobStore) so other processes can report them.
+    """
+
+    def __init__(self, max_workers=1, max_history=200, store=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._max_history = max_history
+        self._lock = threading.Lock()
+        self.store = store
+
+    def submit(self, fn, filename=None, owner=None):
+        """Enqueue fn(job) and return the job; fn's return value becomes job.result."""
+        job = IngestionJob(filename=filename, owner=owner, store=self.store)
+        job.save()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        if self.store is not None:
+            self.store.trim()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        """A job of this process, else one saved by another process; None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def _run(self, job, fn):
+        with job._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        job.save()
+        try:
+            result = fn(job)
+            with job._lock:
+                job.result = result
+                job.status = "succeeded"
+        except Exception as e:
+            traceback.print_exc()
+            with job._lock:
+                job.error = str(e)
+                job.status = "failed"
+        finally:
+            with job._lock:
+                job.finished_at = time.time()
+            job.save()
+
+    def _trim(self):
+        # Forget the oldest finished jobs once the history is full
+        excess = len(self._jobs) - self._max_history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished_at is not None:
+                del self._jobs[job_id]
+                excess -= 1
@@ -0,0 +1,160 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+
+# In-process BM25 index over the same chunks as the Chroma collection.
+# Dense MiniLM retrieval misses exact terms such as "401(k)", "Roth IRA" or
+# account names; this index catches them and is fused with the vector results
+# by reciprocal rank fusion. It is maintained incrementally by ingestion under
+# the same stable chunk IDs and persisted next to the Chroma database.
+
+LEXICAL_INDEX_FILE = "lexical_index.pkl"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\([a-z0-9]+\))?")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its me my of on or our "
+    "should so that the their this to was we what when where which who why will with you your".split()
+)
+
+def tokenize(text):
+    """Lowercase word tokens; "401(k)" and "401k" both become "401k"."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.replace("(", "").replace(")", "")
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+def index_path_for(chroma_path):
+    return os.path.join(chroma_path, LEXICAL_INDEX_FILE)
+
+class LexicalIndex:
+    """BM25 inverted index keyed by chunk ID."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}       # id -> (text, metadata, length)
+        self.postings = {}   # term -> {id: term frequency}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, ids, texts, metadatas):
+        """Insert or replace chunks."""
+        self.remove([chunk_id for chunk_id in ids if chunk_id in self.docs])
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self.docs[chunk_id] = (text, metadata or {}, length)
+            self.total_length += length
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def remove(self, ids):
+        for chunk_id in ids:
+            entry = self.docs.pop(chunk_id, None)
+            if entry is None:
+                continue
+            text, _, length = entry
+            self.total_length -= length
+            for term in set(tokenize(text)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def clear(self):
+        self.docs.clear()
+        self.postings.clear()
+        self.total_length = 0
+
+    def search(self, query, k=3):
+        """Top-k (Document, score) pairs by BM25; only the query terms' postings are touched."""
+        n = len(self.docs)
+        if n == 0:
+            return []
+        average_length = self.total_length / n or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                length = self.docs[chunk_id][2]
+                norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            (Document(page_content=self.docs[chunk_id][0], metadata=dict(self.docs[chunk_id][1])), score)
+            for chunk_id, score in best
+        ]
+
+    def save(self, path):
+        """Atomically persist the index."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": 1, "k1": self.k1, "b": self.b, "docs": self.docs,
+                         "postings": self.postings, "total_length": self.total_length},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a persisted index, or None if there is none."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Ignoring unreadable lexical index {path}: {e}")
+            return None
+        index = cls(k1=state["k1"], b=state["b"])
+        index.docs = state["docs"]
+        index.postings = state["postings"]
+        index.total_length = state["total_length"]
+        return index
+
+class LexicalIndexHandle:
+    """Read side for the query path: reloads the persisted index when ingestion rewrites it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._index = LexicalIndex()
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._index = LexicalIndex.load(self.path) or LexicalIndex()
+                    self._mtime = mtime
+        return self._index
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=60):
+    """Fuse ranked lists of Documents into (Document, fused score) pairs.
+
+    Identical chunk text counts as the same result.
+    """
+    scores, documents = {}, {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document.page_content
+            documents.setdefault(key, document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [(documents[key], scores[key]) for key in ranked]
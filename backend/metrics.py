@@ -0,0 +1,161 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics with Prometheus text exposition.
+# Counters and histograms are cheap enough for the hot path (a lock and a
+# bisect per observation). Values are per process; with several gunicorn
+# workers each one reports its own series.
+#
+# timer(stage) feeds the stage histogram and, when a request has called
+# start_request_timings(), also records the stage duration for that request.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, ("le", repr(float(bound))))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """collector() returns [(name, type, documentation, [(labels dict, value), ...]), ...]."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "advisor_http_requests_total", "HTTP requests by endpoint and status code.", ["endpoint", "status"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "advisor_http_request_seconds", "HTTP request latency by endpoint.", ["endpoint"]))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "advisor_stage_seconds", "Latency of query and ingestion pipeline stages.", ["stage"]))
+ERRORS = REGISTRY.register(Counter(
+    "advisor_errors_total", "Errors by pipeline stage.", ["stage"]))
+JSON_DECODE_FAILURES = REGISTRY.register(Counter(
+    "advisor_manager_json_decode_failures_total", "Manager LLM replies that were not valid JSON."))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "advisor_context_tokens", "Estimated tokens of assembled knowledge-base context per query.",
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 4096)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "advisor_query_cache_requests_total", "Query cache lookups by result (exact, semantic, miss).", ["result"]))
+
+def start_request_timings():
+    """Begin collecting stage timings for the current request; returns the dict."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def request_timings():
+    """Stage timings recorded so far for the current request, in milliseconds."""
+    timings = _request_timings.get()
+    return {stage: round(seconds * 1000, 2) for stage, seconds in (timings or {}).items()}
+
+@contextmanager
+def timer(stage):
+    """Time a pipeline stage into the stage histogram and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def render():
+    return REGISTRY.render()
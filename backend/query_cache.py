@@ -0,0 +1,168 @@
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Response and retrieval cache for /query.
+# Tier 1 is an exact match on the normalized query text and can serve the whole
+# response. Tier 2 (optional) matches near-duplicate queries by cosine
+# similarity of their embeddings and reuses routing plus retrieved context, so
+# only the advisor call runs again. Answers that depend on web search expire
+# quickly; RAG-only and general answers live longer. Every entry records the
+# index generation it was built against, and entries that used the knowledge
+# base are dropped as soon as the generation changes (i.e. after ingestion).
+
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 1000))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 3600))
+QUERY_CACHE_WEB_TTL = float(os.environ.get("QUERY_CACHE_WEB_TTL", 300))
+QUERY_CACHE_SEMANTIC = os.environ.get("QUERY_CACHE_SEMANTIC", "0") == "1"
+QUERY_CACHE_SIMILARITY = float(os.environ.get("QUERY_CACHE_SIMILARITY", 0.95))
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a query used as the exact-match key."""
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip(" ?!.")
+
+class CacheEntry:
+    """Routing, retrieved context and (optionally) the advisor answer for one query."""
+
+    def __init__(self, manager_json, routing, web_links, retrieval_status,
+                 advisor_response, expires_at, embedding=None):
+        self.manager_json = manager_json
+        self.routing = routing
+        self.web_links = web_links
+        self.retrieval_status = retrieval_status
+        self.advisor_response = advisor_response
+        self.expires_at = expires_at
+        self.embedding = embedding
+
+    @property
+    def uses_rag(self):
+        return self.manager_json.get("RAG_needed") == "yes"
+
+class QueryCache:
+    """LRU of CacheEntry objects with an exact tier and an optional semantic tier."""
+
+    def __init__(self, embeddings=None, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_TTL,
+                 web_ttl=QUERY_CACHE_WEB_TTL, semantic=QUERY_CACHE_SEMANTIC,
+                 similarity=QUERY_CACHE_SIMILARITY):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.web_ttl = web_ttl
+        self.semantic = semantic and embeddings is not None
+        self.similarity = similarity
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._matrix = None  # Stacked normalized embeddings for the semantic tier
+        self._matrix_keys = []
+        self._matrix_expires = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _embed(self, query):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_generation(self, generation):
+        # A new index generation invalidates everything that used the knowledge base
+        if generation != self._generation:
+            if self._generation is not None:
+                self._drop([key for key, entry in self._entries.items() if entry.uses_rag])
+            self._generation = generation
+
+    def _drop(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            self._matrix = None
+
+    def _semantic_match(self, vector, now):
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry.embedding is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[key].embedding for key in self._matrix_keys])
+            self._matrix_expires = np.array([self._entries[key].expires_at for key in self._matrix_keys])
+        # Expired entries are masked out first, so a stale best match cannot hide a live one
+        scores = np.where(self._matrix_expires > now, self._matrix @ vector, -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self._entries.get(self._matrix_keys[best])
+
+    def _exact_match(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._drop([key])
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits["exact"] += 1
+        return entry
+
+    def lookup(self, query, generation):
+        """Return (entry, tier) for a cached query, or (None, None).
+
+        The returned entry is a copy; tier is "exact" or "semantic". The query is
+        embedded only after the exact tier misses, and outside the lock.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._sync_generation(generation)
+            entry = self._exact_match(key, time.time())
+            if entry is not None:
+                return copy.deepcopy(entry), "exact"
+            if not self.semantic:
+                self.misses += 1
+                return None, None
+        vector = self._embed(query)
+        with self._lock:
+            self._sync_generation(generation)
+            now = time.time()
+            # The same query may have been stored while it was being embedded
+            entry = self._exact_match(key, now)
+            if entry is not None:
+                return copy.deepcopy(entry), "exact"
+            entry = self._semantic_match(vector, now)
+            if entry is not None:
+                self.hits["semantic"] += 1
+                return copy.deepcopy(entry), "semantic"
+            self.misses += 1
+            return None, None
+
+    def store(self, query, manager_json, routing, web_links, retrieval_status,
+              advisor_response, generation):
+        """Cache the result of a fully answered query."""
+        uses_websearch = manager_json.get("websearch_needed") == "yes"
+        entry = CacheEntry(
+            manager_json=copy.deepcopy(manager_json),
+            routing=copy.deepcopy(routing),
+            web_links=web_links,
+            retrieval_status=dict(retrieval_status),
+            advisor_response=advisor_response,
+            expires_at=time.time() + (self.web_ttl if uses_websearch else self.ttl),
+            embedding=self._embed(query) if self.semantic else None
+        )
+        key = normalize_query(query)
+        with self._lock:
+            self._sync_generation(generation)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits_exact": self.hits["exact"],
+                "hits_semantic": self.hits["semantic"],
+                "misses": self.misses,
+            }
@@ -0,0 +1,215 @@
+import math
+import os
+import re
+import threading
+
+# Local query routing.
+# Decides the two Manager LLM flags (RAG_needed, websearch_needed) without an
+# upstream call when a local router is confident enough. Routers are tried in
+# order; when none reaches ROUTER_MIN_CONFIDENCE the caller falls back to the
+# Manager LLM.
+#
+# ROUTER_MODE:
+#   hybrid - local routers first, Manager LLM when confidence is low (default)
+#   local  - always use the most confident local decision
+#   llm    - always ask the Manager LLM
+
+ROUTER_MODE = os.environ.get("ROUTER_MODE", "hybrid")
+ROUTER_MIN_CONFIDENCE = float(os.environ.get("ROUTER_MIN_CONFIDENCE", 0.8))
+ROUTER_EMBEDDINGS = os.environ.get("ROUTER_EMBEDDINGS", "0") == "1"
+
+class RouteDecision:
+    """A routing decision and where it came from."""
+
+    def __init__(self, rag_needed, websearch_needed, confidence, source):
+        self.rag_needed = rag_needed
+        self.websearch_needed = websearch_needed
+        self.confidence = confidence
+        self.source = source
+
+    def to_manager_json(self, query):
+        """The same JSON shape the Manager LLM produces."""
+        return {
+            "RAG_needed": "yes" if self.rag_needed else "no",
+            "websearch_needed": "yes" if self.websearch_needed else "no",
+            "prompt": query,
+            "context": ""
+        }
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "confidence": round(self.confidence, 3),
+            "RAG_needed": "yes" if self.rag_needed else "no",
+            "websearch_needed": "yes" if self.websearch_needed else "no"
+        }
+
+def _pattern(words):
+    return re.compile(r"\b(?:" + "|".join(words) + r")\b", re.IGNORECASE)
+
+# Greetings and acknowledgements: the only queries without finance terms that skip the Manager LLM
+GREETING = re.compile(
+    r"^\s*(?:(?:hi|hello|hey)(?: there)?|thanks|thank you(?: so much)?|thx|ty|"
+    r"good (?:morning|afternoon|evening|night)|bye|goodbye|see you|ok(?:ay)?|cool|great|nice|"
+    r"awesome|perfect|got it|sounds good|makes sense|sure|yes|no|yep|nope)[\s!.?]*$",
+    re.IGNORECASE
+)
+FINANCE_TERMS = _pattern([
+    r"budget\w*", r"sav(?:e|es|ing|ings)", r"invest\w*", r"debts?", r"loans?", r"401\(?k\)?",
+    r"(?:roth )?ira", r"expens\w*", r"income", r"spend\w*", r"retire\w*", r"credit", r"mortgage\w*",
+    r"tax\w*", r"emergency fund", r"money", r"financ\w*", r"habits?", r"salary", r"pension",
+    r"portfolio", r"stocks?", r"bonds?", r"etfs?", r"mutual funds?", r"interest", r"rent", r"bills?",
+    r"net worth", r"cash ?flow", r"insurance", r"dividends?", r"crypto\w*", r"bitcoin",
+    r"inflation", r"(?:index |hedge )?funds?", r"roth", r"apr", r"apy", r"compound\w*", r"annuit\w*",
+    r"equit(?:y|ies)", r"assets?", r"wealth", r"econom\w*", r"recession", r"brokerage", r"paychecks?",
+    r"wages?", r"fico", r"refinanc\w*", r"capital gains?", r"deductibles?", r"hsa", r"banks?", r"banking",
+    r"payments?", r"pay off", r"afford\w*", r"costs?", r"prices?", r"fees?", r"shares?", r"markets?",
+    r"currenc(?:y|ies)", r"dollars?"
+])
+# Outside the \b...\b wrapper: "$" is not a word character, so "\b$500" never matches after a space
+DOLLAR_AMOUNT = re.compile(r"\$\s?\d[\d,.]*")
+REALTIME_TERMS = _pattern([
+    r"today", r"tonight", r"current(?:ly)?", r"latest", r"right now", r"recent(?:ly)?",
+    r"news", r"this (?:week|month|year|quarter)", r"yesterday", r"price of", r"trading at",
+    r"forecast", r"20[2-3]\d"
+])
+
+class KeywordRouter:
+    """Regex rules over the query text; decides in microseconds."""
+
+    name = "keywords"
+
+    def route(self, query):
+        text = query.strip()
+        if not text:
+            return RouteDecision(False, False, 1.0, self.name)
+        if GREETING.match(text):
+            return RouteDecision(False, False, 0.95, self.name)
+        finance_hits = len(FINANCE_TERMS.findall(text)) + len(DOLLAR_AMOUNT.findall(text))
+        realtime_hits = len(REALTIME_TERMS.findall(text))
+        if finance_hits == 0:
+            # Not obviously financial, but it may use a term the list lacks ("What is
+            # a 529?", "plan for college"), so the Manager LLM decides
+            return RouteDecision(False, realtime_hits > 0, 0.3, self.name)
+        confidence = min(0.95, 0.8 + 0.05 * finance_hits)
+        return RouteDecision(True, realtime_hits > 0, confidence, self.name)
+
+class EmbeddingRouter:
+    """Nearest-centroid classifier over the embedding model the app already loads.
+
+    Example queries for each label are embedded once; a query is routed by its
+    cosine similarity to the label centroids, and the margin sets confidence.
+    """
+
+    name = "embeddings"
+
+    FINANCE_EXAMPLES = [
+        "How should I budget my monthly income?",
+        "What are good savings habits?",
+        "Should I invest in index funds or pay off debt?",
+        "How much should I put in my 401(k)?",
+        "What is my money flow pattern?",
+        "How do I build an emergency fund?",
+    ]
+    GENERAL_EXAMPLES = [
+        "Hello there",
+        "What's the weather like?",
+        "Tell me a joke",
+        "Who are you?",
+        "Thanks for the help",
+        "What is the capital of France?",
+    ]
+    REALTIME_EXAMPLES = [
+        "What is the stock price of Apple today?",
+        "Latest financial news this week",
+        "Current mortgage interest rates",
+        "How is the market doing right now?",
+    ]
+    STATIC_EXAMPLES = [
+        "How do I make a budget?",
+        "What is compound interest?",
+        "Explain how a Roth IRA works",
+        "Tips to reduce spending",
+    ]
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def _centroid(self, texts):
+        vectors = self.embeddings.embed_documents(texts)
+        centroid = [sum(values) / len(vectors) for values in zip(*vectors)]
+        return _normalize(centroid)
+
+    def _load(self):
+        with self._lock:
+            if self._centroids is None:
+                self._centroids = {
+                    "finance": self._centroid(self.FINANCE_EXAMPLES),
+                    "general": self._centroid(self.GENERAL_EXAMPLES),
+                    "realtime": self._centroid(self.REALTIME_EXAMPLES),
+                    "static": self._centroid(self.STATIC_EXAMPLES),
+                }
+        return self._centroids
+
+    def warm_up(self):
+        """Embed the label examples now instead of on the first query."""
+        self._load()
+
+    def route(self, query):
+        centroids = self._load()
+        vector = _normalize(self.embeddings.embed_query(query))
+        finance_margin = _dot(vector, centroids["finance"]) - _dot(vector, centroids["general"])
+        realtime_margin = _dot(vector, centroids["realtime"]) - _dot(vector, centroids["static"])
+        confidence = min(_margin_confidence(finance_margin), _margin_confidence(realtime_margin))
+        return RouteDecision(finance_margin > 0, realtime_margin > 0, confidence, self.name)
+
+def _dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+def _normalize(vector):
+    norm = math.sqrt(_dot(vector, vector)) or 1.0
+    return [x / norm for x in vector]
+
+def _margin_confidence(margin):
+    # A 0.1 cosine margin between centroids is treated as a confident call
+    return min(1.0, 0.5 + 5 * abs(margin))
+
+class QueryRouter:
+    """Tries local routers in order and returns a confident decision, or None."""
+
+    def __init__(self, routers, mode=ROUTER_MODE, min_confidence=ROUTER_MIN_CONFIDENCE):
+        self.routers = routers
+        self.mode = mode
+        self.min_confidence = min_confidence
+
+    def warm_up(self):
+        for router in self.routers:
+            if hasattr(router, "warm_up"):
+                router.warm_up()
+
+    def route(self, query):
+        if self.mode == "llm":
+            return None
+        best = None
+        for router in self.routers:
+            try:
+                decision = router.route(query)
+            except Exception as e:
+                print(f"Router {router.name} failed: {e}")
+                continue
+            if decision is None:
+                continue
+            if decision.confidence >= self.min_confidence:
+                return decision
+            if best is None or decision.confidence > best.confidence:
+                best = decision
+        return best if self.mode == "local" else None
+
+def build_router(embeddings=None):
+    """Router configured from the environment."""
+    routers = [KeywordRouter()]
+    if ROUTER_EMBEDDINGS and embeddings is not None:
+        routers.append(EmbeddingRouter(embeddings))
+    return QueryRouter(routers)
@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from flask import Response, send_file
+
+# Static frontend assets (the Vite build in dist/), scanned once and served
+# from memory so asset requests do no filesystem work:
+#   - each file gets a strong ETag (content hash) and a 304 on If-None-Match,
+#   - text types are stored gzip- and, when the brotli package is installed,
+#     brotli-compressed; .gz/.br files the build already wrote are used as is,
+#   - hashed bundle names (assets/index-3f9a1c2b.js) are cached by browsers
+#     for a year as immutable; everything else (index.html) is revalidated.
+#
+#   STATIC_MEMORY_MAX_BYTES   files above this stay on disk (still with ETags)
+#   STATIC_MIN_COMPRESS_BYTES smaller files are not worth compressing
+#   STATIC_GZIP_LEVEL / STATIC_BROTLI_QUALITY
+#
+# The scan runs in the startup warm-up (or on the first asset request), so a
+# rebuilt frontend is picked up when the workers restart.
+
+STATIC_MEMORY_MAX_BYTES = int(os.environ.get("STATIC_MEMORY_MAX_BYTES", 8 * 1024 * 1024))
+STATIC_MIN_COMPRESS_BYTES = int(os.environ.get("STATIC_MIN_COMPRESS_BYTES", 1024))
+STATIC_GZIP_LEVEL = int(os.environ.get("STATIC_GZIP_LEVEL", 9))
+STATIC_BROTLI_QUALITY = int(os.environ.get("STATIC_BROTLI_QUALITY", 11))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Vite's default output names: <name>-<8+ char content hash>.<ext> under assets/
+HASHED_NAME = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "application/wasm", "application/manifest+json")
+MIME_OVERRIDES = {".js": "application/javascript", ".mjs": "application/javascript",
+                  ".css": "text/css", ".html": "text/html", ".svg": "image/svg+xml",
+                  ".json": "application/json", ".webmanifest": "application/manifest+json",
+                  ".wasm": "application/wasm"}
+# Content-Encoding per precompressed suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+def load_brotli():
+    """The brotli module, or None; it is optional and only adds br variants."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def guess_mimetype(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in MIME_OVERRIDES:
+        return MIME_OVERRIDES[ext]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def accepted_encodings(header):
+    """Codings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted, refused = set(), set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(coding)
+    if "*" in accepted:
+        accepted |= {coding for coding, _ in ENCODINGS} - refused
+    return accepted
+
+def etag_matches(header, etag):
+    """If-None-Match comparison (weak, as RFC 9110 specifies for this header)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+class Asset:
+    """One file: identity bytes (or a disk path for large files) and its encoded variants."""
+
+    def __init__(self, path, mimetype, body, etag, immutable, variants=None):
+        self.path = path
+        self.mimetype = mimetype
+        self.body = body  # None when the file is served from disk
+        self.etag = etag
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        self.variants = variants or {}  # Content-Encoding -> (bytes, etag)
+
+class StaticAssets:
+    """In-memory index of a build directory, keyed by URL path relative to it."""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Scan the directory once; later calls return at once."""
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self.assets = self.scan()
+                    self.loaded = True
+                    print(f"Static assets: {len(self.assets)} files from {self.root}")
+        return self.assets
+
+    def scan(self):
+        brotli = load_brotli()
+        assets = {}
+        if not os.path.isdir(self.root):
+            return assets
+        for directory, _, files in os.walk(self.root):
+            names = set(files)
+            for name in files:
+                # Precompressed siblings are picked up with their source file
+                if any(name.endswith(suffix) and name[:-len(suffix)] in names for _, suffix in ENCODINGS):
+                    continue
+                full_path = os.path.join(directory, name)
+                key = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                assets[key] = self._build(key, full_path, names, brotli)
+        return assets
+
+    def _build(self, key, full_path, names, brotli):
+        mimetype = guess_mimetype(key)
+        immutable = bool(HASHED_NAME.match(key))
+        size = os.path.getsize(full_path)
+        if size > STATIC_MEMORY_MAX_BYTES:
+            digest = hashlib.sha256()
+            with open(full_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            return Asset(full_path, mimetype, None, f'"{digest.hexdigest()[:32]}"', immutable)
+
+        with open(full_path, "rb") as f:
+            body = f.read()
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        variants = {}
+        name = os.path.basename(full_path)
+        for coding, suffix in ENCODINGS:
+            if name + suffix in names:
+                with open(full_path + suffix, "rb") as f:
+                    variants[coding] = f.read()
+        if len(body) >= STATIC_MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+            if "gzip" not in variants:
+                # mtime=0 keeps the bytes identical across workers, as the strong ETag promises
+                variants["gzip"] = gzip.compress(body, compresslevel=STATIC_GZIP_LEVEL, mtime=0)
+            if "br" not in variants and brotli is not None:
+                variants["br"] = brotli.compress(body, quality=STATIC_BROTLI_QUALITY)
+        # Keep only encodings that actually save bytes; each gets its own strong ETag
+        variants = {
+            coding: (data, f'"{tag}-{coding}"')
+            for coding, data in variants.items() if len(data) < len(body)
+        }
+        return Asset(full_path, mimetype, body, f'"{tag}"', immutable, variants)
+
+    def get(self, path):
+        return self.load().get(path)
+
+    def response(self, request, path):
+        """Response for the asset at path (relative to the root), or None if there is none."""
+        asset = self.get(path)
+        if asset is None:
+            return None
+        if asset.body is None:
+            response = send_file(asset.path, mimetype=asset.mimetype, etag=asset.etag.strip('"'),
+                                 conditional=True)
+            response.headers["Cache-Control"] = asset.cache_control
+            return response
+
+        body, etag, coding = asset.body, asset.etag, None
+        if asset.variants:
+            accepted = accepted_encodings(request.headers.get("Accept-Encoding"))
+            for candidate, _ in ENCODINGS:
+                if candidate in accepted and candidate in asset.variants:
+                    coding = candidate
+                    body, etag = asset.variants[candidate]
+                    break
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status=304, headers=headers)
+        if coding:
+            headers["Content-Encoding"] = coding
+        return Response(body, mimetype=asset.mimetype, headers=headers)
+
+    def stats(self):
+        assets = list(self.assets.values())
+        return {
+            "files": len(assets),
+            "bytes": sum(len(asset.body) for asset in assets if asset.body is not None),
+            "variant_bytes": sum(len(data) for asset in assets for data, _ in asset.variants.values()),
+            "on_disk": sum(asset.body is None for asset in assets),
+        }
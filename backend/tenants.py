@@ -0,0 +1,283 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from creat_vec_database import manifest_path_for
+from lexical_index import LexicalIndexHandle, index_path_for
+from query_cache import QUERY_CACHE_MAX_ENTRIES, QueryCache
+from vector_store import open_vector_store, store_exists
+
+# Per-user knowledge bases.
+# Requests name their user with the X-User-Id header (or a user_id field).
+# Each user gets a document folder and a vector store of their own under
+# TENANTS_DIR/<user id>/, plus their own BM25 index and query cache. Requests
+# without a user ID use the original shared ./Doc folder and chroma store.
+#
+# Stores open on first use, once ingestion has created them, and are kept in
+# an LRU. Once more than TENANT_MAX_OPEN are open, their estimated size passes
+# TENANT_MEMORY_MB, or one has been idle for TENANT_IDLE_SECONDS, the least
+# recently used tenants are closed (checked whenever a tenant is acquired or
+# released, and every TENANT_SWEEP_SECONDS by a background thread). A tenant
+# that a request or ingestion job is using is never closed under it, and a
+# tenant being closed is not reopened until its store has been closed.
+#
+# The user ID is trusted as given; put the service behind something that
+# authenticates users and sets the header.
+
+TENANTS_DIR = os.environ.get("TENANTS_DIR", "tenants")
+TENANT_HEADER = "X-User-Id"
+TENANT_REQUIRED = os.environ.get("TENANT_REQUIRED", "0") == "1"
+TENANT_MAX_OPEN = int(os.environ.get("TENANT_MAX_OPEN", 64))
+TENANT_MEMORY_MB = float(os.environ.get("TENANT_MEMORY_MB", 1024))
+TENANT_IDLE_SECONDS = float(os.environ.get("TENANT_IDLE_SECONDS", 900))
+TENANT_SWEEP_SECONDS = float(os.environ.get("TENANT_SWEEP_SECONDS", 60))  # 0 disables the sweep
+TENANT_QUERY_CACHE_ENTRIES = int(os.environ.get("TENANT_QUERY_CACHE_ENTRIES", 200))
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.@-]{0,63}$")
+
+class InvalidUserId(ValueError):
+    """The request's user ID is missing (with TENANT_REQUIRED) or not usable as a folder name."""
+
+def normalize_user_id(value):
+    """The tenant key for a raw user ID; None selects the shared knowledge base."""
+    value = (value or "").strip()
+    if not value:
+        if TENANT_REQUIRED:
+            raise InvalidUserId(f"A user ID is required ({TENANT_HEADER} header or user_id field)")
+        return None
+    if not USER_ID_PATTERN.match(value) or ".." in value:
+        raise InvalidUserId("Invalid user ID: use up to 64 letters, digits and _ . @ -")
+    return value
+
+def tenant_paths(user_id, default_upload_folder, default_chroma_path):
+    """(upload folder, vector store path) of a tenant."""
+    if user_id is None:
+        return default_upload_folder, default_chroma_path
+    root = os.path.join(TENANTS_DIR, user_id)
+    return os.path.join(root, "Doc"), os.path.join(root, "chroma")
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class Tenant:
+    """One user's knowledge base: folder, vector store, BM25 index and query cache."""
+
+    def __init__(self, user_id, upload_folder, chroma_path, embeddings, query_cache_entries):
+        self.user_id = user_id
+        self.upload_folder = upload_folder
+        self.chroma_path = chroma_path
+        self.embeddings = embeddings
+        self.lexical_index = LexicalIndexHandle(index_path_for(chroma_path))
+        self.query_cache = QueryCache(embeddings, max_entries=query_cache_entries)
+        self.db = None
+        self.db_opened = False
+        self.size_bytes = 0  # On-disk size of the store, used as its memory estimate
+        self.last_used = time.monotonic()
+        self.active = 0  # Requests and jobs using the tenant; never evicted while non-zero
+        self._lock = threading.Lock()
+
+    def get_db(self):
+        """Return the vector store handle, opening it on first use.
+
+        None if it cannot be opened or nothing has been ingested yet; a store
+        is never created here, so unknown user IDs leave nothing on disk.
+        """
+        with self._lock:
+            if not self.db_opened:
+                if not self.has_store():
+                    return None  # Checked again on the next call, until ingestion creates it
+                try:
+                    self.db = open_vector_store(self.chroma_path, self.embeddings)
+                except Exception as e:
+                    print(f"Vector database for {self.user_id or 'default'} could not be opened: {e}")
+                    self.db = None
+                self.db_opened = True
+                self.size_bytes = directory_bytes(self.chroma_path)
+            return self.db
+
+    def has_store(self):
+        return store_exists(self.chroma_path) or os.path.exists(manifest_path_for(self.chroma_path))
+
+    def set_db(self, db):
+        with self._lock:
+            self.db = db
+            self.db_opened = True
+            self.size_bytes = directory_bytes(self.chroma_path)
+
+    def generation(self):
+        """Changes whenever ingestion rewrites the manifest; used to invalidate cached RAG answers."""
+        try:
+            return os.stat(manifest_path_for(self.chroma_path)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def close(self):
+        with self._lock:
+            if self.db is not None and hasattr(self.db, "close"):
+                self.db.close()
+            self.db = None
+            self.db_opened = False
+            self.size_bytes = 0
+
+class TenantRegistry:
+    """LRU of open tenants with a count cap, a memory cap and an idle timeout.
+
+    The shared default tenant is always open and not counted.
+    """
+
+    def __init__(self, embeddings, upload_folder, chroma_path, max_open=TENANT_MAX_OPEN,
+                 memory_mb=TENANT_MEMORY_MB, idle_seconds=TENANT_IDLE_SECONDS,
+                 query_cache_entries=TENANT_QUERY_CACHE_ENTRIES, sweep_seconds=TENANT_SWEEP_SECONDS):
+        self.embeddings = embeddings
+        self.upload_folder = upload_folder
+        self.chroma_path = chroma_path
+        self.max_open = max_open
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.idle_seconds = idle_seconds
+        self.sweep_seconds = sweep_seconds
+        self.query_cache_entries = query_cache_entries
+        # The shared knowledge base keeps the full-size query cache
+        self.default = Tenant(None, upload_folder, chroma_path, embeddings, QUERY_CACHE_MAX_ENTRIES)
+        self._tenants = OrderedDict()
+        self._closing = {}  # User ID -> Event set once that tenant's close has finished
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.opened = 0
+        self.evictions = 0
+
+    def paths(self, user_id):
+        return tenant_paths(user_id, self.upload_folder, self.chroma_path)
+
+    def acquire(self, user_id):
+        """Return the tenant for user_id, marked in use until release(); its store opens lazily."""
+        if user_id is None:
+            return self.default
+        while True:
+            with self._lock:
+                pending_close = self._closing.get(user_id)
+                if pending_close is None:
+                    tenant = self._tenants.get(user_id)
+                    if tenant is None:
+                        upload_folder, chroma_path = self.paths(user_id)
+                        tenant = self._tenants[user_id] = Tenant(
+                            user_id, upload_folder, chroma_path, self.embeddings, self.query_cache_entries
+                        )
+                        self.opened += 1
+                    else:
+                        self._tenants.move_to_end(user_id)
+                    tenant.active += 1
+                    tenant.last_used = time.monotonic()
+                    closing = self._evict()
+                    self._start_sweeper()
+                    break
+            # Evicted and still closing: opening its store again now would race the close
+            pending_close.wait()
+        self._close(closing)
+        return tenant
+
+    def release(self, tenant):
+        if tenant is self.default:
+            return
+        with self._lock:
+            tenant.active -= 1
+            tenant.last_used = time.monotonic()
+            closing = self._evict()
+        self._close(closing)
+
+    def sweep(self):
+        """Close idle tenants and tenants over the caps; also run periodically in the background."""
+        with self._lock:
+            closing = self._evict()
+        self._close(closing)
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_seconds)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Tenant sweep failed: {e}")
+
+    def _start_sweeper(self):
+        # Started on first use rather than in __init__, so that each forked worker runs its own
+        # (threads do not survive the fork). Call with the lock held
+        if self.sweep_seconds > 0 and (self._sweeper is None or not self._sweeper.is_alive()):
+            self._sweeper = threading.Thread(target=self._sweep_forever, name="tenant-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _close(self, tenants):
+        """Close evicted tenants outside the lock, then let waiting acquires reopen them."""
+        for tenant in tenants:
+            try:
+                tenant.close()
+            except Exception as e:
+                print(f"Knowledge base for {tenant.user_id} did not close cleanly: {e}")
+            finally:
+                with self._lock:
+                    self._closing.pop(tenant.user_id).set()
+
+    @contextmanager
+    def use(self, user_id):
+        tenant = self.acquire(user_id)
+        try:
+            yield tenant
+        finally:
+            self.release(tenant)
+
+    def _evict(self):
+        """Drop idle tenants and tenants over the caps, least recently used first.
+
+        Tenants in use are skipped, so the caps can be exceeded until they are
+        released. Call with the lock held; returns the tenants to close, which
+        acquire() will not reopen until _close() has finished with them.
+        """
+        now = time.monotonic()
+        total = sum(tenant.size_bytes for tenant in self._tenants.values())
+        closing = []
+        for user_id, tenant in list(self._tenants.items()):
+            over = len(self._tenants) > self.max_open or total > self.memory_bytes
+            idle = now - tenant.last_used > self.idle_seconds
+            if tenant.active or not (over or idle):
+                continue
+            del self._tenants[user_id]
+            total -= tenant.size_bytes
+            self.evictions += 1
+            self._closing[user_id] = threading.Event()
+            closing.append(tenant)
+        return closing
+
+    def open_tenants(self):
+        with self._lock:
+            return [self.default] + list(self._tenants.values())
+
+    def query_cache_stats(self):
+        """Query cache counters summed over the open knowledge bases (the default included).
+
+        Counters of evicted tenants go with them, so totals can drop.
+        """
+        totals = {"knowledge_bases": 0, "entries": 0, "max_entries": 0, "hits_exact": 0,
+                  "hits_semantic": 0, "misses": 0}
+        for tenant in self.open_tenants():
+            totals["knowledge_bases"] += 1
+            for field, value in tenant.query_cache.stats().items():
+                totals[field] += value
+        return totals
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._tenants),
+                "max_open": self.max_open,
+                "bytes": sum(tenant.size_bytes for tenant in self._tenants.values()),
+                "memory_limit_bytes": int(self.memory_bytes),
+                "opened": self.opened,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,82 @@
+import os
+import socket
+import sys
+import uuid
+import pytest
+
+# Tests import the backend modules the way gunicorn does: from the backend folder
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Read at import time by the modules under test
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("STARTUP_MODE", "lazy")
+os.environ.setdefault("VECTOR_STORE", "numpy")
+os.environ.setdefault("SERPAPI_API_KEY", "test-serpapi-key")
+
+@pytest.fixture(scope="session")
+def advisor(tmp_path_factory):
+    """The app module, imported in a scratch directory with fake embeddings and a fake Gemini model."""
+    import embedding_service
+    from benchmarks.fakes import FakeEmbeddings, FakeGenerativeModel
+
+    workdir = tmp_path_factory.mktemp("advisor")
+    previous = os.getcwd()
+    os.chdir(workdir)  # The app keeps its stores, uploads and caches relative to the working directory
+    embedding_service.create_embeddings = lambda model_name, engine=None: FakeEmbeddings()
+    import app
+    app.model = FakeGenerativeModel(latency="fixed:0", token_latency="fixed:0")
+    yield app
+    os.chdir(previous)
+
+@pytest.fixture
+def client(advisor):
+    return advisor.app.test_client()
+
+def new_user_id():
+    return f"test-{uuid.uuid4().hex[:12]}"
+
+@pytest.fixture
+def user_id(advisor):
+    """A knowledge base of its own for the test, with no documents."""
+    return new_user_id()
+
+@pytest.fixture
+def user_with_documents(advisor):
+    """A knowledge base of its own for the test, with a few ingested documents."""
+    from benchmarks.corpus import generate_corpus
+    from creat_vec_database import NullProgress
+
+    user_id = new_user_id()
+    generate_corpus(advisor.tenants.paths(user_id)[0], 3, paragraphs=(4, 8), seed=1)
+    advisor.ingest_documents(NullProgress(), user_id)
+    return user_id
+
+class RecordingModel:
+    """Wraps the fake Gemini model and keeps every prompt it was sent."""
+
+    def __init__(self, model):
+        self.model = model
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return self.model.generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return await self.model.generate_content_async(prompt, **kwargs)
+
+@pytest.fixture
+def recording_model(advisor, monkeypatch):
+    model = RecordingModel(advisor.model)
+    monkeypatch.setattr(advisor, "model", model)
+    return model
+
+@pytest.fixture
+def closed_port_url():
+    """A SerpAPI URL nothing listens on, so every search fails to connect."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/search"
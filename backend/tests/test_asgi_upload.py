@@ -0,0 +1,38 @@
+import pytest
+
+BOUNDARY = "advisor-test-boundary"
+
+@pytest.fixture
+def asgi_client(advisor, monkeypatch):
+    from starlette.testclient import TestClient
+    import asgi
+
+    monkeypatch.setitem(advisor.app.config, "MAX_CONTENT_LENGTH", 4096)
+    return TestClient(asgi.app)
+
+def multipart(filename, size):
+    head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"document\"; filename=\"{filename}\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n").encode()
+    return head + b"x" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+def chunked(body, size=1024):
+    # A generator body is sent with Transfer-Encoding: chunked and no Content-Length
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def post(client, body, user_id):
+    return client.post("/upload", content=body, headers={
+        "Content-Type": f"multipart/form-data; boundary={BOUNDARY}", "X-User-Id": user_id})
+
+def test_chunked_upload_past_the_limit_is_rejected(asgi_client, user_id):
+    response = post(asgi_client, chunked(multipart("big.docx", 64 * 1024)), user_id)
+    assert response.status_code == 413
+    assert response.json() == {"success": False, "message": "File too large (16MB max)"}
+
+def test_declared_length_past_the_limit_is_rejected(asgi_client, user_id):
+    assert post(asgi_client, multipart("big.docx", 64 * 1024), user_id).status_code == 413
+
+def test_chunked_upload_within_the_limit_is_read(asgi_client, user_id):
+    response = post(asgi_client, chunked(multipart("notes.txt", 512)), user_id)
+    assert response.status_code == 200
+    assert response.json()["message"] == "Invalid file type. Please upload a .docx file"
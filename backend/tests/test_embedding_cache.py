@@ -0,0 +1,49 @@
+import sqlite3
+from embedding_cache import EmbeddingCache
+
+def vectors(*keys):
+    return {key: [float(i), 1.0] for i, key in enumerate(keys)}
+
+def last_used(path, key):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT last_used FROM embeddings WHERE key = ?", (key,)).fetchone()[0]
+
+def test_hits_do_not_write_until_the_touch_interval(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, touch_interval=3600)
+    cache.put_many(vectors("a", "b"))
+    stored = last_used(path, "a")
+    changes = cache._conn.total_changes
+    assert cache.get_many(["a", "b", "c"]) == vectors("a", "b")
+    assert cache._conn.total_changes == changes
+    assert not cache._conn.in_transaction
+    assert last_used(path, "a") == stored
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+def test_hits_are_written_back_once_the_interval_has_passed(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, touch_interval=0)
+    cache.put_many(vectors("a"))
+    stored = last_used(path, "a")
+    cache.get_many(["a"])
+    assert last_used(path, "a") > stored
+
+def test_recent_hits_survive_eviction(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, max_entries=10, touch_interval=3600)
+    cache.put_many(vectors(*"abcdefghij"))
+    cache.get_many(["a"])  # Pending in memory; the next insert writes it back before evicting
+    cache.put_many(vectors("k"))
+    remaining = cache.get_many(list("abcdefghijk"))
+    assert len(remaining) == 9
+    assert "a" in remaining and "k" in remaining
+
+def test_workers_sharing_the_file_stay_within_max_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = EmbeddingCache(path, max_entries=10), EmbeddingCache(path, max_entries=10)
+    first.put_many(vectors(*"abcdefgh"))
+    second.put_many(vectors(*"stuvwxyz"))
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] <= 10
+    assert second.stats()["entries"] == 9
+    assert second.stats()["evictions"] == 7
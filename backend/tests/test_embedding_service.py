@@ -0,0 +1,63 @@
+import socket
+import tempfile
+import threading
+import time
+import pytest
+from benchmarks.fakes import FakeEmbeddings
+from embedding_service import EmbeddingServer, RemoteEmbeddings, wait_for_socket
+
+class SlowEmbeddings(FakeEmbeddings):
+    """Counts model calls and takes `delay` seconds for each."""
+
+    def __init__(self, delay):
+        super().__init__(dimension=8)
+        self.delay = delay
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.delay)
+        return super().embed_documents(texts)
+
+@pytest.fixture
+def serve():
+    # Unix socket paths are limited to ~100 bytes, so not under pytest's tmp_path
+    directory = tempfile.TemporaryDirectory(dir="/tmp")
+    servers = []
+
+    def start(embeddings):
+        server = EmbeddingServer(embeddings, f"{directory.name}/embed.sock", batch_wait=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        assert wait_for_socket(server.socket_path, timeout=5)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+    directory.cleanup()
+
+def test_stale_connection_is_replaced(serve):
+    server = serve(SlowEmbeddings(delay=0))
+    client = RemoteEmbeddings(server.socket_path)
+    stale, peer = socket.socketpair(socket.AF_UNIX)
+    peer.close()  # Like a service that restarted since the connection was made
+    client._local.sock = stale
+    assert len(client.embed_documents(["a", "b"])) == 2
+    assert client._local.sock is not stale
+
+def test_timeout_is_not_retried(serve):
+    embeddings = SlowEmbeddings(delay=0.5)
+    client = RemoteEmbeddings(serve(embeddings).socket_path, timeout=0.1)
+    with pytest.raises(socket.timeout):
+        client.embed_documents(["slow"])
+    time.sleep(0.6)
+    assert embeddings.calls == 1
+    assert client._local.sock is None  # A late reply must not be read as the next answer
+    client.timeout = 5
+    assert len(client.embed_documents(["next"])) == 1
+
+def test_missing_service_fails_after_one_reconnect():
+    client = RemoteEmbeddings("/tmp/no-such-embedding-service.sock")
+    with pytest.raises(FileNotFoundError):
+        client.embed_query("anyone there?")
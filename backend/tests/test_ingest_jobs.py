@@ -0,0 +1,85 @@
+import subprocess
+import sys
+import time
+from conftest import BACKEND_DIR
+from creat_vec_database import ingestion_lock
+from ingest_jobs import IngestionQueue, JobStore
+
+def wait_finished(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job is not None and job.finished_at is not None:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_job_state_is_visible_to_another_worker(tmp_path):
+    accepting = IngestionQueue(store=JobStore(str(tmp_path)))
+    other = IngestionQueue(store=JobStore(str(tmp_path)))
+    job = accepting.submit(lambda job: {"added": 1}, filename="a.docx", owner="alice")
+    wait_finished(accepting, job.id)
+
+    seen = other.get(job.id)
+    assert seen.owner == "alice"
+    assert seen.to_dict()["status"] == "succeeded"
+    assert seen.to_dict()["result"] == {"added": 1}
+    assert seen.to_dict()["filename"] == "a.docx"
+
+def test_failed_job_is_reported_by_another_worker(tmp_path):
+    accepting = IngestionQueue(store=JobStore(str(tmp_path)))
+    other = IngestionQueue(store=JobStore(str(tmp_path)))
+
+    def fail(job):
+        raise ValueError("not a docx file")
+
+    job = accepting.submit(fail)
+    wait_finished(accepting, job.id)
+    state = other.get(job.id).to_dict()
+    assert state["status"] == "failed"
+    assert state["error"] == "not a docx file"
+
+def test_unknown_and_malformed_job_ids(tmp_path):
+    queue = IngestionQueue(store=JobStore(str(tmp_path)))
+    assert queue.get("0" * 32) is None
+    assert queue.get("../../etc/passwd") is None
+
+def test_store_trims_oldest_finished_jobs(tmp_path):
+    store = JobStore(str(tmp_path), max_history=3)
+    queue = IngestionQueue(store=store)
+    ids = []
+    for _ in range(5):
+        job = queue.submit(lambda job: None)
+        wait_finished(queue, job.id)
+        ids.append(job.id)
+    store.trim()
+    assert [store.load(job_id) is not None for job_id in ids] == [False, False, True, True, True]
+
+def test_ingestion_lock_excludes_other_processes(tmp_path):
+    script = (
+        f"import sys, time; sys.path.insert(0, {BACKEND_DIR!r})\n"
+        "from creat_vec_database import ingestion_lock\n"
+        f"with ingestion_lock({str(tmp_path)!r}):\n"
+        "    print('locked', flush=True)\n"
+        "    time.sleep(1.0)\n"
+    )
+    holder = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        start = time.monotonic()
+        with ingestion_lock(str(tmp_path)):
+            waited = time.monotonic() - start
+    finally:
+        holder.wait(timeout=30)
+    assert waited > 0.5
+
+def test_jobs_endpoint_answers_for_jobs_accepted_by_another_worker(advisor, client, monkeypatch):
+    job = advisor.ingestion_queue.submit(lambda job: {"added": 0}, filename="x.docx", owner="alice")
+    wait_finished(advisor.ingestion_queue, job.id)
+    # A second worker: same job directory, no jobs of its own in memory
+    monkeypatch.setattr(advisor, "ingestion_queue", IngestionQueue(store=JobStore()))
+
+    response = client.get(f"/jobs/{job.id}", headers={"X-User-Id": "alice"})
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "succeeded"
+    assert client.get(f"/jobs/{job.id}", headers={"X-User-Id": "bob"}).status_code == 404
@@ -0,0 +1,76 @@
+import os
+from langchain_core.documents import Document
+from lexical_index import LexicalIndex, LexicalIndexHandle, reciprocal_rank_fusion, tokenize
+
+CHUNKS = {
+    "roth": "A Roth IRA is funded with after-tax dollars and grows tax free.",
+    "401k": "Your employer may match contributions to a 401(k) plan up to a limit.",
+    "budget": "A monthly budget splits income between needs, wants and savings.",
+    "emergency": "Keep an emergency fund of three to six months of expenses in savings.",
+}
+
+def build(chunks=CHUNKS):
+    index = LexicalIndex()
+    index.add(list(chunks), list(chunks.values()), [{"source": chunk_id} for chunk_id in chunks])
+    return index
+
+def sources(results):
+    return [document.metadata["source"] for document, _ in results]
+
+def test_tokenize_drops_stopwords_and_joins_parenthesized_suffixes():
+    assert tokenize("What is a 401(k) or a Roth IRA?") == ["401k", "roth", "ira"]
+
+def test_exact_terms_rank_their_chunk_first():
+    index = build()
+    assert sources(index.search("401k match", k=2))[0] == "401k"
+    assert sources(index.search("Roth IRA", k=1)) == ["roth"]
+    assert index.search("cryptocurrency", k=3) == []
+    assert LexicalIndex().search("anything") == []
+
+def test_rarer_terms_weigh_more():
+    results = build().search("savings emergency", k=2)
+    assert sources(results) == ["emergency", "budget"]
+    assert results[0][1] > results[1][1]
+
+def test_remove_and_replace_keep_postings_consistent():
+    index = build()
+    index.remove(["roth", "missing"])
+    assert len(index) == 3
+    assert index.search("roth", k=3) == []
+    index.add(["budget"], ["Track every expense for a month."], [{"source": "budget"}])
+    assert len(index) == 3
+    assert index.search("wants", k=3) == []
+    assert sources(index.search("expense", k=3)) == ["budget"]
+    assert index.total_length == sum(length for _, _, length in index.docs.values())
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "index" / "lexical_index.pkl")
+    index = build()
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+    assert len(loaded) == len(index)
+    assert sources(loaded.search("401k", k=1)) == ["401k"]
+    assert LexicalIndex.load(str(tmp_path / "missing.pkl")) is None
+
+def test_unreadable_index_loads_as_none(tmp_path):
+    path = tmp_path / "lexical_index.pkl"
+    path.write_bytes(b"not a pickle")
+    assert LexicalIndex.load(str(path)) is None
+
+def test_handle_reloads_when_the_file_changes(tmp_path):
+    path = str(tmp_path / "lexical_index.pkl")
+    handle = LexicalIndexHandle(path)
+    assert len(handle.get()) == 0
+    build({"roth": CHUNKS["roth"]}).save(path)
+    assert len(handle.get()) == 1
+    build().save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert len(handle.get()) == len(CHUNKS)
+
+def test_reciprocal_rank_fusion_favours_results_in_both_lists():
+    a, b, c = (Document(page_content=text) for text in ("a", "b", "c"))
+    fused = reciprocal_rank_fusion([[a, b], [Document(page_content="b"), c]], k=3)
+    assert [document.page_content for document, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+    assert len(reciprocal_rank_fusion([[a, b, c]], k=2)) == 2
@@ -0,0 +1,118 @@
+import time
+import pytest
+from query_cache import QueryCache, normalize_query
+
+REALTIME_QUERY = "What is the latest news on stock prices today?"
+RAG_QUERY = "How should I budget my monthly income?"
+RAG_ONLY = {"RAG_needed": "yes", "websearch_needed": "no"}
+GENERAL = {"RAG_needed": "no", "websearch_needed": "no"}
+OK = {"rag": "ok", "websearch": "skipped"}
+
+def store(cache, query, manager_json=RAG_ONLY, generation="g1", answer="answer"):
+    cache.store(query, dict(manager_json), {}, "", OK, answer, generation)
+
+def post_twice(client, user_id, query):
+    headers = {"X-User-Id": user_id}
+    first = client.post("/query", json={"query": query}, headers=headers)
+    second = client.post("/query", json={"query": query}, headers=headers)
+    assert first.status_code == second.status_code == 200
+    return first, second
+
+def test_exact_hit_ignores_case_whitespace_and_trailing_punctuation():
+    cache = QueryCache()
+    store(cache, "How do I  save money?")
+    entry, tier = cache.lookup("how do i save money", "g1")
+    assert tier == "exact" and entry.advisor_response == "answer"
+    assert normalize_query(" How do I\tsave money?! ") == "how do i save money"
+    assert cache.stats()["hits_exact"] == 1
+
+def test_new_generation_drops_only_knowledge_base_answers():
+    cache = QueryCache()
+    store(cache, "rag question")
+    store(cache, "general question", manager_json=GENERAL)
+    assert cache.lookup("rag question", "g2") == (None, None)
+    assert cache.lookup("general question", "g2")[1] == "exact"
+
+def test_web_answers_use_the_short_ttl():
+    cache = QueryCache(ttl=3600, web_ttl=0.05)
+    store(cache, "web question", manager_json={"RAG_needed": "no", "websearch_needed": "yes"})
+    store(cache, "rag question")
+    time.sleep(0.1)
+    assert cache.lookup("web question", "g1") == (None, None)
+    assert cache.lookup("rag question", "g1")[1] == "exact"
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    store(cache, "first")
+    store(cache, "second")
+    cache.lookup("first", "g1")
+    store(cache, "third")
+    assert cache.lookup("second", "g1") == (None, None)
+    assert cache.lookup("first", "g1")[1] == "exact"
+    assert cache.lookup("third", "g1")[1] == "exact"
+
+class TableEmbeddings:
+    """Embeds queries to fixed vectors and counts the calls."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return self.vectors[text]
+
+def test_exact_hit_does_not_embed_the_query():
+    embeddings = TableEmbeddings({"save money": [1.0, 0.0]})
+    cache = QueryCache(embeddings=embeddings, semantic=True)
+    store(cache, "save money")
+    assert cache.lookup("Save money?", "g1")[1] == "exact"
+    assert embeddings.calls == ["save money"]  # Only the store embedded it
+
+def test_expired_best_match_does_not_hide_a_live_one():
+    embeddings = TableEmbeddings({"old": [1.0, 0.0], "live": [0.99, 0.141], "query": [1.0, 0.01]})
+    cache = QueryCache(embeddings=embeddings, semantic=True, similarity=0.95, ttl=3600, web_ttl=0.05)
+    store(cache, "old", manager_json={"RAG_needed": "no", "websearch_needed": "yes"}, answer="stale")
+    store(cache, "live", answer="fresh")
+    time.sleep(0.1)
+    entry, tier = cache.lookup("query", "g1")
+    assert tier == "semantic" and entry.advisor_response == "fresh"
+
+@pytest.mark.parametrize("manager_json, status, cacheable", [
+    (RAG_ONLY, {"rag": "ok", "websearch": "skipped"}, True),
+    (GENERAL, {"rag": "skipped", "websearch": "skipped"}, True),
+    (RAG_ONLY, {"rag": "timeout", "websearch": "skipped"}, False),
+    ({"RAG_needed": "yes", "websearch_needed": "yes"}, {"rag": "ok", "websearch": "error"}, False),
+    # Asked for web search but SERPAPI_API_KEY is not set: the branch never ran
+    ({"RAG_needed": "no", "websearch_needed": "yes"}, {"rag": "skipped", "websearch": "skipped"}, False),
+])
+def test_only_answers_with_every_requested_branch_ok_are_cacheable(advisor, manager_json, status, cacheable):
+    assert advisor.is_cacheable(manager_json, status) is cacheable
+
+def test_answer_after_failed_web_search_is_not_cached(advisor, client, user_with_documents, recording_model,
+                                                       monkeypatch, closed_port_url):
+    monkeypatch.setattr(advisor, "SERPAPI_URL", closed_port_url)
+    first, second = post_twice(client, user_with_documents, REALTIME_QUERY)
+    assert first.get_json()["retrieval_status"]["websearch"] == "error"
+    assert first.headers["X-Cache"] == second.headers["X-Cache"] == "MISS"
+    assert second.get_json()["retrieval_status"]["websearch"] == "error"
+    assert len(recording_model.prompts) == 2  # The advisor ran again for the repeat
+
+def test_answer_with_every_branch_ok_is_cached(advisor, client, user_with_documents, recording_model, monkeypatch):
+    from benchmarks.fakes import FakeSearchServer
+
+    server = FakeSearchServer(latency="fixed:0")
+    monkeypatch.setattr(advisor, "SERPAPI_URL", server.start())
+    try:
+        first, second = post_twice(client, user_with_documents, REALTIME_QUERY)
+    finally:
+        server.stop()
+    assert first.get_json()["retrieval_status"] == {"rag": "ok", "websearch": "ok"}
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert second.get_json()["advisor_response"] == first.get_json()["advisor_response"]
+    assert len(recording_model.prompts) == 1 and server.requests == 1
+
+def test_rag_only_answer_is_cached(client, user_with_documents):
+    first, second = post_twice(client, user_with_documents, RAG_QUERY)
+    assert first.get_json()["retrieval_status"] == {"rag": "ok", "websearch": "skipped"}
+    assert second.headers["X-Cache"] == "HIT"
@@ -0,0 +1,51 @@
+import pytest
+from query_router import KeywordRouter, QueryRouter
+
+@pytest.fixture
+def router():
+    return QueryRouter([KeywordRouter()], mode="hybrid", min_confidence=0.8)
+
+@pytest.mark.parametrize("query", [
+    "What is inflation",
+    "Explain index funds?",
+    "What's a Roth?",
+    "Define APR",
+    "Compound interest?",
+    "Can I afford $1,200 rent?",
+])
+def test_short_finance_questions_use_rag(router, query):
+    decision = router.route(query)
+    assert decision is not None
+    assert decision.rag_needed
+
+@pytest.mark.parametrize("query", [
+    "Who are you?",
+    "What is a 529",
+    "Explain vesting",
+    "How does amortization work",
+])
+def test_short_questions_without_finance_terms_go_to_the_manager_llm(router, query):
+    assert router.route(query) is None
+
+@pytest.mark.parametrize("query", ["Is $500 enough?", "Can I spare $1,200?", "$40 a week"])
+def test_a_dollar_amount_alone_marks_a_finance_query(router, query):
+    decision = router.route(query)
+    assert decision is not None
+    assert decision.rag_needed
+
+@pytest.mark.parametrize("query", ["plan for college", "help me decide", "car or bike", "quit my job"])
+def test_short_requests_without_keywords_go_to_the_manager_llm(router, query):
+    assert router.route(query) is None
+
+@pytest.mark.parametrize("query", ["hello", "Thanks!", "got it", "sounds good", "Good night", "ok."])
+def test_small_talk_skips_retrieval(router, query):
+    decision = router.route(query)
+    assert decision is not None
+    assert not decision.rag_needed and not decision.websearch_needed
+
+def test_realtime_finance_query_needs_both_branches(router):
+    decision = router.route("What is the latest news on stock prices today?")
+    assert decision.rag_needed and decision.websearch_needed
+
+def test_llm_mode_never_routes_locally():
+    assert QueryRouter([KeywordRouter()], mode="llm").route("How should I budget?") is None
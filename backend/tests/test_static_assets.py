@@ -0,0 +1,102 @@
+import gzip
+import pytest
+import static_assets
+from static_assets import (IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, StaticAssets,
+                           accepted_encodings, etag_matches, load_brotli)
+
+INDEX_HTML = b"<!doctype html><div id=root></div>"
+BUNDLE = b"export const advice = 'Pay yourself first';\n" * 200
+STYLES = b"body { margin: 0 }\n" * 200
+PRECOMPRESSED = b"prebuilt gzip bytes"
+
+@pytest.fixture
+def frontend(advisor, tmp_path, monkeypatch):
+    """A small Vite-like build served by the app instead of the real dist/."""
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_bytes(INDEX_HTML)
+    (tmp_path / "favicon.ico").write_bytes(b"\x00\x01icon")
+    (tmp_path / "assets" / "index-3f9a1c2b.js").write_bytes(BUNDLE)
+    (tmp_path / "assets" / "styles-9c8b7a6d.css").write_bytes(STYLES)
+    (tmp_path / "assets" / "styles-9c8b7a6d.css.gz").write_bytes(PRECOMPRESSED)
+    assets = StaticAssets(str(tmp_path))
+    monkeypatch.setattr(advisor, "static_assets", assets)
+    return assets
+
+def test_accept_encoding_parsing():
+    assert accepted_encodings("gzip, br;q=0.5") == {"gzip", "br"}
+    assert accepted_encodings("gzip;q=0, br") == {"br"}
+    assert accepted_encodings("*, gzip;q=0") == {"*", "br"}
+    assert accepted_encodings(None) == set()
+
+def test_if_none_match_comparison():
+    assert etag_matches('"abc", W/"def"', '"def"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abc"', '"abcd"')
+    assert not etag_matches(None, '"abc"')
+
+def test_hashed_bundle_is_compressed_and_immutable(client, frontend):
+    response = client.get("/assets/index-3f9a1c2b.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.mimetype == "application/javascript"
+    assert gzip.decompress(response.data) == BUNDLE
+
+def test_identity_is_served_without_accept_encoding(client, frontend):
+    response = client.get("/assets/index-3f9a1c2b.js", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.data == BUNDLE
+
+@pytest.mark.skipif(load_brotli() is None, reason="brotli is not installed")
+def test_brotli_is_preferred_when_accepted(client, frontend):
+    import brotli
+
+    response = client.get("/assets/index-3f9a1c2b.js", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data) == BUNDLE
+
+def test_precompressed_sibling_is_used_as_is(client, frontend):
+    response = client.get("/assets/styles-9c8b7a6d.css", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.data == PRECOMPRESSED
+    assert "assets/styles-9c8b7a6d.css.gz" not in frontend.load()
+
+def test_each_encoding_revalidates_with_its_own_etag(client, frontend):
+    gzipped = client.get("/assets/index-3f9a1c2b.js", headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/assets/index-3f9a1c2b.js")
+    assert gzipped.headers["ETag"] != plain.headers["ETag"]
+    response = client.get("/assets/index-3f9a1c2b.js", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]})
+    assert response.status_code == 304 and response.data == b""
+    assert response.headers["ETag"] == gzipped.headers["ETag"]
+    stale = client.get("/assets/index-3f9a1c2b.js", headers={"If-None-Match": gzipped.headers["ETag"]})
+    assert stale.status_code == 200
+
+def test_index_is_revalidated_and_serves_client_routes(client, frontend):
+    for path in ("/", "/dashboard/settings"):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.data == INDEX_HTML
+        assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    assert client.get("/favicon.ico").data == b"\x00\x01icon"
+
+def test_missing_asset_is_a_404(client, frontend):
+    response = client.get("/assets/missing-12345678.js")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "File not found"}
+
+def test_missing_build_is_a_404(client, advisor, tmp_path, monkeypatch):
+    monkeypatch.setattr(advisor, "static_assets", StaticAssets(str(tmp_path / "dist")))
+    assert client.get("/").status_code == 404
+
+def test_large_files_stay_on_disk_with_an_etag(client, frontend, monkeypatch):
+    monkeypatch.setattr(static_assets, "STATIC_MEMORY_MAX_BYTES", 1024)
+    response = client.get("/assets/index-3f9a1c2b.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.get_data() == BUNDLE
+    revalidated = client.get("/assets/index-3f9a1c2b.js", headers={"If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert frontend.stats()["on_disk"] == 2  # The bundle and the stylesheet
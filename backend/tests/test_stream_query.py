@@ -0,0 +1,57 @@
+import json
+import threading
+import pytest
+
+REALTIME_QUERY = "What is the latest news on stock prices today?"
+
+def read_events(response):
+    """Yield (event, data) pairs from an SSE response body as they arrive."""
+    buffer = ""
+    for chunk in response.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            block, buffer = buffer.split("\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in block.splitlines())
+            yield fields["event"], json.loads(fields["data"])
+
+@pytest.fixture
+def search_server(advisor, monkeypatch):
+    from benchmarks.fakes import FakeSearchServer
+
+    server = FakeSearchServer(latency="fixed:0")
+    monkeypatch.setattr(advisor, "SERPAPI_URL", server.start())
+    yield server
+    server.stop()
+
+def test_manager_and_web_links_are_sent_before_slow_rag_finishes(advisor, client, user_with_documents,
+                                                                  search_server, monkeypatch):
+    release_rag = threading.Event()
+    retrieve_documents = advisor.retrieve_documents
+
+    def slow_retrieve(*args):
+        assert release_rag.wait(10)
+        return retrieve_documents(*args)
+
+    monkeypatch.setattr(advisor, "retrieve_documents", slow_retrieve)
+    response = client.post("/query/stream", json={"query": REALTIME_QUERY},
+                           headers={"X-User-Id": user_with_documents})
+    events = read_events(response)
+    try:
+        assert next(events)[0] == "routing"
+        event, manager = next(events)
+        assert event == "manager" and manager["RAG_needed"] == manager["websearch_needed"] == "yes"
+        event, links = next(events)
+        assert event == "web_links" and links["web_links"]
+        assert links["retrieval_status"] == {"rag": "pending", "websearch": "ok"}
+    finally:
+        release_rag.set()
+    rest = [event for event, _ in events]
+    assert rest[0] == "token" and rest[-1] == "done"
+    response.close()
+
+def test_web_links_follow_retrieval_when_no_search_runs(client, user_with_documents):
+    response = client.post("/query/stream", json={"query": "How should I budget my monthly income?"},
+                           headers={"X-User-Id": user_with_documents})
+    events = dict(read_events(response))
+    assert events["web_links"] == {"web_links": "", "retrieval_status": {"rag": "ok", "websearch": "skipped"}}
+    assert "done" in events
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+import pytest
+import vector_store
+from benchmarks.fakes import FakeEmbeddings
+from tenants import InvalidUserId, TenantRegistry, normalize_user_id
+
+NOT_INITIALIZED = 'The knowledge base is not yet initialized. Please upload a document first.'
+
+def registry(tmp_path, **kwargs):
+    return TenantRegistry(FakeEmbeddings(), str(tmp_path / "Doc"), str(tmp_path / "chroma"), **kwargs)
+
+def test_user_ids_are_validated():
+    assert normalize_user_id(" alice@example.com ") == "alice@example.com"
+    assert normalize_user_id("") is None
+    for value in ("../etc", "a/b", "-leading-dash", "x" * 65):
+        with pytest.raises(InvalidUserId):
+            normalize_user_id(value)
+
+@pytest.mark.parametrize("backend", ["numpy", "chroma"])
+def test_first_query_from_an_unknown_user_creates_nothing(advisor, client, user_id, monkeypatch, backend):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE", backend)
+    response = client.post("/query", json={"query": "How should I budget?"}, headers={"X-User-Id": user_id})
+    assert response.status_code == 200
+    assert response.get_json() == {"advisor_response": NOT_INITIALIZED}
+    upload_folder, chroma_path = advisor.tenants.paths(user_id)
+    assert not os.path.exists(os.path.dirname(chroma_path))
+    assert not os.path.exists(upload_folder)
+
+def test_store_opens_once_ingestion_has_created_it(advisor, user_id):
+    from benchmarks.corpus import generate_corpus
+    from creat_vec_database import NullProgress
+
+    with advisor.tenants.use(user_id) as kb:
+        assert kb.get_db() is None
+        assert not kb.db_opened
+        generate_corpus(kb.upload_folder, 2, paragraphs=(2, 3), seed=2)
+        advisor.ingest_documents(NullProgress(), user_id)
+        assert kb.get_db() is not None and kb.get_db().count() > 0
+
+def test_least_recently_used_tenant_is_closed_past_max_open(tmp_path):
+    tenants = registry(tmp_path, max_open=2)
+    for user_id in ("a", "b", "a", "c"):
+        tenants.release(tenants.acquire(user_id))
+    assert [tenant.user_id for tenant in tenants.open_tenants()] == [None, "a", "c"]
+    assert tenants.stats()["evictions"] == 1
+
+def test_tenants_in_use_are_not_closed(tmp_path):
+    tenants = registry(tmp_path, max_open=1)
+    held = tenants.acquire("held")
+    tenants.release(tenants.acquire("other"))
+    # "other" is closed to get back under the cap; "held" was older but still in use
+    assert [tenant.user_id for tenant in tenants.open_tenants()] == [None, "held"]
+    tenants.release(held)
+    assert [tenant.user_id for tenant in tenants.open_tenants()] == [None, "held"]
+
+def test_idle_tenants_are_closed(tmp_path):
+    tenants = registry(tmp_path, idle_seconds=0)
+    tenants.release(tenants.acquire("idle"))
+    tenants.release(tenants.acquire("next"))
+    assert [tenant.user_id for tenant in tenants.open_tenants()] == [None]
+
+def test_idle_tenants_are_closed_without_further_requests(tmp_path):
+    tenants = registry(tmp_path, idle_seconds=0.05, sweep_seconds=0.05)
+    tenants.release(tenants.acquire("idle"))
+    deadline = time.monotonic() + 5
+    while len(tenants.open_tenants()) > 1 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert [tenant.user_id for tenant in tenants.open_tenants()] == [None]
+
+def test_evicted_tenant_is_not_reopened_while_it_is_closing(tmp_path):
+    tenants = registry(tmp_path, max_open=1)
+    evicted = tenants.acquire("a")
+    closing, finish_close = threading.Event(), threading.Event()
+    close = evicted.close
+
+    def slow_close():
+        closing.set()
+        assert finish_close.wait(5)
+        close()
+
+    evicted.close = slow_close
+    tenants.release(evicted)
+    evictor = threading.Thread(target=lambda: tenants.release(tenants.acquire("b")))
+    evictor.start()
+    assert closing.wait(5)
+    reopened = []
+    reopener = threading.Thread(target=lambda: reopened.append(tenants.acquire("a")))
+    reopener.start()
+    reopener.join(0.2)
+    assert not reopened  # Waits for the close of the same store to finish
+    finish_close.set()
+    evictor.join(5)
+    reopener.join(5)
+    assert reopened and reopened[0] is not evicted
+    assert reopened[0].chroma_path == evicted.chroma_path
+
+def test_query_cache_stats_cover_every_open_knowledge_base(advisor, client, user_with_documents):
+    for _ in range(2):
+        client.post("/query", json={"query": "How should I budget my income?"},
+                    headers={"X-User-Id": user_with_documents})
+    totals = advisor.tenants.query_cache_stats()
+    assert totals["knowledge_bases"] == len(advisor.tenants.open_tenants())
+    assert totals["entries"] >= 1 and totals["hits_exact"] >= 1
+    assert client.get("/stats").get_json()["query_cache"]["knowledge_bases"] == totals["knowledge_bases"]
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from upstream import AsyncUpstreamGate, SlotPool, UpstreamBusy, UpstreamGate, is_retryable, status_code_of
+
+class UpstreamError(Exception):
+    """Shaped like a google.api_core error: the HTTP status is .code."""
+
+    def __init__(self, code):
+        super().__init__(f"upstream returned {code}")
+        self.code = code
+
+class Flaky:
+    """Fails with the given status codes in turn, then returns "ok"."""
+
+    def __init__(self, *codes):
+        self.codes = list(codes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.codes:
+            raise UpstreamError(self.codes.pop(0))
+        return "ok"
+
+class Tracker:
+    """Sleeps for a while and records the highest number of overlapping calls."""
+
+    def __init__(self, duration=0.05):
+        self.duration = duration
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, value=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.duration)
+        with self._lock:
+            self.active -= 1
+        return value
+
+def gate(**kwargs):
+    options = dict(max_concurrency=2, max_queue=100, queue_timeout=5, base_delay=0, max_delay=0)
+    options.update(kwargs)
+    return UpstreamGate("test", **options)
+
+def test_status_code_comes_from_the_response_or_the_error():
+    class Response:
+        status_code = 503
+
+    class HTTPError(Exception):
+        response = Response()
+
+    assert status_code_of(HTTPError()) == 503
+    assert status_code_of(UpstreamError(429)) == 429
+    assert status_code_of(ValueError()) is None
+    assert is_retryable(UpstreamError(500)) and is_retryable(UpstreamError(429))
+    assert not is_retryable(UpstreamError(400)) and not is_retryable(ValueError())
+
+def test_identical_calls_in_flight_share_one_upstream_request():
+    upstream_gate, fn = gate(), Tracker(duration=0.2)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: upstream_gate.call(fn, "answer", key="same prompt"), range(8)))
+    assert results == ["answer"] * 8
+    assert fn.calls == 1
+    assert upstream_gate.stats()["coalesced"] == 7
+
+def test_shared_call_failure_reaches_every_waiter():
+    upstream_gate = gate()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise UpstreamError(400)
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(upstream_gate.call, fail, key="k")
+        started.wait()
+        followers = [pool.submit(upstream_gate.call, fail, key="k") for _ in range(3)]
+        for future in [leader] + followers:
+            with pytest.raises(UpstreamError):
+                future.result()
+    assert upstream_gate.stats()["failures"] == 1
+
+def test_concurrent_calls_never_exceed_the_limit():
+    upstream_gate, fn = gate(max_concurrency=2), Tracker()
+    with ThreadPoolExecutor(10) as pool:
+        list(pool.map(lambda i: upstream_gate.call(fn, i), range(10)))
+    assert fn.calls == 10
+    assert fn.peak == 2
+    assert upstream_gate.stats()["in_flight"] == 0
+
+def test_full_queue_rejects_with_upstream_busy():
+    upstream_gate = gate(max_concurrency=1, max_queue=1)
+    release = threading.Event()
+    with ThreadPoolExecutor(3) as pool:
+        holder = pool.submit(upstream_gate.call, release.wait)
+        while upstream_gate.stats()["in_flight"] == 0:
+            time.sleep(0.01)
+        queued = pool.submit(upstream_gate.call, lambda: "queued")
+        while upstream_gate.stats()["queue_depth"] == 0:
+            time.sleep(0.01)
+        with pytest.raises(UpstreamBusy):
+            upstream_gate.call(lambda: "rejected")
+        release.set()
+        assert holder.result() is True and queued.result() == "queued"
+    assert upstream_gate.stats()["rejected"] == 1
+
+def test_slot_wait_times_out_with_upstream_busy():
+    upstream_gate = gate(max_concurrency=1, queue_timeout=0.1)
+    with upstream_gate.slot():
+        with pytest.raises(UpstreamBusy):
+            upstream_gate.call(lambda: "late")
+
+@pytest.mark.parametrize("code", [429, 500, 503])
+def test_rate_limits_and_server_errors_are_retried(code):
+    upstream_gate, fn = gate(max_retries=3), Flaky(code, code)
+    assert upstream_gate.call(fn) == "ok"
+    assert fn.calls == 3
+    assert upstream_gate.stats()["retries"] == 2
+
+def test_client_errors_are_not_retried():
+    upstream_gate, fn = gate(max_retries=3), Flaky(401)
+    with pytest.raises(UpstreamError):
+        upstream_gate.call(fn)
+    assert fn.calls == 1
+    assert upstream_gate.stats()["failures"] == 1
+
+def test_retries_stop_after_max_retries():
+    upstream_gate, fn = gate(max_retries=2), Flaky(503, 503, 503, 503)
+    with pytest.raises(UpstreamError):
+        upstream_gate.call(fn)
+    assert fn.calls == 3
+
+class AsyncTracker(Tracker):
+    async def __call__(self, value=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.duration)
+        with self._lock:
+            self.active -= 1
+        return value
+
+def test_async_gate_caps_concurrency_and_shares_flights():
+    async_gate, fn = AsyncUpstreamGate("test-async", max_concurrency=2, max_queue=100), AsyncTracker()
+
+    async def run():
+        distinct = [async_gate.call(fn, i) for i in range(6)]
+        shared = [async_gate.call(fn, "same", key="k") for _ in range(4)]
+        return await asyncio.gather(*distinct, *shared)
+
+    assert asyncio.run(run()) == list(range(6)) + ["same"] * 4
+    assert fn.calls == 7 and fn.peak == 2
+
+def test_sync_and_async_gates_sharing_slots_stay_within_one_limit():
+    sync_gate = gate(max_concurrency=2)
+    async_gate = AsyncUpstreamGate("test-async", max_concurrency=2, max_queue=100, slots=sync_gate.slots)
+    shared = Tracker(duration=0.05)
+
+    async def blocking_in_loop(value):
+        # Counted by the same tracker as the threads; the sleep yields to the loop
+        with shared._lock:
+            shared.calls += 1
+            shared.active += 1
+            shared.peak = max(shared.peak, shared.active)
+        await asyncio.sleep(shared.duration)
+        with shared._lock:
+            shared.active -= 1
+        return value
+
+    async def run_async():
+        return await asyncio.gather(*(async_gate.call(blocking_in_loop, i) for i in range(8)))
+
+    with ThreadPoolExecutor(8) as pool:
+        threaded = [pool.submit(sync_gate.call, shared, i) for i in range(8)]
+        assert asyncio.run(run_async()) == list(range(8))
+        assert [future.result() for future in threaded] == list(range(8))
+    assert shared.calls == 16
+    assert shared.peak == 2
+    assert sync_gate.slots._free == 2
+
+def test_async_slot_wait_times_out_with_upstream_busy():
+    slots = SlotPool(1)
+    async_gate = AsyncUpstreamGate("test-async", max_concurrency=1, max_queue=10, queue_timeout=0.05, slots=slots)
+
+    async def run():
+        with pytest.raises(UpstreamBusy):
+            await async_gate.call(AsyncTracker())
+
+    assert slots.acquire(timeout=0)
+    asyncio.run(run())
+    slots.release()
+    assert slots.acquire(timeout=0)
+    assert async_gate.stats()["queue_depth"] == 0
+
+@pytest.mark.parametrize("release_first", [False, True])
+def test_cancelled_async_waiter_does_not_keep_a_slot(release_first):
+    slots = SlotPool(1)
+    async_gate = AsyncUpstreamGate("test-async", max_concurrency=1, max_queue=10, slots=slots)
+
+    async def run():
+        waiter = asyncio.ensure_future(async_gate.call(AsyncTracker(duration=0), "late"))
+        await asyncio.sleep(0.01)
+        if release_first:
+            slots.release()  # Granted to the waiter just before it is cancelled
+        waiter.cancel()
+        if not release_first:
+            slots.release()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    assert slots.acquire(timeout=0)
+    asyncio.run(run())
+    assert slots.acquire(timeout=0)
+    assert slots._free == 0 and not slots._waiters
+    assert async_gate.stats()["queue_depth"] == 0
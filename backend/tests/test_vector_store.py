@@ -0,0 +1,155 @@
+import shutil
+import numpy as np
+import pytest
+from benchmarks.fakes import FakeEmbeddings
+from vector_store import ChromaStore, NumpyVectorStore, normalize_rows, open_vector_store
+
+def unit_vectors(count, dimension=16, seed=0):
+    return normalize_rows(np.random.default_rng(seed).normal(size=(count, dimension)).astype(np.float32))
+
+def fill(store, vectors):
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    store.upsert(ids, vectors.tolist(), [f"text {i}" for i in range(len(vectors))],
+                 [{"row": i} for i in range(len(vectors))])
+    store.persist()
+
+def numpy_store(path):
+    return NumpyVectorStore(str(path), FakeEmbeddings(dimension=16))
+
+def test_numpy_relevance_matches_chroma(tmp_path):
+    vectors = unit_vectors(20)
+    # Queries from near-duplicates to unrelated vectors, so the scores span the whole range
+    noise = unit_vectors(len(vectors), seed=1)
+    queries = normalize_rows(np.concatenate([vectors[:5] + 0.1 * noise[:5], vectors[5:10] + noise[5:10],
+                                             unit_vectors(5, seed=2)]))
+    chroma = ChromaStore(str(tmp_path / "chroma"), FakeEmbeddings(dimension=16))
+    numpy = numpy_store(tmp_path / "numpy")
+    try:
+        fill(chroma, vectors)
+        fill(numpy, vectors)
+        expected = chroma.similarity_search_by_vectors_with_relevance_scores(queries.tolist(), k=5)
+        actual = numpy.similarity_search_by_vectors_with_relevance_scores(queries.tolist(), k=5)
+    finally:
+        chroma.close()
+    for chroma_results, numpy_results in zip(expected, actual):
+        assert [doc.page_content for doc, _ in numpy_results] == [doc.page_content for doc, _ in chroma_results]
+        assert [score for _, score in numpy_results] == pytest.approx(
+            [score for _, score in chroma_results], abs=1e-4)
+
+def test_reader_of_the_previous_state_can_still_load_it(tmp_path):
+    writer = numpy_store(tmp_path)
+    fill(writer, unit_vectors(4))
+    # A reader in another process read this state file just before the next persist
+    stale_state = tmp_path / "stale_state.json"
+    shutil.copy(writer.state_path, stale_state)
+    reader = numpy_store(tmp_path)
+    reader.state_path = str(stale_state)
+
+    fill(writer, unit_vectors(6, seed=1))
+    assert len(reader._load()) == 4
+    assert len(numpy_store(tmp_path)._load()) == 6
+
+    fill(writer, unit_vectors(8, seed=2))
+    with pytest.raises(FileNotFoundError):
+        reader._load()  # Two generations back is gone
+    assert len(list(tmp_path.glob("records-*.pkl"))) == 2
+
+def test_persist_makes_writes_visible_to_other_readers(tmp_path):
+    writer, reader = numpy_store(tmp_path), numpy_store(tmp_path)
+    vectors = unit_vectors(5)
+    assert reader.count() == 0
+    fill(writer, vectors)
+    results = reader.similarity_search_by_vectors_with_relevance_scores(vectors[:1].tolist(), k=1)
+    assert results[0][0][0].page_content == "text 0"
+    assert results[0][0][1] == pytest.approx(1.0, abs=1e-5)
+    writer.delete(["chunk-0"])
+    writer.persist()
+    assert reader.count() == 4
+
+def test_rows_added_over_many_batches_are_all_published(tmp_path):
+    store, vectors = numpy_store(tmp_path), unit_vectors(200)
+    for start in range(0, len(vectors), 64):
+        batch = range(start, min(start + 64, len(vectors)))
+        store.upsert([f"chunk-{i}" for i in batch], vectors[list(batch)].tolist(),
+                     [f"text {i}" for i in batch], [{"row": i} for i in batch])
+    # Rewrite a row from an earlier batch before anything is published
+    store.upsert(["chunk-3"], vectors[7:8].tolist(), ["rewritten"], [{"row": 3}])
+    store.delete(["chunk-5"])
+    store.persist()
+    reader = numpy_store(tmp_path)
+    assert reader.count() == 199
+    best = reader.similarity_search_by_vectors_with_relevance_scores(vectors[7:8].tolist(), k=2)[0]
+    assert sorted(doc.page_content for doc, _ in best) == ["rewritten", "text 7"]
+
+class FailingEmbeddings(FakeEmbeddings):
+    """Embeds the first batches, then fails like an unreachable embedding service."""
+
+    def __init__(self, batches):
+        super().__init__(dimension=16)
+        self.batches = batches
+
+    def embed_documents(self, texts):
+        if self.batches == 0:
+            raise RuntimeError("embedding service went away")
+        self.batches -= 1
+        return super().embed_documents(texts)
+
+def open_store(path, backend, embeddings=None):
+    return open_vector_store(str(path), embeddings or FakeEmbeddings(dimension=16), backend=backend)
+
+@pytest.mark.parametrize("backend", ["numpy", "chroma"])
+def test_failed_sync_never_publishes_its_partial_writes(tmp_path, monkeypatch, backend):
+    import creat_vec_database
+    from benchmarks.corpus import generate_corpus
+    from creat_vec_database import load_manifest, manifest_path_for, sync_vec_db
+
+    monkeypatch.setattr(creat_vec_database, "EMBED_BATCH_SIZE", 2)
+    data_path, store_path = str(tmp_path / "Doc"), str(tmp_path / "store")
+    generate_corpus(data_path, 1, paragraphs=(2, 3), seed=1)
+    sync_vec_db(open_store(store_path, backend), data_path, store_path)
+    reader = open_store(store_path, backend)
+    published = set(reader.get()["ids"])
+
+    generate_corpus(data_path, 3, paragraphs=(4, 6), seed=2)
+    failing = open_store(store_path, backend, FailingEmbeddings(batches=1))
+    with pytest.raises(RuntimeError):
+        sync_vec_db(failing, data_path, store_path)
+    assert set(reader.get()["ids"]) == published  # Readers never saw the partial sync
+    # Another worker syncs the same files meanwhile, then the failed handle persists
+    sync_vec_db(open_store(store_path, backend), data_path, store_path)
+    failing.persist()
+
+    manifest = load_manifest(manifest_path_for(store_path))
+    ingested = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]}
+    assert set(reader.get()["ids"]) == ingested
+    assert len(manifest["files"]) == 3
+
+def test_chroma_readers_see_writes_only_once_persisted(tmp_path):
+    writer, reader = open_store(tmp_path, "chroma"), open_store(tmp_path, "chroma")
+    vectors = unit_vectors(8)
+    fill(writer, vectors[:5])
+    assert reader.count() == 5
+
+    writer.upsert(["chunk-5", "chunk-6"], vectors[5:7].tolist(), ["text 5", "text 6"], [{"row": 5}, {"row": 6}])
+    writer.delete(["chunk-0"])
+    assert writer.count() == 6  # The writer sees its own pending writes
+    assert reader.count() == 5
+    best = reader.similarity_search_by_vectors_with_relevance_scores(vectors[5:6].tolist(), k=1)[0]
+    assert best[0][0].page_content != "text 5"
+
+    writer.persist()
+    assert reader.count() == 6
+    best = reader.similarity_search_by_vectors_with_relevance_scores(vectors[5:6].tolist(), k=1)[0]
+    assert best[0][0].page_content == "text 5"
+
+def test_chroma_keeps_only_the_published_and_previous_collections(tmp_path):
+    store = open_store(tmp_path, "chroma")
+    for seed in range(3):
+        fill(store, unit_vectors(3, seed=seed))
+    store.upsert(["orphan"], unit_vectors(1).tolist(), ["orphan"], [{"row": 0}])
+    store.discard()
+    store.persist()  # Nothing pending after discard()
+    names = {getattr(collection, "name", collection) for collection in store._client.list_collections()}
+    published = store._published()
+    assert names == {published["collection"], published["previous"]}
+    assert "orphan" not in store.get()["ids"]
@@ -0,0 +1,62 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+REALTIME_QUERY = "What is the latest news on stock prices today?"
+SERPAPI_KEY = "test-serpapi-key"
+
+@pytest.fixture
+def unauthorized_url():
+    class Unauthorized(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'{"error": "Invalid API key."}'
+            self.send_response(401)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Unauthorized)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/search"
+    server.shutdown()
+
+def assert_search_failure_hidden(payload, prompts):
+    assert payload["retrieval_status"] == {"rag": "ok", "websearch": "error"}
+    assert payload["web_links"] == ""
+    assert "Web Search Results**: unavailable" in payload["manager_response"]["context"]
+    assert SERPAPI_KEY not in str(payload)
+    assert prompts and not any(SERPAPI_KEY in prompt for prompt in prompts)
+
+@pytest.mark.parametrize("failure", ["unreachable", "unauthorized"])
+def test_failed_web_search_is_an_error_branch(advisor, client, user_with_documents, recording_model,
+                                              monkeypatch, closed_port_url, unauthorized_url, failure):
+    monkeypatch.setattr(advisor, "SERPAPI_URL", closed_port_url if failure == "unreachable" else unauthorized_url)
+    response = client.post("/query", json={"query": REALTIME_QUERY}, headers={"X-User-Id": user_with_documents})
+    assert response.status_code == 200
+    assert_search_failure_hidden(response.get_json(), recording_model.prompts)
+
+def test_failed_web_search_is_an_error_branch_in_asgi_mode(advisor, user_with_documents, recording_model,
+                                                          monkeypatch, closed_port_url):
+    from starlette.testclient import TestClient
+    import asgi
+
+    monkeypatch.setattr(advisor, "SERPAPI_URL", closed_port_url)
+    with TestClient(asgi.app) as asgi_client:
+        response = asgi_client.post("/query", json={"query": REALTIME_QUERY}, headers={"X-User-Id": user_with_documents})
+    assert response.status_code == 200
+    assert_search_failure_hidden(response.json(), recording_model.prompts)
+
+def test_web_search_error_message_leaves_out_the_request_url(advisor, closed_port_url):
+    import requests
+
+    try:
+        requests.get(closed_port_url, params={"api_key": SERPAPI_KEY}, timeout=2)
+    except requests.RequestException as e:
+        assert SERPAPI_KEY in str(e)
+        assert SERPAPI_KEY not in str(advisor.web_search_error(e))
+    else:
+        pytest.fail("request to a closed port succeeded")
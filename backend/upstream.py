@@ -0,0 +1,347 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Upstream call layer for Gemini and SerpAPI.
+# Each backend gets an UpstreamGate that
+#   - merges identical in-flight calls into one upstream request (single flight),
+#   - caps concurrent upstream calls, queueing the rest up to a bound and
+#     rejecting with UpstreamBusy beyond it (backpressure),
+#   - retries 429 and 5xx failures with jittered exponential backoff,
+#   - keeps queue depth, wait time and retry counters for monitoring.
+# AsyncUpstreamGate does the same for coroutines on an event loop (asgi.py).
+# A sync and an async gate for the same backend can share one SlotPool, so
+# threads and coroutines together stay within a single concurrency limit.
+
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", 30))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", 3))
+
+class UpstreamBusy(Exception):
+    """Raised when a backend's queue is full or a slot does not free up in time."""
+
+def status_code_of(error):
+    """Best-effort HTTP status of an upstream error, or None."""
+    # requests.HTTPError carries the response
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    if isinstance(code, int):
+        return code
+    # google.api_core exceptions expose the HTTP status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    return None
+
+def is_retryable(error):
+    code = status_code_of(error)
+    return code is not None and (code == 429 or 500 <= code < 600)
+
+class _SlotWaiter:
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+class SlotPool:
+    """Concurrency slots shared by threads and event loops, granted first come, first served."""
+
+    def __init__(self, size):
+        self.size = size
+        self._free = size
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, wake):
+        """Take a free slot (None) or queue a waiter for one."""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return None
+            waiter = _SlotWaiter(wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _withdraw(self, waiter):
+        """Leave the queue; True if the slot was granted first (it is then held)."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+            return waiter.granted
+
+    def acquire(self, timeout=None):
+        """Block for a slot; False if none freed up within timeout seconds."""
+        event = threading.Event()
+        waiter = self._enqueue(event.set)
+        if waiter is None:
+            return True
+        event.wait(timeout)
+        return self._withdraw(waiter)
+
+    async def acquire_async(self, timeout=None):
+        """Wait for a slot without blocking the loop; False if none freed up within timeout seconds."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(True)
+
+        waiter = self._enqueue(lambda: loop.call_soon_threadsafe(resolve))
+        if waiter is None:
+            return True
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled: hand back a slot that was granted in the meantime
+            if self._withdraw(waiter):
+                self.release()
+            raise
+        return self._withdraw(waiter)
+
+    def release(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._free += 1
+                    return
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+            try:
+                waiter.wake()
+                return
+            except RuntimeError:
+                # The waiter's event loop is closed; give the slot to the next one
+                continue
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class UpstreamGate:
+    """Concurrency limit, bounded queue, retries and single flight for one backend."""
+
+    def __init__(self, name, max_concurrency, max_queue, queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+                 max_retries=UPSTREAM_MAX_RETRIES, base_delay=0.5, max_delay=8.0, slots=None):
+        self.name = name
+        # Passing another gate's slots shares its limit (max_concurrency is then ignored)
+        self.slots = slots or SlotPool(max_concurrency)
+        self.max_concurrency = self.slots.size
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._flights = {}
+        self._lock = threading.Lock()
+        # Counters
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.rejected = 0
+        self.failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.waits = 0
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the backend's concurrency slots for the duration of the block."""
+        with self._lock:
+            if self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise UpstreamBusy(f"{self.name} queue is full")
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.monotonic()
+        acquired = self.slots.acquire(timeout=self.queue_timeout)
+        waited = time.monotonic() - start
+        with self._lock:
+            self.queue_depth -= 1
+            self.waits += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            if not acquired:
+                self.rejected += 1
+            else:
+                self.in_flight += 1
+                self.calls += 1
+        if not acquired:
+            raise UpstreamBusy(f"{self.name} did not free a slot within {self.queue_timeout}s")
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def retrying(self, fn, *args, **kwargs):
+        """Call fn, retrying 429/5xx failures with full-jitter exponential backoff."""
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                with self._lock:
+                    self.retries += 1
+                attempt += 1
+                time.sleep(delay)
+
+    def call(self, fn, *args, key=None, **kwargs):
+        """Run fn(*args, **kwargs) through the gate.
+
+        Calls sharing a non-None key while one is in flight wait for that call
+        and receive its result (or exception) instead of calling upstream.
+        """
+        if key is None:
+            with self.slot():
+                return self.retrying(fn, *args, **kwargs)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            with self.slot():
+                flight.result = self.retrying(fn, *args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "failures": self.failures,
+                "wait_seconds_avg": round(self.wait_seconds_total / self.waits, 4) if self.waits else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 4),
+            }
+
+class _AsyncFlight:
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.result = None
+        self.error = None
+
+class AsyncUpstreamGate(UpstreamGate):
+    """UpstreamGate for coroutines: waiting for a slot, a backoff or a shared call yields to the loop.
+
+    Single flight is per event loop; the slots may be shared with an UpstreamGate.
+    """
+
+    @asynccontextmanager
+    async def slot(self):
+        with self._lock:
+            if self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise UpstreamBusy(f"{self.name} queue is full")
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.monotonic()
+        try:
+            acquired = await self.slots.acquire_async(self.queue_timeout)
+        except BaseException:
+            with self._lock:
+                self.queue_depth -= 1
+            raise
+        waited = time.monotonic() - start
+        with self._lock:
+            self.queue_depth -= 1
+            self.waits += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            if not acquired:
+                self.rejected += 1
+            else:
+                self.in_flight += 1
+                self.calls += 1
+        if not acquired:
+            raise UpstreamBusy(f"{self.name} did not free a slot within {self.queue_timeout}s")
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    async def retrying(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs), retrying 429/5xx failures with full-jitter exponential backoff."""
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                with self._lock:
+                    self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def call(self, fn, *args, key=None, **kwargs):
+        """Await fn(*args, **kwargs) through the gate; see UpstreamGate.call for key."""
+        if key is None:
+            async with self.slot():
+                return await self.retrying(fn, *args, **kwargs)
+
+        # Only the loop's thread touches the flights, so no await between lookup and insert
+        flight = self._flights.get(key)
+        if flight is not None:
+            with self._lock:
+                self.coalesced += 1
+            await flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        flight = self._flights[key] = _AsyncFlight()
+        try:
+            async with self.slot():
+                flight.result = await self.retrying(fn, *args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            # A cancelled leader (client gone) must not cancel the callers sharing its flight
+            flight.error = e if isinstance(e, Exception) else UpstreamBusy(f"{self.name} call was cancelled")
+            raise
+        finally:
+            del self._flights[key]
+            flight.done.set()
@@ -0,0 +1,475 @@
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from langchain_core.documents import Document
+
+# Vector store backends behind one small interface:
+#
+#   embeddings                                  the embedding function
+#   similarity_search(query, k)                 -> [Document]
+#   similarity_search_by_vector(vector, k)      -> [Document]
+#   similarity_search_with_relevance_scores(query, k) -> [(Document, score in [0, 1])]
+#   similarity_search_by_vectors_with_relevance_scores(vectors, k)
+#                                               -> one [(Document, score)] list per vector
+#   upsert(ids, embeddings, documents, metadatas)
+#   delete(ids)
+#   get(include)                                -> {"ids", "documents", "metadatas"}
+#   count()
+#   persist()                                   make pending writes visible to readers
+#   discard()                                   drop pending writes (a failed sync)
+#   close()                                     release what the open store holds in memory
+#
+# VECTOR_STORE selects "chroma" (default) or "numpy". The NumPy backend keeps
+# the vectors in one memory-mapped .npy matrix, so every gunicorn worker
+# shares the same pages through the OS page cache instead of loading its own
+# copy, and search is an exact dot product. VECTOR_STORE_QUANTIZE=int8 stores
+# one int8 byte per dimension plus a per-row scale (4x smaller, approximate).
+
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma").lower()
+VECTOR_STORE_QUANTIZE = os.environ.get("VECTOR_STORE_QUANTIZE", "none").lower()
+QUANTIZED_BLOCK_ROWS = 65536  # int8 rows dequantized per step during search
+QUERY_BLOCK_ROWS = 64  # Queries scored per matrix product in grouped searches
+
+def open_vector_store(persist_directory, embedding_function, backend=None, quantize=None):
+    """Open the configured vector store in persist_directory."""
+    backend = (backend or VECTOR_STORE).lower()
+    if backend == "chroma":
+        return ChromaStore(persist_directory, embedding_function)
+    if backend == "numpy":
+        return NumpyVectorStore(persist_directory, embedding_function, quantize=quantize or VECTOR_STORE_QUANTIZE)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+def store_exists(persist_directory, backend=None):
+    """Whether persist_directory already holds a store of the configured backend.
+
+    Opening a store creates it, so callers check this first when a missing
+    store should stay missing.
+    """
+    backend = (backend or VECTOR_STORE).lower()
+    marker = NumpyVectorStore.STATE_FILE if backend == "numpy" else ChromaStore.DATABASE_FILE
+    return os.path.exists(os.path.join(persist_directory, marker))
+
+class ChromaStore:
+    """LangChain Chroma collections behind the common interface.
+
+    Readers use the collection the pointer file names. The first write of a
+    sync copies it into a new staging collection, and every write goes
+    there; persist() points the pointer file at the staging collection, so
+    readers in every process switch to the finished sync at once and never
+    see one in progress. The copy costs one pass over the store per sync.
+    The previous collection is kept until the next persist for readers that
+    are still using it.
+    """
+
+    DATABASE_FILE = "chroma.sqlite3"
+    POINTER_FILE = "chroma_collection.json"
+    COLLECTION = "langchain"  # LangChain's default; stores from before staging use it
+    COPY_BATCH_ROWS = 5000
+
+    def __init__(self, persist_directory, embedding_function):
+        from langchain_community.vectorstores import Chroma  # chromadb takes about a second to import
+        self._chroma = Chroma
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.pointer_path = os.path.join(persist_directory, self.POINTER_FILE)
+        self._pointer_mtime = self._pointer_stat()
+        self.db = Chroma(persist_directory=persist_directory, embedding_function=embedding_function,
+                         collection_name=self._published()["collection"])
+        self._client = self.db._client
+        self._staging = None
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _open(self, name):
+        return self._chroma(client=self._client, collection_name=name, embedding_function=self.embedding_function)
+
+    def _pointer_stat(self):
+        try:
+            return os.stat(self.pointer_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _published(self):
+        """{"collection", "previous"} from the pointer file."""
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"collection": self.COLLECTION, "previous": None}
+
+    def _current(self):
+        """The published collection, reopened when another process has published a new one."""
+        mtime = self._pointer_stat()
+        if mtime != self._pointer_mtime:
+            with self._lock:
+                if mtime != self._pointer_mtime:
+                    self.db = self._open(self._published()["collection"])
+                    self._pointer_mtime = mtime
+        return self.db
+
+    def _writable(self):
+        """The staging collection, seeded with a copy of the published one on first use."""
+        if self._staging is None:
+            live = self._current()._collection
+            staging = self._open(f"{self.COLLECTION}-{time.time_ns():x}")
+            batch_rows = min(self.COPY_BATCH_ROWS, self._client.get_max_batch_size())
+            for offset in range(0, live.count(), batch_rows):
+                rows = live.get(include=["embeddings", "documents", "metadatas"], limit=batch_rows, offset=offset)
+                if rows["ids"]:
+                    staging._collection.add(ids=rows["ids"], embeddings=rows["embeddings"],
+                                            documents=rows["documents"], metadatas=rows["metadatas"])
+            self._staging = staging
+        return self._staging
+
+    def _readable(self):
+        # The writer sees its own pending writes, like the NumPy working copy
+        return self._staging if self._staging is not None else self._current()
+
+    def similarity_search(self, query, k=4):
+        return self._current().similarity_search(query, k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return self._current().similarity_search_by_vector(embedding, k=k)
+
+    def similarity_search_with_relevance_scores(self, query, k=4):
+        return self._current().similarity_search_with_relevance_scores(query, k=k)
+
+    def similarity_search_by_vectors_with_relevance_scores(self, embeddings, k=4):
+        if not embeddings:
+            return []
+        db = self._current()
+        # One collection query for the whole group; LangChain's wrapper only takes one vector
+        results = db._collection.query(
+            query_embeddings=list(embeddings), n_results=k, include=["documents", "metadatas", "distances"]
+        )
+        relevance = db._select_relevance_score_fn()
+        return [
+            [(Document(page_content=text, metadata=metadata or {}), relevance(distance))
+             for text, metadata, distance in zip(texts, metadatas, distances)]
+            for texts, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+        ]
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._writable()._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        if ids:
+            self._writable().delete(ids=ids)
+
+    def get(self, include=()):
+        return self._readable().get(include=list(include))
+
+    def count(self):
+        return self._readable()._collection.count()
+
+    def persist(self):
+        """Publish the staging collection; call under the ingestion lock."""
+        staging = self._staging
+        if staging is None:
+            return
+        previous = self._published()["collection"]
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = self.pointer_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"collection": staging._collection.name, "previous": previous}, f)
+        os.replace(tmp_path, self.pointer_path)
+        with self._lock:
+            self.db = staging
+            self._pointer_mtime = self._pointer_stat()
+        self._staging = None
+        self._drop_unpublished()
+
+    def discard(self):
+        """Drop the staging collection and leftovers of failed syncs; call under the ingestion lock."""
+        self._staging = None
+        self._drop_unpublished()
+
+    def _drop_unpublished(self):
+        published = self._published()
+        keep = {published["collection"], published.get("previous")}
+        for collection in self._client.list_collections():
+            name = getattr(collection, "name", collection)  # chromadb 0.6 lists names, 1.x Collection objects
+            if name not in keep and (name == self.COLLECTION or name.startswith(self.COLLECTION + "-")):
+                self._client.delete_collection(name)
+
+    def close(self):
+        # Chroma shares one client system per path; recent releases refcount it
+        # and stop it (freeing its indexes) when the last client closes
+        if hasattr(self._client, "close"):
+            self._client.close()
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def quantize_int8(matrix):
+    """Symmetric per-row int8 quantization; returns (int8 matrix, float32 scales)."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+class _Snapshot:
+    """One persisted generation of the NumPy store, read-only."""
+
+    def __init__(self, ids=(), documents=(), metadatas=(), matrix=None, scales=None):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.matrix = matrix
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, queries):
+        """(queries, rows) matrix of dot products for a matrix of query vectors."""
+        if self.scales is None:
+            return queries @ self.matrix.T
+        out = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), QUANTIZED_BLOCK_ROWS):
+            block = self.matrix[start:start + QUANTIZED_BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        return out * self.scales
+
+    def dense(self):
+        """The vectors as a float32 array (dequantized if needed)."""
+        if self.matrix is None:
+            return None
+        if self.scales is None:
+            return np.array(self.matrix, dtype=np.float32)
+        return self.matrix.astype(np.float32) * self.scales[:, None]
+
+class NumpyVectorStore:
+    """Memory-mapped float32 (or int8) matrix with exact cosine top-k.
+
+    Vectors are L2-normalized on write, so the dot product is the cosine
+    similarity. Writes go to an in-memory working copy; persist() writes a
+    new generation of files and atomically points the state file at it.
+    Readers in other processes notice the new state file on their next
+    search and map the new generation.
+    """
+
+    STATE_FILE = "numpy_store.json"
+
+    def __init__(self, persist_directory, embedding_function, quantize="none"):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.quantize = quantize
+        self.state_path = os.path.join(persist_directory, self.STATE_FILE)
+        self._snapshot = _Snapshot()
+        self._state_mtime = None
+        self._working = None
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _file(self, generation, name):
+        stem, ext = os.path.splitext(name)
+        return os.path.join(self.persist_directory, f"{stem}-{generation}{ext}")
+
+    def _load(self):
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        generation = state["generation"]
+        with open(self._file(generation, "records.pkl"), "rb") as f:
+            records = pickle.load(f)
+        matrix = scales = None
+        if state["count"]:
+            # mmap: pages are shared between processes and loaded on demand
+            matrix = np.load(self._file(generation, "vectors.npy"), mmap_mode="r")
+            if state["dtype"] == "int8":
+                scales = np.load(self._file(generation, "scales.npy"))
+        return _Snapshot(records["ids"], records["documents"], records["metadatas"], matrix, scales)
+
+    def _current(self):
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._state_mtime:
+            with self._lock:
+                if mtime != self._state_mtime:
+                    self._snapshot = self._load() if mtime is not None else _Snapshot()
+                    self._state_mtime = mtime
+        return self._snapshot
+
+    def _search(self, embedding, k):
+        return self._search_many([embedding], k)[0]
+
+    def _search_many(self, embeddings, k):
+        snapshot = self._current()
+        if not len(snapshot):
+            return [[] for _ in embeddings]
+        queries = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        results = []
+        for start in range(0, len(queries), QUERY_BLOCK_ROWS):
+            for scores in snapshot.scores(queries[start:start + QUERY_BLOCK_ROWS]):
+                results.append([
+                    (Document(page_content=snapshot.documents[i], metadata=dict(snapshot.metadatas[i])), float(scores[i]))
+                    for i in top_k(scores, k)
+                ])
+        return results
+
+    def similarity_search(self, query, k=4):
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return [doc for doc, _ in self._search(embedding, k)]
+
+    @staticmethod
+    def _relevance(results):
+        # The score ChromaStore gives the same vectors: Chroma's l2 space returns the
+        # squared distance (2 - 2 cos for unit vectors) and LangChain maps it to
+        # 1 - distance / sqrt(2), which goes below 0 for dissimilar vectors
+        return [(doc, 1.0 - max(0.0, 2.0 - 2.0 * score) / np.sqrt(2.0)) for doc, score in results]
+
+    def similarity_search_with_relevance_scores(self, query, k=4):
+        return self._relevance(self._search(self.embedding_function.embed_query(query), k))
+
+    def similarity_search_by_vectors_with_relevance_scores(self, embeddings, k=4):
+        if not len(embeddings):
+            return []
+        return [self._relevance(results) for results in self._search_many(embeddings, k)]
+
+    def _working_copy(self):
+        if self._working is None:
+            snapshot = self._current()
+            self._working = {
+                "ids": list(snapshot.ids),
+                "index": {chunk_id: row for row, chunk_id in enumerate(snapshot.ids)},
+                "documents": list(snapshot.documents),
+                "metadatas": list(snapshot.metadatas),
+                "matrix": snapshot.dense(),  # Rows of the generation it was copied from
+                "appended": [],  # Vectors of rows added since, stacked once in persist()
+                "deleted": set(),
+            }
+        return self._working
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        working = self._working_copy()
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        matrix, appended = working["matrix"], working["appended"]
+        base_rows = 0 if matrix is None else len(matrix)
+        for chunk_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+            row = working["index"].get(chunk_id)
+            if row is None:
+                working["index"][chunk_id] = len(working["ids"])
+                working["ids"].append(chunk_id)
+                working["documents"].append(document)
+                working["metadatas"].append(metadata or {})
+                appended.append(vector)
+            else:
+                working["documents"][row] = document
+                working["metadatas"][row] = metadata or {}
+                if row < base_rows:
+                    matrix[row] = vector
+                else:
+                    appended[row - base_rows] = vector
+
+    def delete(self, ids):
+        working = self._working_copy()
+        for chunk_id in ids:
+            row = working["index"].pop(chunk_id, None)
+            if row is not None:
+                working["deleted"].add(row)
+
+    def get(self, include=()):
+        if self._working is None:
+            snapshot = self._current()
+            ids, documents, metadatas = snapshot.ids, snapshot.documents, snapshot.metadatas
+        else:
+            working = self._working
+            rows = [row for row in range(len(working["ids"])) if row not in working["deleted"]]
+            ids = [working["ids"][row] for row in rows]
+            documents = [working["documents"][row] for row in rows]
+            metadatas = [working["metadatas"][row] for row in rows]
+        result = {"ids": list(ids)}
+        if "documents" in include:
+            result["documents"] = list(documents)
+        if "metadatas" in include:
+            result["metadatas"] = list(metadatas)
+        return result
+
+    def count(self):
+        if self._working is None:
+            return len(self._current())
+        return len(self._working["index"])
+
+    def discard(self):
+        """Drop unpublished writes; the next write starts from the current generation."""
+        self._working = None
+
+    def close(self):
+        """Unmap the current generation; the next search maps it again."""
+        with self._lock:
+            self._snapshot = _Snapshot()
+            self._state_mtime = None
+
+    def persist(self):
+        """Write the working copy as a new generation and switch readers to it."""
+        working = self._working
+        if working is None:
+            return
+        rows = [row for row in range(len(working["ids"])) if row not in working["deleted"]]
+        matrix = working["matrix"]
+        if working["appended"]:
+            appended = np.stack(working["appended"])
+            matrix = appended if matrix is None else np.concatenate([matrix, appended])
+        if matrix is not None:
+            matrix = matrix[rows]
+        os.makedirs(self.persist_directory, exist_ok=True)
+        generation = f"{time.time_ns():x}"
+        dtype = "int8" if self.quantize == "int8" else "float32"
+        if rows:
+            if dtype == "int8":
+                matrix, scales = quantize_int8(matrix)
+                np.save(self._file(generation, "scales.npy"), scales)
+            np.save(self._file(generation, "vectors.npy"), matrix)
+        with open(self._file(generation, "records.pkl"), "wb") as f:
+            pickle.dump({
+                "ids": [working["ids"][row] for row in rows],
+                "documents": [working["documents"][row] for row in rows],
+                "metadatas": [working["metadatas"][row] for row in rows],
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        previous = self._published_generation()
+        state = {"generation": generation, "count": len(rows), "dtype": dtype,
+                 "dimension": int(matrix.shape[1]) if rows else None}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+        self._working = None
+        # The previous generation stays on disk until the next persist: a reader
+        # in another process may have read the old state file and not yet
+        # opened its files. Mapped files stay readable after removal anyway.
+        keep = {generation, previous}
+        for name in os.listdir(self.persist_directory):
+            stem, _, suffix = os.path.splitext(name)[0].rpartition("-")
+            if stem in ("vectors", "scales", "records") and suffix not in keep:
+                os.remove(os.path.join(self.persist_directory, name))
+
+    def _published_generation(self):
+        """Generation the state file points at, or None."""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            return None
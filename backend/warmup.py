@@ -0,0 +1,73 @@
+import threading
+import time
+import traceback
+
+# Startup warm-up: the expensive parts of the app (Gemini client, embedding
+# model, vector store, routers) are created on first use, and this runs the
+# same initializers ahead of traffic, recording how long each one took.
+# /readyz reports the state; /healthz only says the process is up.
+
+class WarmUp:
+    """Ordered initialization steps with per-step status and timing."""
+
+    def __init__(self):
+        self.steps = []
+        self.state = {}
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name, fn, required=True):
+        """Register a step; failures of optional steps do not block readiness."""
+        self.steps.append((name, fn, required))
+        self.state[name] = {"status": "pending", "required": required}
+
+    def run(self):
+        self.started_at = time.time()
+        for name, fn, required in self.steps:
+            with self._lock:
+                self.state[name]["status"] = "running"
+            start = time.perf_counter()
+            try:
+                fn()
+                status, error = "ready", None
+            except Exception as e:
+                traceback.print_exc()
+                status, error = "failed", f"{type(e).__name__}: {e}"
+            with self._lock:
+                self.state[name].update(status=status, seconds=round(time.perf_counter() - start, 3))
+                if error:
+                    self.state[name]["error"] = error
+        self.finished_at = time.time()
+        summary = ", ".join(f"{name} {info['status']} in {info['seconds']}s" for name, info in self.state.items())
+        print(f"Warm-up finished in {self.finished_at - self.started_at:.2f}s: {summary}")
+
+    def start(self):
+        """Run the steps in a background thread."""
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def _ready(self):
+        return self.finished and all(
+            info["status"] == "ready" for info in self.state.values() if info["required"]
+        )
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self._ready()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "ready": self._ready(),
+                "finished": self.finished,
+                "seconds": round(self.finished_at - self.started_at, 3) if self.finished else None,
+                "steps": {name: dict(info) for name, info in self.state.items()},
+            }